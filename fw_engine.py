@@ -1,7 +1,10 @@
 import base64
+import bisect
+import hashlib
 import io
 import json
 import os
+import queue
 import re
 import shutil
 import subprocess
@@ -13,9 +16,11 @@ import traceback
 from collections import defaultdict
 from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
 from threading import Thread
-from typing import Iterable, List, Union, cast
+from typing import Iterable, List, Optional, Union, cast
 
+import numpy as np
 import stable_whisper
 import torch
 import torchaudio
@@ -23,10 +28,22 @@ import zhconv
 from faster_whisper import BatchedInferencePipeline, WhisperModel
 from faster_whisper.audio import decode_audio
 from faster_whisper.transcribe import Segment
+from faster_whisper.vad import VadOptions, get_speech_timestamps
 from pyannote.audio import Pipeline
 from pyannote.audio.pipelines.utils.hook import ProgressHook
+from pyannote.core import Annotation
+from pyannote.core import Segment as PyannoteSegment
+from pyannote.metrics.diarization import DiarizationErrorRate
+from scipy.cluster.hierarchy import fcluster, linkage
+from scipy.spatial.distance import pdist, squareform
 from tqdm import tqdm
 
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:
+    Observer = None
+
 
 class LockManager:
     def __init__(self) -> None:
@@ -41,6 +58,416 @@ class LockManager:
             yield
 
 
+def default_state_dir():
+    """本程序自己的状态目录：Windows下是%LOCALAPPDATA%\\fw_engine，其他系统是$XDG_STATE_HOME（默认~/.local/state）/fw_engine。"""
+    if sys.platform == "win32" and os.environ.get("LOCALAPPDATA"):
+        base = os.environ["LOCALAPPDATA"]
+    else:
+        base = os.environ.get("XDG_STATE_HOME") or os.path.join(os.path.expanduser("~"), ".local", "state")
+    return os.path.join(base, "fw_engine")
+
+
+class HotFolderIntake:
+    """
+    热文件夹收件：有watchdog时用文件系统事件（Linux下即inotify）得知新文件，否则退化为定时scandir轮询。
+    新文件要连续stable_seconds秒大小和修改时间都不变才交给处理，避免拿到还没拷完的文件；
+    处理过的(path, size, mtime_ns)追加写入state_path，重启后不会再逐个文件去检查字幕是否存在。
+    state_path默认放在本程序的状态目录（见default_state_dir），按监控文件夹区分，不往被监控的文件夹里写东西。
+    """
+
+    def __init__(self, folder, extensions, state_path=None, stable_seconds=10, poll_interval=5, check_interval=1) -> None:
+        self.folder = os.path.abspath(folder)
+        self.extensions = {i.lower() for i in extensions}
+        if state_path is None:
+            folder_key = hashlib.sha1(os.path.normcase(self.folder).encode("utf-8")).hexdigest()[:12]
+            state_path = os.path.join(default_state_dir(), f"processed_{folder_key}.jsonl")
+        self.state_path = state_path
+        self.stable_seconds = stable_seconds
+        self.poll_interval = poll_interval
+        self.check_interval = check_interval
+        self.processed = self._load_state()
+        self.candidates = {}  # path -> (size, mtime_ns, 最近一次变化的时间)
+        self.events = queue.Queue()
+        self.observer = None
+
+    def _load_state(self):
+        processed = set()
+        if os.path.exists(self.state_path):
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        processed.add((record["path"], record["size"], record["mtime_ns"]))
+                    except (json.JSONDecodeError, KeyError):
+                        continue
+        return processed
+
+    def _is_media(self, path):
+        return os.path.splitext(path)[-1].lower() in self.extensions
+
+    def _start_observer(self):
+        if Observer is None:
+            print(f"未安装watchdog，使用{self.poll_interval}秒一次的轮询监控：{self.folder}")
+            return
+        events = self.events
+
+        class _Handler(FileSystemEventHandler):
+            def on_any_event(self, event):
+                if not event.is_directory:
+                    events.put(getattr(event, "dest_path", None) or event.src_path)
+
+        self.observer = Observer()
+        self.observer.schedule(_Handler(), self.folder, recursive=False)
+        self.observer.daemon = True
+        self.observer.start()
+        print(f"使用文件系统事件监控：{self.folder}")
+
+    def _scan(self):
+        try:
+            with os.scandir(self.folder) as it:
+                for entry in it:
+                    if not (entry.is_file() and self._is_media(entry.name)):
+                        continue
+                    # DirEntry.stat在Windows上来自目录列表本身，不会额外访问文件
+                    st = entry.stat()
+                    if (entry.path, st.st_size, st.st_mtime_ns) not in self.processed:
+                        self.events.put(entry.path)
+        except OSError as e:
+            print(f"扫描文件夹失败：{self.folder}，原因为：{e}")
+
+    def _drain_events(self):
+        while True:
+            try:
+                path = self.events.get_nowait()
+            except queue.Empty:
+                return
+            if self._is_media(path) and path not in self.candidates:
+                self.candidates[path] = (-1, -1, time.monotonic())
+
+    def _pop_stable(self):
+        ready = []
+        now = time.monotonic()
+        for path, (size, mtime_ns, changed_at) in list(self.candidates.items()):
+            try:
+                st = os.stat(path)
+            except OSError:
+                del self.candidates[path]
+                continue
+            key = (path, st.st_size, st.st_mtime_ns)
+            if key in self.processed:
+                del self.candidates[path]
+            elif (st.st_size, st.st_mtime_ns) != (size, mtime_ns):
+                self.candidates[path] = (st.st_size, st.st_mtime_ns, now)
+            elif now - changed_at >= self.stable_seconds:
+                del self.candidates[path]
+                ready.append(path)
+        return sorted(ready)
+
+    def mark_processed(self, path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+        key = (path, st.st_size, st.st_mtime_ns)
+        if key in self.processed:
+            return
+        self.processed.add(key)
+        os.makedirs(os.path.dirname(os.path.abspath(self.state_path)), exist_ok=True)
+        with open(self.state_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps({"path": path, "size": st.st_size, "mtime_ns": st.st_mtime_ns}, ensure_ascii=False) + "\n")
+
+    def iter_ready(self):
+        self._start_observer()
+        self._scan()
+        last_scan = time.monotonic()
+        while True:
+            # 有事件监控时轮询只是兜底（网络盘等收不到事件的情况），间隔可以很长
+            if time.monotonic() - last_scan >= (self.poll_interval if self.observer is None else self.poll_interval * 10):
+                self._scan()
+                last_scan = time.monotonic()
+            self._drain_events()
+            for path in self._pop_stable():
+                yield path
+            time.sleep(self.check_interval)
+
+
+def peak_rss_mb():
+    try:
+        import resource
+
+        # Linux下ru_maxrss单位是KB，macOS是字节
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / 1024 / (1024 if sys.platform == "darwin" else 1), 1)
+    except ImportError:
+        pass
+    try:
+        import psutil
+
+        memory_info = psutil.Process().memory_info()
+        return round(getattr(memory_info, "peak_wset", memory_info.rss) / 1024 / 1024, 1)
+    except ImportError:
+        return None
+
+
+@dataclass
+class RunMetrics:
+    """单个文件一次转写的分阶段耗时（秒），以JSON行追加到metrics文件。"""
+
+    media_path: str
+    audio_duration: float = 0.0
+    model_load_time: float = 0.0
+    language_detect_time: float = 0.0
+    decode_time: float = 0.0
+    inference_time: float = 0.0
+    alignment_time: float = 0.0
+    diarization_time: float = 0.0
+    write_time: float = 0.0
+    total_time: float = 0.0
+    segment_count: int = 0
+    language: Optional[str] = None
+    peak_rss_mb: Optional[float] = None
+    started_at: float = field(default_factory=time.time)
+
+    @contextmanager
+    def stage(self, name):
+        b_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            setattr(self, name, getattr(self, name) + time.perf_counter() - b_time)
+
+    @property
+    def rtf(self):
+        return round(self.total_time / self.audio_duration, 4) if self.audio_duration else None
+
+    def to_dict(self):
+        data = asdict(self)
+        data["rtf"] = self.rtf
+        return data
+
+    def summary(self):
+        stages = ["language_detect", "decode", "inference", "alignment", "diarization", "write"]
+        return "，".join(f"{i}={getattr(self, i + '_time'):.1f}s" for i in stages) + f"，RTF={self.rtf}，峰值内存={self.peak_rss_mb}MB"
+
+
+class TranscribeProgress:
+    """
+    单个消费者线程刷新进度：转写循环只把segment结束时间放进队列，
+    消费者等一小会儿把同一批（chunk）的时间戳合并后再更新一次进度条。
+    """
+
+    def __init__(self, total_duration, set_delay=0.1) -> None:
+        self.total_duration = total_duration
+        self.set_delay = set_delay
+        self.timestamps = queue.Queue()
+        self.capture = io.StringIO()
+        td_len = str(len(str(total_duration)))
+        self.pbar = tqdm(
+            file=self.capture,
+            total=total_duration,
+            unit=" seconds",
+            smoothing=0.00001,
+            bar_format="{percentage:3.0f}% | {n_fmt:>" + td_len + "}/{total_fmt} | {elapsed}<<{remaining} | {rate_noinv_fmt}",
+        )
+        self.timestamp_prev = 0
+        self.consumer = Thread(target=self._consume, daemon=True)
+        self.consumer.start()
+
+    def update(self, timestamp):
+        self.timestamps.put(timestamp)
+
+    def _advance(self, timestamp):
+        if timestamp > self.timestamp_prev:
+            self.pbar.update(timestamp - self.timestamp_prev)
+            self.timestamp_prev = timestamp
+            print(self.capture.getvalue().splitlines()[-1])
+
+    def _consume(self):
+        while True:
+            timestamp = self.timestamps.get()
+            if timestamp is None:
+                return
+            time.sleep(self.set_delay)  # 等这一批segment都出来
+            while True:
+                try:
+                    latest = self.timestamps.get_nowait()
+                except queue.Empty:
+                    break
+                if latest is None:
+                    self._advance(timestamp)
+                    return
+                timestamp = latest
+            self._advance(timestamp)
+
+    def close(self):
+        self.timestamps.put(self.total_duration)
+        self.timestamps.put(None)
+        self.consumer.join()
+        self.pbar.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_unused_args):
+        self.close()
+
+
+class TranscribeCancelled(Exception):
+    pass
+
+
+def convert_to_srt_time_format(original_seconds):
+    hours = int(original_seconds // 3600)
+    minutes = int((original_seconds % 3600) // 60)
+    seconds = int(original_seconds % 60)
+    milliseconds = int((original_seconds % 1) * 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d},{milliseconds:03d}"
+
+
+def format_srt_block(counter, start_time, end_time, text):
+    return f"{counter}\n{convert_to_srt_time_format(start_time)} --> {convert_to_srt_time_format(end_time)}\n{text}\n\n"
+
+
+class StreamingResultWriter:
+    """
+    边转写边落盘：内容逐段追加到 xxx.ext.part 并立即flush，进程被杀时.part里是可用的部分结果；
+    finish()时fsync后原子改名为 xxx.ext。
+    """
+
+    ext = ""
+
+    def __init__(self, media_path) -> None:
+        self.file_path = os.path.splitext(os.path.basename(media_path))[0] + self.ext
+        self.part_path = self.file_path + ".part"
+        self.f = open(self.part_path, "w", encoding="utf-8")
+        self.count = 0
+        self.write_header()
+
+    def write_header(self):
+        pass
+
+    def write_footer(self, **extra):
+        pass
+
+    def write_segment(self, segment):
+        self.count += 1
+        self.f.write(self.format_segment(segment))
+        self.f.flush()
+
+    def format_segment(self, segment) -> str:
+        raise NotImplementedError
+
+    def rewrite(self, segments):
+        # 强制对齐后时间戳会变，整体重写（仍然逐段写，不在内存里拼整个文件）
+        self.f.seek(0)
+        self.f.truncate()
+        self.count = 0
+        self.write_header()
+        for segment in segments:
+            self.write_segment(segment)
+
+    def finish(self, **extra):
+        self.write_footer(**extra)
+        self.f.flush()
+        os.fsync(self.f.fileno())
+        self.f.close()
+        os.replace(self.part_path, self.file_path)
+        return self.file_path
+
+    def close(self):
+        if not self.f.closed:
+            self.f.close()
+
+
+class SrtStreamWriter(StreamingResultWriter):
+    ext = ".srt"
+
+    def format_segment(self, segment):
+        return format_srt_block(self.count, segment.start, segment.end, segment.text)
+
+
+class TxtStreamWriter(StreamingResultWriter):
+    ext = ".txt"
+
+    def format_segment(self, segment):
+        return segment.text if self.count == 1 else "\n" + segment.text
+
+
+class JsonStreamWriter(StreamingResultWriter):
+    """每条asr记录单独一行，.part文件可用load_partial_json读出已完成的部分。"""
+
+    ext = ".json"
+
+    def write_header(self):
+        self.f.write('{\n  "asr_info": [\n')
+
+    def format_segment(self, segment):
+        record = {
+            "start": segment.start,
+            "end": segment.end,
+            "text": segment.text,
+            "words": [{"start": w.start, "end": w.end, "word": w.word} for w in segment.words],
+        }
+        return ("    " if self.count == 1 else ",\n    ") + json.dumps(record, ensure_ascii=False)
+
+    def write_footer(self, diarization_info=None, video_duration=None):
+        self.f.write("\n  ]")
+        if diarization_info is not None:
+            self.f.write(',\n  "diarization_info": [')
+            for i, d in enumerate(diarization_info):
+                self.f.write(("\n    " if i == 0 else ",\n    ") + json.dumps({"start": d[0], "end": d[1], "label": d[2]}, ensure_ascii=False))
+            self.f.write("\n  ]")
+        self.f.write(f',\n  "video_duration": {json.dumps(video_duration)}\n}}\n')
+
+
+def load_partial_json(part_path):
+    asr_info = []
+    with open(part_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip().rstrip(",")
+            if not line.startswith("{") or not line.endswith("}"):
+                continue
+            try:
+                asr_info.append(json.loads(line))
+            except json.JSONDecodeError:
+                break
+    return {"asr_info": asr_info}
+
+
+class StreamingResultWriters:
+    def __init__(self, media_path, with_srt=True, with_txt=False, with_json=False) -> None:
+        self.media_path = media_path
+        self.writers: List[StreamingResultWriter] = []
+        try:
+            for enabled, writer_cls in ((with_srt, SrtStreamWriter), (with_txt, TxtStreamWriter), (with_json, JsonStreamWriter)):
+                if enabled:
+                    self.writers.append(writer_cls(media_path))
+        except:
+            self.close()
+            raise
+
+    def write_segment(self, segment):
+        for writer in self.writers:
+            writer.write_segment(segment)
+
+    def rewrite(self, segments):
+        for writer in self.writers:
+            writer.rewrite(segments)
+
+    def finish(self, move_result_file_callback, diarization_info=None, video_duration=None):
+        for writer in self.writers:
+            if isinstance(writer, JsonStreamWriter):
+                file_path = writer.finish(diarization_info=diarization_info, video_duration=video_duration)
+            else:
+                file_path = writer.finish()
+            move_result_file_callback(file_path, media_path=self.media_path)
+
+    def close(self):
+        # 异常退出时只关闭句柄，保留.part作为部分结果
+        for writer in self.writers:
+            writer.close()
+
+
 class FasterWhisper:
     def __init__(
         self,
@@ -49,7 +476,11 @@ class FasterWhisper:
         enable_lock_for_rich=False,
         compute_type="float16",
         batch_pipeline_mode=False,
+        diarization_chunk_seconds=None,
+        diarization_overlap_seconds=30,
+        metrics_path=None,
     ) -> None:
+        load_b_time = time.perf_counter()
         gpu_device_count = torch.cuda.device_count()
         self.model = WhisperModel(
             model_size,
@@ -61,64 +492,213 @@ class FasterWhisper:
         self.batch_pipeline_mode = batch_pipeline_mode
         if batch_pipeline_mode:
             self.model = BatchedInferencePipeline(model=self.model)
+        self.model_load_time = time.perf_counter() - load_b_time
+        # 每个文件一行JSON的分阶段耗时，None时只打印
+        self.metrics_path = metrics_path
         self.pyannote_pipeline = None
+        # 设置后说话人识别按窗口分块处理，峰值内存只与窗口长度有关
+        self.diarization_chunk_seconds = diarization_chunk_seconds
+        self.diarization_overlap_seconds = diarization_overlap_seconds
         self.enable_lock_for_rich = enable_lock_for_rich
         self.lock_manager = LockManager()
 
-    def transcribe(self, media_path, word_timestamps=True, language=None, vad_filter=True):
-        segments, info = self.model.transcribe(
-            media_path,
-            beam_size=5,
-            word_timestamps=word_timestamps,
-            language=language,
-            vad_filter=vad_filter,
-        )
+    def transcribe(
+        self,
+        media_path,
+        word_timestamps=True,
+        language=None,
+        vad_filter=True,
+        cancel_event=None,
+        on_segment=None,
+        collect=True,
+        metrics=None,
+    ):
+        if metrics is None:
+            metrics = RunMetrics(media_path)
+        with metrics.stage("decode_time"):
+            # 解码、VAD、特征提取以及未指定语言时的语言检测都在这一步完成，推理在迭代segments时才发生
+            segments, info = self.model.transcribe(
+                media_path,
+                beam_size=5,
+                word_timestamps=word_timestamps,
+                language=language,
+                vad_filter=vad_filter,
+            )
         print("Detected language '%s' with probability %f" % (info.language, info.language_probability))
+        metrics.language = info.language
 
         segments_result: List[Segment] = []
-        total_duration = int(info.duration)
-
-        td_len = str(len(str(total_duration)))
-        last_burst = 0.0
-        set_delay = 0.1
-        global timestamp_prev, timestamp_last
-        timestamp_prev = 0  # last timestamp in previous chunk
-        timestamp_last = 0
-        capture = io.StringIO()
-
-        def pbar_delayed():  # to get last timestamp from chunk
-            global timestamp_prev
-            time.sleep(set_delay)  # wait for whole chunk to be iterated
-            pbar.update(timestamp_last - timestamp_prev)
-            timestamp_prev = timestamp_last
-            print(capture.getvalue().splitlines()[-1])
-
-        with tqdm(
-            file=capture,
-            total=total_duration,
-            unit=" seconds",
-            smoothing=0.00001,
-            bar_format="{percentage:3.0f}% | {n_fmt:>" + td_len + "}/{total_fmt} | {elapsed}<<{remaining} | {rate_noinv_fmt}",
-        ) as pbar:
+        callback_time = 0.0
+        b_time = time.perf_counter()
+        with TranscribeProgress(int(info.duration)) as progress:
             for segment in segments:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise TranscribeCancelled(f"任务已取消：{media_path}")
                 if info.language == "zh":
-                    segment.text = zhconv.convert(segment.text, "zh-cn")
-                    if segment.words is not None:
-                        for word in segment.words:
-                            word.word = zhconv.convert(word.word, "zh-cn")
-                timestamp_last = round(segment.end)
-                time_now = time.time()
-                if time_now - last_burst > set_delay:  # catch new chunk
-                    last_burst = time_now
-                    Thread(target=pbar_delayed, daemon=False).start()
-                segments_result.append(segment)
-            time.sleep(set_delay + 0.3)
-            if timestamp_last < total_duration:
-                pbar.update(total_duration - timestamp_last)
-                print(capture.getvalue().splitlines()[-1])
+                    self._to_simplified_chinese(segment)
+                progress.update(round(segment.end))
+                metrics.segment_count += 1
+                if on_segment is not None:
+                    callback_b_time = time.perf_counter()
+                    on_segment(segment)
+                    callback_time += time.perf_counter() - callback_b_time
+                if collect:
+                    segments_result.append(segment)
+        metrics.inference_time += time.perf_counter() - b_time - callback_time
+        metrics.write_time += callback_time
 
         return segments_result, info
 
+    @staticmethod
+    def _to_simplified_chinese(segment):
+        segment.text = zhconv.convert(segment.text, "zh-cn")
+        if segment.words is not None:
+            for word in segment.words:
+                word.word = zhconv.convert(word.word, "zh-cn")
+
+    def _speech_clips(self, audio, chunk_length=30):
+        # 与BatchedInferencePipeline内部一致：VAD切出语音段，再把相邻语音段合并到不超过chunk_length秒
+        sampling_rate = self._whisper_model().feature_extractor.sampling_rate
+        speech_timestamps = get_speech_timestamps(audio, VadOptions(max_speech_duration_s=chunk_length, min_silence_duration_ms=160))
+        clips = []
+        for ts in speech_timestamps:
+            if clips and ts["end"] - clips[-1]["start"] <= chunk_length * sampling_rate:
+                clips[-1]["end"] = ts["end"]
+            else:
+                clips.append({"start": ts["start"], "end": ts["end"]})
+        return clips
+
+    def _transcribe_pack(self, pack, language, word_timestamps, batch_size):
+        # pack: [(media_path, audio, clips)]，所有文件拼成一条音频，clip_timestamps按文件偏移平移，
+        # 这样不同文件的语音段可以进入同一个推理batch；再按偏移把segment分回各自文件
+        sampling_rate = self._whisper_model().feature_extractor.sampling_rate
+        offsets = []
+        clip_timestamps = []
+        position = 0
+        for _, audio, clips in pack:
+            offsets.append(position / sampling_rate)
+            clip_timestamps.extend({"start": c["start"] + position, "end": c["end"] + position} for c in clips)
+            position += len(audio)
+        results = {media_path: [] for media_path, _, _ in pack}
+        if not clip_timestamps:
+            return results
+        segments, _ = cast(BatchedInferencePipeline, self.model).transcribe(
+            np.concatenate([audio for _, audio, _ in pack]),
+            language=language,
+            beam_size=5,
+            word_timestamps=word_timestamps,
+            vad_filter=False,
+            clip_timestamps=clip_timestamps,
+            batch_size=batch_size,
+        )
+        for segment in segments:
+            index = bisect.bisect_right(offsets, (segment.start + segment.end) / 2) - 1
+            offset = offsets[index]
+            segment.start = round(segment.start - offset, 3)
+            segment.end = round(segment.end - offset, 3)
+            if segment.words is not None:
+                for word in segment.words:
+                    word.start = round(word.start - offset, 3)
+                    word.end = round(word.end - offset, 3)
+            if language == "zh":
+                self._to_simplified_chinese(segment)
+            results[pack[index][0]].append(segment)
+        return results
+
+    def iter_packed_transcriptions(self, media_paths, language=None, word_timestamps=True, batch_size=16, pack_seconds=1800):
+        """
+        跨文件打包推理：依次解码各文件、检测语言并做VAD，同语言的文件攒够pack_seconds秒音频后一起送入
+        BatchedInferencePipeline。逐个yield (media_path, segments, language, duration)。
+        """
+        if not self.batch_pipeline_mode:
+            raise UserWarning("跨文件打包推理需要batch_pipeline_mode=True")
+        sampling_rate = self._whisper_model().feature_extractor.sampling_rate
+        pending = defaultdict(list)
+        pending_seconds = defaultdict(float)
+        durations = {}
+
+        def flush(lang):
+            pack = pending.pop(lang)
+            pending_seconds.pop(lang)
+            print(f"打包推理：{len(pack)}个文件，语言：{lang}，语音段：{sum(len(i[2]) for i in pack)}")
+            for media_path, segments in self._transcribe_pack(pack, lang, word_timestamps, batch_size).items():
+                yield media_path, segments, lang, durations.pop(media_path)
+
+        for media_path in media_paths:
+            try:
+                audio = decode_audio(media_path, sampling_rate=sampling_rate)
+            except Exception as e:
+                print(f"解码失败，跳过：{media_path}，原因为：{e}")
+                continue
+            lang = language or self.detect_language_from_audio(audio)
+            durations[media_path] = len(audio) / sampling_rate
+            pending[lang].append((media_path, audio, self._speech_clips(audio)))
+            pending_seconds[lang] += durations[media_path]
+            if pending_seconds[lang] >= pack_seconds:
+                yield from flush(lang)
+        for lang in list(pending):
+            yield from flush(lang)
+
+    def transcribe_files_packed(
+        self,
+        media_paths,
+        language=None,
+        word_timestamps=True,
+        batch_size=16,
+        pack_seconds=1800,
+        force_align=True,
+        regroup_eng=True,
+        move_result_file_callback=None,
+        **write_kwargs,
+    ):
+        if str(language).lower() == "auto":
+            language = None
+        b_time = time.time()
+        total_audio_seconds = 0.0
+        file_count = 0
+        for media_path, segments, lang, duration in self.iter_packed_transcriptions(
+            media_paths, language=language, word_timestamps=word_timestamps, batch_size=batch_size, pack_seconds=pack_seconds
+        ):
+            if force_align and word_timestamps and segments:
+                segments = self.force_align_segments(media_path, segments, lang, regroup_eng)
+            self.write_results(
+                media_path,
+                segments,
+                duration,
+                word_timestamps=word_timestamps,
+                move_result_file_callback=move_result_file_callback,
+                **write_kwargs,
+            )
+            total_audio_seconds += duration
+            file_count += 1
+        elapsed = time.time() - b_time
+        print(f"打包模式共处理{file_count}个文件，音频{int(total_audio_seconds)}秒，耗时{int(elapsed)}秒，速率为：{round(total_audio_seconds / max(elapsed, 1e-6), 2)}\n")
+        return total_audio_seconds, elapsed
+
+    def benchmark_packed_vs_per_file(self, media_paths, language=None, word_timestamps=True, batch_size=16, pack_seconds=1800):
+        """只推理不写文件，对比逐文件transcribe与跨文件打包的吞吐（音频秒/墙钟秒）。"""
+        pipeline = cast(BatchedInferencePipeline, self.model)
+        b_time = time.time()
+        audio_seconds = 0.0
+        for media_path in media_paths:
+            segments, info = pipeline.transcribe(
+                media_path, language=language, beam_size=5, word_timestamps=word_timestamps, batch_size=batch_size
+            )
+            list(segments)
+            audio_seconds += info.duration
+        per_file_rate = audio_seconds / max(time.time() - b_time, 1e-6)
+
+        b_time = time.time()
+        audio_seconds = sum(
+            i[3]
+            for i in self.iter_packed_transcriptions(
+                media_paths, language=language, word_timestamps=word_timestamps, batch_size=batch_size, pack_seconds=pack_seconds
+            )
+        )
+        packed_rate = audio_seconds / max(time.time() - b_time, 1e-6)
+        print(f"逐文件模式速率：{round(per_file_rate, 2)}，打包模式速率：{round(packed_rate, 2)}，提升：{round(packed_rate / per_file_rate, 2)}倍")
+        return per_file_rate, packed_rate
+
     def _default_move_result_file_callback(self, file_path, **kwargs):
         shutil.move(
             file_path,
@@ -139,91 +719,121 @@ class FasterWhisper:
         force_align=True,
         regroup_eng=True,
         vad_filter=True,
+        cancel_event=None,
     ):
+        """
+        转写并把结果写到文件。
+        force_align=True（默认）时用stable-ts整体矫正时间戳：要先收齐全部segment再对齐，内存随时长增长，对齐后再流式写出；
+        force_align=False（命令行--no-force-align）时segment边出边写、写完即丢，内存与音频时长无关。
+        """
         if not (with_srt or with_json or with_txt):
             raise UserWarning(f"srt、json、txt需要选择至少一种输出!")
+        metrics = RunMetrics(media_path, model_load_time=self.model_load_time)
+        run_b_time = time.perf_counter()
         if str(language).lower() == "auto":
             print("自动检测语言中...")
-            language = self.detect_language_by_longer_material(media_path)
+            with metrics.stage("language_detect_time"):
+                language = self.detect_language_by_longer_material(media_path)
         if move_result_file_callback is None:
             move_result_file_callback = self._default_move_result_file_callback
         video_duration = self.get_video_duration(media_path)
+        metrics.audio_duration = video_duration
         print(f"视频时长为: {video_duration}")
         b_time = time.time()
-        segments, info = self.transcribe(media_path, word_timestamps=word_timestamps, language=language, vad_filter=vad_filter)
+        writers = StreamingResultWriters(media_path, with_srt=with_srt, with_txt=with_txt, with_json=word_timestamps and with_json)
+        try:
+            # 不做强制对齐时segment写完即丢，长音频内存不随时长增长；强制对齐要收齐全部segment
+            segments, info = self.transcribe(
+                media_path,
+                word_timestamps=word_timestamps,
+                language=language,
+                vad_filter=vad_filter,
+                cancel_event=cancel_event,
+                on_segment=writers.write_segment,
+                collect=force_align,
+                metrics=metrics,
+            )
 
-        if force_align:
-            try:
-                with self.lock_manager.rich_live_lock(self.enable_lock_for_rich):
-                    print("开始使用stable-ts提升字幕精度...")
-                    segments = stable_whisper.transcribe_any(
-                        lambda audio, **kwargs: [[{"word": j.word, "start": j.start, "end": j.end} for j in i.words] for i in segments],  # type: ignore
-                        media_path,
-                        regroup=True if regroup_eng and info.language == "en" else False,
-                    ).segments
-            except Exception as e:
-                print(f"矫正字幕时出错，取消矫正，原因为：{e}")
-
-        print(f"音转文环节运行时间为：{int(time.time() - b_time)}秒，速率为：{round(video_duration / (time.time() - b_time), 2)}\n")
-        if with_srt:
-            srt_content = self.generate_srt(self.segments_to_srt_subtitles(segments))
-            srt_file_path = os.path.splitext(os.path.basename(media_path))[0] + ".srt"
-            with open(srt_file_path, "w", encoding="utf-8") as f:
-                f.write(srt_content)
-            move_result_file_callback(srt_file_path, media_path=media_path)
-        if with_txt:
-            txt_file_path = os.path.splitext(os.path.basename(media_path))[0] + ".txt"
-            with open(txt_file_path, "w", encoding="utf-8") as f:
-                f.write("\n".join([i.text for i in segments]))
-            move_result_file_callback(txt_file_path, media_path=media_path)
-        if with_diarization:
-            b_time = time.time()
-            diarization_info = self.get_diarization(media_path, move_result_file_callback, with_png)
-            print(f"说话人识别环节运行时间为：{int(time.time() - b_time)}秒，速率为：{round(video_duration / (time.time() - b_time), 2)}\n")
-        if word_timestamps and with_json:
-            json_data = {
-                "asr_info": [
-                    {
-                        "start": s.start,
-                        "end": s.end,
-                        "text": s.text,
-                        "words": [{"start": w.start, "end": w.end, "word": w.word} for w in s.words],  # type:ignore
-                    }
-                    for s in segments
-                ],
-            }
+            if force_align:
+                with metrics.stage("alignment_time"):
+                    aligned_segments = self.force_align_segments(media_path, segments, info.language, regroup_eng)
+                if aligned_segments is not segments:
+                    with metrics.stage("write_time"):
+                        writers.rewrite(aligned_segments)
+                del segments, aligned_segments
+
+            print(f"音转文环节运行时间为：{int(time.time() - b_time)}秒，速率为：{round(video_duration / (time.time() - b_time), 2)}\n")
+            diarization_info = None
             if with_diarization:
-                json_data["diarization_info"] = [{"start": d[0], "end": d[1], "label": d[2]} for d in diarization_info]  # type: ignore
-            json_data["video_duration"] = video_duration  # type: ignore
-            json_file_path = os.path.splitext(os.path.basename(media_path))[0] + ".json"
-            with open(json_file_path, "w", encoding="utf-8") as f:
-                f.write(json.dumps(json_data, indent=2, ensure_ascii=False))
-            move_result_file_callback(json_file_path, media_path=media_path)
+                with metrics.stage("diarization_time"):
+                    diarization_info = self._diarize_with_timing(media_path, move_result_file_callback, with_png, video_duration)
+            with metrics.stage("write_time"):
+                writers.finish(move_result_file_callback, diarization_info=diarization_info, video_duration=video_duration)
+        finally:
+            writers.close()
+        metrics.total_time = time.perf_counter() - run_b_time
+        metrics.peak_rss_mb = peak_rss_mb()
+        self.emit_metrics(metrics)
+        return info
+
+    def emit_metrics(self, metrics: RunMetrics):
+        print(f"分阶段耗时：{metrics.summary()}")
+        if self.metrics_path:
+            with open(self.metrics_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(metrics.to_dict(), ensure_ascii=False) + "\n")
+
+    def force_align_segments(self, media_path, segments, language, regroup_eng=True):
+        try:
+            with self.lock_manager.rich_live_lock(self.enable_lock_for_rich):
+                print("开始使用stable-ts提升字幕精度...")
+                return stable_whisper.transcribe_any(
+                    lambda audio, **kwargs: [[{"word": j.word, "start": j.start, "end": j.end} for j in i.words] for i in segments],  # type: ignore
+                    media_path,
+                    regroup=True if regroup_eng and language == "en" else False,
+                ).segments
+        except Exception as e:
+            print(f"矫正字幕时出错，取消矫正，原因为：{e}")
+            return segments
+
+    def write_results(
+        self,
+        media_path,
+        segments,
+        video_duration,
+        word_timestamps=True,
+        with_srt=True,
+        with_txt=False,
+        with_json=False,
+        with_diarization=False,
+        with_png=False,
+        move_result_file_callback=None,
+    ):
+        if move_result_file_callback is None:
+            move_result_file_callback = self._default_move_result_file_callback
+        writers = StreamingResultWriters(media_path, with_srt=with_srt, with_txt=with_txt, with_json=word_timestamps and with_json)
+        try:
+            for segment in segments:
+                writers.write_segment(segment)
+            diarization_info = None
+            if with_diarization:
+                diarization_info = self._diarize_with_timing(media_path, move_result_file_callback, with_png, video_duration)
+            writers.finish(move_result_file_callback, diarization_info=diarization_info, video_duration=video_duration)
+        finally:
+            writers.close()
+
+    def _diarize_with_timing(self, media_path, move_result_file_callback, with_png, video_duration):
+        b_time = time.time()
+        diarization_info = self.get_diarization(media_path, move_result_file_callback, with_png)
+        print(f"说话人识别环节运行时间为：{int(time.time() - b_time)}秒，速率为：{round(video_duration / (time.time() - b_time), 2)}\n")
+        return diarization_info
 
     def generate_srt(self, subtitles):
-        def convert_to_srt_time_format(original_seconds):
-            hours = int(original_seconds // 3600)
-            minutes = int((original_seconds % 3600) // 60)
-            seconds = int(original_seconds % 60)
-            milliseconds = int((original_seconds % 1) * 1000)
-            return f"{hours:02d}:{minutes:02d}:{seconds:02d},{milliseconds:03d}"
-
-        srt_content = ""
-        counter = 1
-        for subtitle in subtitles:
-            start_time, end_time, text = subtitle
-            srt_content += f"{counter}\n"
-            srt_content += f"{convert_to_srt_time_format(start_time)} --> {convert_to_srt_time_format(end_time)}\n"
-            srt_content += f"{text}\n\n"
-            counter += 1
-        return srt_content
+        return "".join(format_srt_block(counter, start_time, end_time, text) for counter, (start_time, end_time, text) in enumerate(subtitles, 1))
 
     def segments_to_srt_subtitles(self, segments: Iterable[Union[stable_whisper.result.Segment, Segment]]):
         return [(i.start, i.end, i.text) for i in segments]
 
-    def get_diarization(self, media_path, move_result_file_callback, with_png):
-        png_path = os.path.splitext(os.path.basename(media_path))[0] + ".png"
-        audio_path, temp_dir_for_wav = self.media_to_wav(media_path)
+    def _load_pyannote_pipeline(self):
         if not self.pyannote_pipeline:
             self.pyannote_pipeline = Pipeline.from_pretrained(
                 "pyannote/speaker-diarization-3.1",
@@ -236,19 +846,121 @@ class FasterWhisper:
             except:
                 print(f"pyannote pipeline绑定GPU失败...")
                 traceback.print_exc()
-        with self.lock_manager.rich_live_lock(self.enable_lock_for_rich):
-            waveform, sample_rate = torchaudio.load(audio_path)
-            print(f"预加载音频到内存")
-            with ProgressHook() as hook:
-                diarization = self.pyannote_pipeline({"waveform": waveform, "sample_rate": sample_rate}, hook=hook)
+        return self.pyannote_pipeline
+
+    def get_diarization(self, media_path, move_result_file_callback, with_png, chunk_seconds=None):
+        chunk_seconds = chunk_seconds or self.diarization_chunk_seconds
+        png_path = os.path.splitext(os.path.basename(media_path))[0] + ".png"
+        if chunk_seconds:
+            diarization = self._diarize_chunked(media_path, chunk_seconds, self.diarization_overlap_seconds)
+        else:
+            diarization = self._diarize_full(media_path)
         if with_png:
             png_data = diarization._repr_png_()
             with open(png_path, "wb") as f:
                 f.write(png_data)
             move_result_file_callback(png_path, media_path=media_path)
-        temp_dir_for_wav.cleanup()
         return [(i[0].start, i[0].end, i[2]) for i in diarization.itertracks(yield_label=True)]
 
+    def _diarize_full(self, media_path):
+        audio_path, temp_dir_for_wav = self.media_to_wav(media_path)
+        pipeline = self._load_pyannote_pipeline()
+        try:
+            with self.lock_manager.rich_live_lock(self.enable_lock_for_rich):
+                waveform, sample_rate = torchaudio.load(audio_path)
+                print(f"预加载音频到内存")
+                with ProgressHook() as hook:
+                    return pipeline({"waveform": waveform, "sample_rate": sample_rate}, hook=hook)
+        finally:
+            temp_dir_for_wav.cleanup()
+
+    def _diarize_chunked(self, media_path, chunk_seconds, overlap_seconds, cluster_threshold=0.7):
+        """
+        分块说话人识别：解码成临时的原始PCM文件，每次只从文件读出一个窗口（相邻窗口重叠overlap_seconds）交给pyannote；
+        每个窗口只保留去掉一半重叠区后的“核心区”结果，再用各窗口说话人的embedding做层次聚类，统一跨窗口的说话人标签；
+        同一窗口里pyannote已区分开的说话人不允许聚到一起（cannot-link）。
+        """
+        sample_rate = 16000
+        chunk_seconds = max(chunk_seconds, overlap_seconds * 2 + 1)
+        chunk_samples = int(chunk_seconds * sample_rate)
+        step_samples = int((chunk_seconds - overlap_seconds) * sample_rate)
+        half_overlap = overlap_seconds / 2
+        tracks = []  # (start, end, 窗口序号, 窗口内标签)
+        keys = []  # (窗口序号, 窗口内标签)
+        embeddings = []
+        pcm_path, temp_dir_for_pcm = self.media_to_pcm(media_path)
+        try:
+            pipeline = self._load_pyannote_pipeline()
+            total_samples = os.path.getsize(pcm_path) // 2
+            chunk_count = max(1, -(-max(total_samples - chunk_samples, 0) // step_samples) + 1)
+            with self.lock_manager.rich_live_lock(self.enable_lock_for_rich), open(pcm_path, "rb") as f:
+                for chunk_index in range(chunk_count):
+                    start = chunk_index * step_samples
+                    f.seek(start * 2)
+                    pcm = np.fromfile(f, dtype=np.int16, count=chunk_samples)
+                    is_last = start + len(pcm) >= total_samples
+                    waveform = torch.from_numpy(pcm.astype(np.float32) / 32768.0).unsqueeze(0)
+                    del pcm
+                    print(f"说话人识别分块 {chunk_index + 1}/{chunk_count}")
+                    diarization, chunk_embeddings = pipeline({"waveform": waveform, "sample_rate": sample_rate}, return_embeddings=True)
+                    chunk_start = start / sample_rate
+                    core_start = 0 if chunk_index == 0 else half_overlap
+                    core_end = float("inf") if is_last else chunk_seconds - half_overlap
+                    for label_index, label in enumerate(diarization.labels()):
+                        if label_index < len(chunk_embeddings) and not np.isnan(chunk_embeddings[label_index]).any():
+                            keys.append((chunk_index, label))
+                            embeddings.append(chunk_embeddings[label_index])
+                    for turn, _, label in diarization.itertracks(yield_label=True):
+                        seg_start, seg_end = max(turn.start, core_start), min(turn.end, core_end)
+                        if seg_end > seg_start:
+                            tracks.append((chunk_start + seg_start, chunk_start + seg_end, chunk_index, label))
+                    del waveform
+        finally:
+            temp_dir_for_pcm.cleanup()
+
+        global_labels = {}
+        if len(embeddings) > 1:
+            distances = squareform(pdist(np.vstack(embeddings), metric="cosine"))
+            # cannot-link：同一窗口的不同标签距离设为极大值，平均连接下任何包含这样一对的簇都远超阈值，不会被合并
+            chunk_ids = np.array([chunk_index for chunk_index, _ in keys])
+            distances[chunk_ids[:, None] == chunk_ids[None, :]] = 1e6
+            np.fill_diagonal(distances, 0)
+            cluster_ids = fcluster(linkage(squareform(distances, checks=False), method="average"), t=cluster_threshold, criterion="distance")
+            global_labels = dict(zip(keys, cluster_ids))
+        elif embeddings:
+            global_labels = {keys[0]: 1}
+
+        annotation = Annotation(uri=os.path.basename(media_path))
+        speaker_names = {}
+        last_by_label = {}  # 说话人 -> (结束最晚的片段, 所在窗口序号)
+        for seg_start, seg_end, chunk_index, label in sorted(tracks):
+            cluster_id = global_labels.get((chunk_index, label), f"{chunk_index}_{label}")
+            speaker = speaker_names.setdefault(cluster_id, f"SPEAKER_{len(speaker_names):02d}")
+            previous, previous_chunk = last_by_label.get(speaker, (None, None))
+            # 同一说话人在窗口边界被切开的片段重新接上；只接不同窗口的片段，同一窗口内的片段保持pyannote原样
+            if previous is not None and previous_chunk != chunk_index and seg_start - previous.end < 0.01:
+                del annotation[previous, speaker]
+                seg_start, seg_end = previous.start, max(previous.end, seg_end)
+            elif previous is not None and previous.end >= seg_end:
+                # 新片段完全落在上一个片段之内，是重复信息，直接丢弃
+                continue
+            segment = PyannoteSegment(seg_start, seg_end)
+            annotation[segment, speaker] = speaker
+            last_by_label[speaker] = (segment, chunk_index)
+        print(f"分块说话人识别完成：{chunk_count}个窗口，{len(speaker_names)}个说话人")
+        return annotation
+
+    def check_chunked_diarization(self, media_paths, chunk_seconds=600):
+        """以整段识别结果为参照，计算分块识别的DER，用于确认分块模式的精度损失。"""
+        metric = DiarizationErrorRate()
+        for media_path in media_paths:
+            reference = self._diarize_full(media_path)
+            hypothesis = self._diarize_chunked(media_path, chunk_seconds, self.diarization_overlap_seconds)
+            der = metric(reference, hypothesis)
+            print(f"DER={der:.2%}：{media_path}")
+        print(f"整体DER={abs(metric):.2%}，共{len(media_paths)}个文件，窗口{chunk_seconds}秒")
+        return abs(metric)
+
     def get_video_duration(self, video_path):
         cmd = ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=noprint_wrappers=1:nokey=1", video_path]
         output = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT).stdout.decode("utf-8")
@@ -280,14 +992,25 @@ class FasterWhisper:
         subprocess.run(cmd)
         return wav_path, temp_dir_for_wav
 
-    def detect_language(self, media_path):
-        audio = os.path.abspath(media_path)
+    def media_to_pcm(self, video_path):
+        temp_dir_for_pcm = tempfile.TemporaryDirectory()
+        pcm_path = os.path.join(temp_dir_for_pcm.name, os.path.splitext(os.path.basename(video_path))[0] + ".pcm")
+        cmd = ["ffmpeg", "-i", video_path, "-ac", "1", "-ar", "16000", "-f", "s16le", "-map", "a", "-loglevel", "warning", pcm_path]
+        subprocess.run(cmd)
+        return pcm_path, temp_dir_for_pcm
+
+    def _whisper_model(self) -> WhisperModel:
         if self.batch_pipeline_mode:
-            model = cast(BatchedInferencePipeline, self.model).model
-        else:
-            model = cast(WhisperModel, self.model)
+            return cast(BatchedInferencePipeline, self.model).model
+        return cast(WhisperModel, self.model)
+
+    def detect_language(self, media_path):
+        model = self._whisper_model()
+        audio = decode_audio(os.path.abspath(media_path), sampling_rate=model.feature_extractor.sampling_rate)
+        return self.detect_language_from_audio(audio)
 
-        audio = decode_audio(audio, sampling_rate=model.feature_extractor.sampling_rate)
+    def detect_language_from_audio(self, audio):
+        model = self._whisper_model()
         features = model.feature_extractor(audio)  # type: ignore
         segment = features[:, : model.feature_extractor.nb_max_frames]
         encoder_output = model.encode(segment)
@@ -343,11 +1066,18 @@ if __name__ == "__main__":
     support_media_type_in_folder_processing_mode = [".mp4", ".flv", ".avi", ".mpg", ".wmv", ".mpeg", ".mov", ".webm", ".mp3"]
     with_diarization = False
     batch_pipeline_mode = False
+    pack_mode = False
+    diarization_chunk_seconds = None
+    # --no-force-align：跳过stable-ts对齐，换取与时长无关的平稳内存
+    force_align = "--no-force-align" not in sys.argv
+    if not force_align:
+        sys.argv.remove("--no-force-align")
 
     def process_media(media_path):
+        """转换单个文件，已有字幕或转换成功返回True，失败返回False。"""
         if os.path.exists(os.path.splitext(media_path)[0] + ".srt") or os.path.exists(os.path.splitext(media_path)[0] + ".json"):
             # print(f"已经有字幕，跳过转换：{media_path}")
-            return
+            return True
         try:
             print(f"开始转换文件: {media_path}")
             w.transcribe_to_file(
@@ -359,19 +1089,48 @@ if __name__ == "__main__":
                 with_png=False,
                 language="auto",
                 vad_filter=True,
+                force_align=force_align,
             )
+            return True
         except:
             traceback.print_exc()
+            return False
 
     if len(sys.argv) > 1:
         if sys.argv[1] == "dia":
             with_diarization = True
+        elif sys.argv[1] == "dia_chunk":
+            # 长音频分块做说话人识别，内存占用与时长无关
+            with_diarization = True
+            diarization_chunk_seconds = 600
+        elif sys.argv[1] == "dia_check":
+            # python fw_engine.py dia_check 文件夹：对比分块与整段说话人识别的DER
+            w = FasterWhisper(local_files_only=True, model_size="large-v3-turbo")
+            check_folder = sys.argv[2]
+            w.check_chunked_diarization(
+                [
+                    os.path.join(check_folder, i)
+                    for i in os.listdir(check_folder)
+                    if os.path.splitext(i)[-1].lower() in support_media_type_in_folder_processing_mode
+                ]
+            )
+            sys.exit(0)
         elif sys.argv[1] == "batch":
             batch_pipeline_mode = True
+        elif sys.argv[1] == "pack":
+            # 文件夹内的短视频跨文件打包推理；输入"bench 文件夹路径"可对比逐文件模式的速率
+            batch_pipeline_mode = True
+            pack_mode = True
         else:
             process_media(sys.argv[1].strip())
 
-    w = FasterWhisper(local_files_only=True, model_size="large-v3-turbo", batch_pipeline_mode=batch_pipeline_mode)
+    w = FasterWhisper(
+        local_files_only=True,
+        model_size="large-v3-turbo",
+        batch_pipeline_mode=batch_pipeline_mode,
+        diarization_chunk_seconds=diarization_chunk_seconds,
+        metrics_path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "fw_engine_metrics.jsonl"),
+    )
 
     while True:
         input_path = input("请输入媒体文件或文件夹的绝对路径：").strip()
@@ -379,19 +1138,19 @@ if __name__ == "__main__":
             continue
         if input_path[0] == '"' and input_path[-1] == '"':
             input_path = input_path[1:-1]
+        run_benchmark = False
+        if pack_mode and input_path.startswith("bench "):
+            run_benchmark = True
+            input_path = input_path[len("bench ") :].strip().strip('"')
 
         if input_path == "loop":
             from pathlib import Path
 
-            download_path = str(Path.home() / "Downloads")
-            while True:
-                for media_path in [
-                    os.path.join(download_path, i)
-                    for i in os.listdir(download_path)
-                    if os.path.splitext(i)[-1].lower() in support_media_type_in_folder_processing_mode
-                ]:
-                    process_media(media_path)
-                time.sleep(5)
+            intake = HotFolderIntake(str(Path.home() / "Downloads"), support_media_type_in_folder_processing_mode)
+            for media_path in intake.iter_ready():
+                # 失败的文件不记入状态文件，下次扫描时会重新送来重试
+                if process_media(media_path):
+                    intake.mark_processed(media_path)
 
         if os.path.isfile(input_path):
             media_paths = [input_path]
@@ -403,5 +1162,17 @@ if __name__ == "__main__":
             ]
         else:
             media_paths = []
+        if pack_mode and os.path.isdir(input_path):
+            if run_benchmark:
+                w.benchmark_packed_vs_per_file(media_paths)
+                continue
+            media_paths = [
+                i for i in media_paths if not (os.path.exists(os.path.splitext(i)[0] + ".srt") or os.path.exists(os.path.splitext(i)[0] + ".json"))
+            ]
+            try:
+                w.transcribe_files_packed(media_paths, language="auto", force_align=force_align, with_srt=True, with_json=True, with_txt=True)
+            except:
+                traceback.print_exc()
+            continue
         for media_path in media_paths:
             process_media(media_path)
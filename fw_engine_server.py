@@ -0,0 +1,447 @@
+"""
+常驻转写服务：模型只加载一次，通过本机 HTTP 接口接收任务。
+
+    python fw_engine_server.py serve [--port 8765] [--max-queue 64] [--batch] [--dia]
+    python fw_engine_server.py submit "D:\\video.mp4" [--priority 10] [--no-wait]
+    python fw_engine_server.py status <job_id>
+    python fw_engine_server.py cancel <job_id>
+
+接口（JSON）：
+    POST   /jobs             {"media_path": ..., "priority": 0, "options": {...}}
+    GET    /jobs             所有任务概要
+    GET    /jobs/<id>        任务状态
+    GET    /jobs/<id>/result 结果文件路径；?format=srt|json|txt 直接返回文件内容
+    DELETE /jobs/<id>        取消任务（排队中直接移除，运行中在下一个片段处中断）
+
+priority 越大越先处理，同优先级按提交顺序；队列满时 POST 返回 429。
+"""
+
+import argparse
+import heapq
+import itertools
+import json
+import os
+import re
+import sys
+import threading
+import time
+import traceback
+import urllib.error
+import urllib.request
+import uuid
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+DEFAULT_MAX_QUEUE = 64
+# 已结束的任务最多保留这么多个、这么久（秒），超出的从内存里淘汰
+MAX_FINISHED_JOBS = 1000
+FINISHED_JOB_TTL = 24 * 3600
+
+DEFAULT_JOB_OPTIONS = {
+    "with_srt": True,
+    "with_json": True,
+    "with_txt": True,
+    "with_diarization": False,
+    "with_png": False,
+    "language": "auto",
+    "vad_filter": True,
+}
+ALLOWED_JOB_OPTIONS = set(DEFAULT_JOB_OPTIONS) | {"word_timestamps", "force_align", "regroup_eng"}
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+FINISHED_STATES = (JOB_DONE, JOB_FAILED, JOB_CANCELLED)
+
+
+@dataclass
+class TranscribeJob:
+    media_path: str
+    priority: int = 0
+    options: dict = field(default_factory=dict)
+    job_id: str = field(default_factory=lambda: uuid.uuid4().hex[:12])
+    status: str = JOB_QUEUED
+    submitted_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    language: Optional[str] = None
+    result_files: Dict[str, str] = field(default_factory=dict)
+    error: Optional[str] = None
+    cancel_event: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    def to_dict(self):
+        return {
+            "job_id": self.job_id,
+            "media_path": self.media_path,
+            "priority": self.priority,
+            "options": self.options,
+            "status": self.status,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "language": self.language,
+            "result_files": dict(self.result_files),
+            "error": self.error,
+        }
+
+
+class JobQueue:
+    """有界优先级队列：priority 大的先出，同优先级先进先出，可按 id 移除。"""
+
+    def __init__(self, maxsize: int) -> None:
+        self.maxsize = maxsize
+        self._heap: List[tuple] = []
+        self._removed = set()
+        self._size = 0
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+
+    def put(self, job: TranscribeJob) -> bool:
+        with self._cond:
+            if self._size >= self.maxsize:
+                return False
+            heapq.heappush(self._heap, (-job.priority, next(self._counter), job))
+            self._size += 1
+            self._cond.notify()
+            return True
+
+    def get(self, timeout=None) -> Optional[TranscribeJob]:
+        with self._cond:
+            while True:
+                while self._heap and self._heap[0][2].job_id in self._removed:
+                    self._removed.discard(heapq.heappop(self._heap)[2].job_id)
+                if self._heap:
+                    self._size -= 1
+                    return heapq.heappop(self._heap)[2]
+                if not self._cond.wait(timeout):
+                    return None
+
+    def remove(self, job_id: str) -> bool:
+        with self._cond:
+            if job_id in self._removed or not any(entry[2].job_id == job_id for entry in self._heap):
+                return False
+            # 惰性删除：只做标记，出队时跳过
+            self._removed.add(job_id)
+            self._size -= 1
+            return True
+
+    def __len__(self):
+        with self._cond:
+            return self._size
+
+
+class TranscriptionService:
+    def __init__(self, whisper, max_queue=DEFAULT_MAX_QUEUE, default_options=None) -> None:
+        self.whisper = whisper
+        self.queue = JobQueue(max_queue)
+        self.jobs: Dict[str, TranscribeJob] = {}
+        self.jobs_lock = threading.Lock()
+        self.default_options = dict(DEFAULT_JOB_OPTIONS, **(default_options or {}))
+        self.current_job: Optional[TranscribeJob] = None
+        self.worker = threading.Thread(target=self._worker_loop, daemon=True)
+
+    def start(self):
+        self.worker.start()
+
+    def submit(self, media_path, priority=0, options=None) -> Optional[TranscribeJob]:
+        unknown = set(options or {}) - ALLOWED_JOB_OPTIONS
+        if unknown:
+            raise ValueError(f"不支持的参数：{sorted(unknown)}")
+        job = TranscribeJob(
+            media_path=os.path.abspath(media_path.strip()),
+            priority=int(priority),
+            options=dict(self.default_options, **(options or {})),
+        )
+        with self.jobs_lock:
+            if not self.queue.put(job):
+                return None
+            self.jobs[job.job_id] = job
+        print(f"收到任务[{job.job_id}]（优先级 {job.priority}，排队 {len(self.queue)}）：{job.media_path}")
+        return job
+
+    def get(self, job_id) -> Optional[TranscribeJob]:
+        with self.jobs_lock:
+            return self.jobs.get(job_id)
+
+    def list_jobs(self):
+        with self.jobs_lock:
+            return [job.to_dict() for job in self.jobs.values()]
+
+    def describe(self, job: TranscribeJob) -> dict:
+        """在锁内序列化任务，避免与工作线程的状态更新交错。"""
+        with self.jobs_lock:
+            return job.to_dict()
+
+    def cancel(self, job_id) -> Optional[TranscribeJob]:
+        job = self.get(job_id)
+        if job is None or job.status in FINISHED_STATES:
+            return job
+        job.cancel_event.set()
+        if self.queue.remove(job_id):
+            self._finish(job, JOB_CANCELLED)
+            print(f"已从队列移除任务[{job_id}]")
+        else:
+            print(f"任务[{job_id}]正在运行，将在下一个片段处中断")
+        return job
+
+    def _finish(self, job: TranscribeJob, status, error=None):
+        with self.jobs_lock:
+            job.status = status
+            job.error = error
+            job.finished_at = time.time()
+            self._prune_finished()
+
+    def _prune_finished(self):
+        """淘汰过期或超出数量上限的已结束任务；调用方需持有 jobs_lock。"""
+        finished = [job for job in self.jobs.values() if job.status in FINISHED_STATES]
+        expire_before = time.time() - FINISHED_JOB_TTL
+        stale = {job.job_id for job in finished if job.finished_at < expire_before}  # type: ignore
+        kept = sorted((job for job in finished if job.job_id not in stale), key=lambda job: job.finished_at)  # type: ignore
+        if len(kept) > MAX_FINISHED_JOBS:
+            stale.update(job.job_id for job in kept[: len(kept) - MAX_FINISHED_JOBS])
+        for job_id in stale:
+            del self.jobs[job_id]
+
+    def _worker_loop(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                continue
+            self._process_job(job)
+
+    def _process_job(self, job: TranscribeJob):
+        # 出队后、开始运行前被取消：队列里已删不掉，这里负责把它标记为已取消
+        if job.cancel_event.is_set():
+            self._finish(job, JOB_CANCELLED)
+            print(f"任务[{job.job_id}]已取消")
+            return
+
+        from fw_engine import TranscribeCancelled
+
+        self.current_job = job
+        with self.jobs_lock:
+            job.status = JOB_RUNNING
+            job.started_at = time.time()
+        print(f"开始处理任务[{job.job_id}]: {job.media_path}")
+
+        def record_result_file(file_path, **kwargs):
+            self.whisper._default_move_result_file_callback(file_path, **kwargs)
+            ext = os.path.splitext(file_path)[-1]
+            with self.jobs_lock:
+                job.result_files[ext.lstrip(".")] = os.path.splitext(kwargs["media_path"])[0] + ext
+
+        try:
+            info = self.whisper.transcribe_to_file(
+                media_path=job.media_path,
+                move_result_file_callback=record_result_file,
+                cancel_event=job.cancel_event,
+                **job.options,
+            )
+            with self.jobs_lock:
+                job.language = getattr(info, "language", None)
+            self._finish(job, JOB_DONE)
+            print(f"任务[{job.job_id}]完成，耗时 {int(job.finished_at - job.started_at)} 秒")  # type: ignore
+        except TranscribeCancelled:
+            self._finish(job, JOB_CANCELLED)
+            print(f"任务[{job.job_id}]已取消")
+        except Exception as e:
+            traceback.print_exc()
+            self._finish(job, JOB_FAILED, error=str(e))
+        finally:
+            self.current_job = None
+
+
+def make_request_handler(service: TranscriptionService):
+    class JobRequestHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send_json(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_text(self, status, text):
+            body = text.encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "text/plain; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _route(self):
+            path, _, query = self.path.partition("?")
+            match = re.fullmatch(r"/jobs/([0-9a-f]+)(/result)?", path.rstrip("/"))
+            params = dict(i.split("=", 1) for i in query.split("&") if "=" in i)
+            return path.rstrip("/"), match, params
+
+        def do_GET(self):
+            path, match, params = self._route()
+            if path == "/health":
+                return self._send_text(200, "healthy")
+            if path == "/jobs":
+                return self._send_json(200, {"jobs": service.list_jobs(), "queued": len(service.queue)})
+            job = service.get(match.group(1)) if match else None
+            if job is None:
+                return self._send_json(404, {"error": "job not found"})
+            if not match.group(2):  # type: ignore
+                return self._send_json(200, service.describe(job))
+            info = service.describe(job)
+            if info["status"] != JOB_DONE:
+                return self._send_json(409, {"error": f"job is {info['status']}", "status": info["status"]})
+            fmt = params.get("format")
+            if not fmt:
+                return self._send_json(200, {key: info[key] for key in ("job_id", "language", "result_files")})
+            if fmt not in info["result_files"]:
+                return self._send_json(404, {"error": f"no {fmt} result"})
+            with open(info["result_files"][fmt], "r", encoding="utf-8") as f:
+                return self._send_text(200, f.read())
+
+        def do_POST(self):
+            if self._route()[0] != "/jobs":
+                return self._send_json(404, {"error": "not found"})
+            try:
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                if not isinstance(payload, dict):
+                    return self._send_json(400, {"error": "request body must be a JSON object"})
+                if not isinstance(payload.get("options") or {}, dict):
+                    return self._send_json(400, {"error": "options must be a JSON object"})
+                media_path = payload.get("media_path")
+                if not isinstance(media_path, str) or not os.path.isfile(media_path):
+                    return self._send_json(400, {"error": "media_path does not exist"})
+                job = service.submit(media_path, payload.get("priority", 0), payload.get("options"))
+            except (ValueError, TypeError) as e:
+                return self._send_json(400, {"error": str(e)})
+            if job is None:
+                return self._send_json(429, {"error": "queue is full"})
+            return self._send_json(202, service.describe(job))
+
+        def do_DELETE(self):
+            _, match, _ = self._route()
+            job = service.cancel(match.group(1)) if match and not match.group(2) else None
+            if job is None:
+                return self._send_json(404, {"error": "job not found"})
+            return self._send_json(200, service.describe(job))
+
+        def log_message(self, format, *args):
+            pass
+
+    return JobRequestHandler
+
+
+def serve(host, port, max_queue, batch_pipeline_mode=False, with_diarization=False):
+    from fw_engine import FasterWhisper
+
+    print("开始加载模型...")
+    w = FasterWhisper(local_files_only=True, model_size="large-v3-turbo", batch_pipeline_mode=batch_pipeline_mode)
+    service = TranscriptionService(w, max_queue=max_queue, default_options={"with_diarization": with_diarization})
+    service.start()
+    server = ThreadingHTTPServer((host, port), make_request_handler(service))
+    print(f"模型加载完毕，服务地址：http://{host}:{port}，队列上限：{max_queue}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("服务已停止")
+    finally:
+        server.server_close()
+
+
+class TranscribeClient:
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT) -> None:
+        self.base_url = f"http://{host}:{port}"
+
+    def _request(self, method, path, payload=None):
+        data = json.dumps(payload).encode("utf-8") if payload is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, method=method, headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(req) as resp:
+                return json.loads(resp.read())
+        except urllib.error.HTTPError as e:
+            raise UserWarning(f"服务返回 {e.code}：{e.read().decode('utf-8', errors='replace')}")
+
+    def submit(self, media_path, priority=0, options=None):
+        return self._request("POST", "/jobs", {"media_path": os.path.abspath(media_path), "priority": priority, "options": options or {}})
+
+    def status(self, job_id):
+        return self._request("GET", f"/jobs/{job_id}")
+
+    def result(self, job_id):
+        return self._request("GET", f"/jobs/{job_id}/result")
+
+    def cancel(self, job_id):
+        return self._request("DELETE", f"/jobs/{job_id}")
+
+    def wait(self, job_id, poll_interval=2.0):
+        while True:
+            job = self.status(job_id)
+            if job["status"] in FINISHED_STATES:
+                return job
+            time.sleep(poll_interval)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="faster-whisper 常驻转写服务与客户端")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_serve = sub.add_parser("serve", help="加载模型并启动服务")
+    p_serve.add_argument("--max-queue", type=int, default=DEFAULT_MAX_QUEUE, help="排队任务上限，满了拒绝新任务")
+    p_serve.add_argument("--batch", action="store_true", help="使用 BatchedInferencePipeline")
+    p_serve.add_argument("--dia", action="store_true", help="默认开启说话人识别")
+
+    p_submit = sub.add_parser("submit", help="提交任务（默认等待完成）")
+    p_submit.add_argument("media_paths", nargs="+")
+    p_submit.add_argument("--priority", type=int, default=0)
+    p_submit.add_argument("--language", default=None)
+    p_submit.add_argument("--dia", action="store_true")
+    p_submit.add_argument("--no-wait", action="store_true")
+
+    for name in ("status", "cancel"):
+        p = sub.add_parser(name)
+        p.add_argument("job_id")
+
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        serve(args.host, args.port, args.max_queue, args.batch, args.dia)
+        return 0
+
+    client = TranscribeClient(args.host, args.port)
+    if args.command == "status":
+        print(json.dumps(client.status(args.job_id), ensure_ascii=False, indent=2))
+    elif args.command == "cancel":
+        print(json.dumps(client.cancel(args.job_id), ensure_ascii=False, indent=2))
+    else:
+        options = {}
+        if args.language:
+            options["language"] = args.language
+        if args.dia:
+            options["with_diarization"] = True
+        jobs = [client.submit(i.strip().strip('"'), args.priority, options) for i in args.media_paths]
+        for job in jobs:
+            print(f"已提交任务[{job['job_id']}]: {job['media_path']}")
+        if args.no_wait:
+            return 0
+        failed = 0
+        for job in jobs:
+            job = client.wait(job["job_id"])
+            print(f"任务[{job['job_id']}] {job['status']}: {job['media_path']}")
+            for ext, path in job["result_files"].items():
+                print(f"  {ext}: {path}")
+            if job["status"] != JOB_DONE:
+                failed += 1
+                if job["error"]:
+                    print(f"  错误: {job['error']}")
+        return 1 if failed else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -11,24 +11,54 @@
 除外），
 处理完的行会从 txt 中删除，直到 txt 清空。非 URL 的行会被自动跳过并
 原样保留，空行会被清理。默认串行，可用 -j N 开启并发（主线程统一读写 txt、
-子线程把图片下载到内存，避免并发写冲突；进度按 --save-interval 攒批写回，
-中断与结束时强制落盘）。进度记录在 txt 本身，可随时中断后续传。
+子线程把图片边下边写进输出目录下 .parts/ 里的 .part 文件，主线程负责命名
+并原子改名，避免并发写冲突）。每处理完一行只往 txt 旁的 <txt>.done 进度
+日志追加一个行号，txt 本身攒够 --compact-every 条或中断/结束时才原子重写
+一次，几十万行的清单也不会反复全量重写；可随时中断后续传（txt 减去日志即
+剩余）。没下完的 .part 在重试和重跑时用 Range/If-Range 从断点接着下，每个
+任务只占一个读块大小的内存。
+
+URL 列表参数也可以是目录或通配符（批量模式）：多份清单共用一个下载池和并发/
+按主机限额，按清单轮流派发保证公平；每份清单各自保留进度日志与失败清单，
+图片存到输出目录下以清单名命名的子目录。
+
+同一张图常以镜像、CDN 变体等不同 URL 出现：开启 --dedup link/skip 后下载时
+边写边算内容指纹，查输出目录下的 SQLite 指纹索引，内容已存在则建硬链接或直接
+跳过，结束时汇报重复个数与节省的字节数。默认不去重，行为与以前一致。
+
+所有请求共用一个 requests.Session，按主机保持 keep-alive 连接池（大小随 -j），
+同一 CDN 的上万个 URL 不再逐个新建 TCP/TLS 连接。--engine asyncio 改用
+aiohttp（可选依赖）在单个事件循环里跑上百个在途请求，线程开销更低。
 
 日志统一走 logging：带时间戳与级别、线程安全逐条完整输出，可用 --log-file
 同时落地到文件便于事后排查。
 """
 
 import argparse
+import asyncio
+import bisect
+import glob
+import hashlib
+import heapq
+import json
 import logging
 import os
+import sqlite3
 import sys
 import threading
 import time
+from collections import deque
 from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from itertools import count
 from urllib.parse import unquote, urlparse
 
 import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
 
 # 浏览器 User-Agent，避免部分服务器拒绝默认的 python-requests 请求
 HEADERS = {
@@ -67,6 +97,20 @@ FAILURE_FILE_SUFFIXES = {
     "other": ".failed.other.txt",
 }
 
+ENGINES = ("threads", "asyncio")
+READ_CHUNK_SIZE = 64 * 1024
+# 下载中的文件放在输出目录下的这个子目录里，完成后再原子改名为正式文件
+PART_DIR_NAME = ".parts"
+# 续传按字节偏移进行，必须拿到未压缩的原始字节
+IDENTITY_ENCODING = {"Accept-Encoding": "identity"}
+# 进度日志：txt 旁的追加写文件，记录已处理完的行；每这么多条至少 fsync 一次
+JOURNAL_SUFFIX = ".done"
+JOURNAL_SYNC_EVERY = 256
+# 输出目录里的内容指纹索引（SQLite），按内容去重用
+DIGEST_INDEX_NAME = ".download_index.sqlite3"
+DEDUP_MODES = ("link", "skip", "off")
+DIGEST_INDEX_COMMIT_EVERY = 100
+
 # 全局 logger；handler 在 main() 里通过 setup_logging 配置。
 # logging 自带锁，多线程调用会逐条完整输出，不会互相撕裂。
 logger = logging.getLogger("download_images")
@@ -74,6 +118,16 @@ logger = logging.getLogger("download_images")
 
 def classify_failure(error):
     """把最终下载异常归入 404、超时、TCP 连接或其他错误。"""
+    if aiohttp is not None:
+        if isinstance(error, aiohttp.ClientResponseError) and error.status == 404:
+            return "404"
+        # ServerTimeoutError 同时也是 ClientConnectionError，同样先判断超时
+        if isinstance(error, aiohttp.ServerTimeoutError):
+            return "timeout"
+        if isinstance(error, aiohttp.ClientConnectionError):
+            return "tcp"
+    if isinstance(error, asyncio.TimeoutError):
+        return "timeout"
     if isinstance(error, requests.exceptions.HTTPError):
         response = error.response
         if response is not None and response.status_code == 404:
@@ -130,12 +184,18 @@ def parse_args():
             "逐行下载图片。\n\n"
             "指定一个 txt 文件（每行一个图片 URL），通过代理下载，单个 URL 出错\n"
             "则【无限重试】，下载完成的 URL 会从 txt 中删除，直到全部下完。\n\n"
-            "默认【串行】下载；加 -j N 可开启【并发】：子线程把图片下载到内存，\n"
-            "主线程收到完整结果后立即写成正式文件；进度按 --save-interval 攒批\n"
-            "写回 txt（中断与结束时强制落盘），避免大文件被高频全量重写。\n\n"
+            "默认【串行】下载；加 -j N 可开启【并发】：子线程把图片边下边写进\n"
+            ".part 文件，主线程收到结果后立即改名为正式文件。\n\n"
             "不是 http/https URL 的行会被跳过并【原样保留】在原文件里，\n"
             "空行会被清理掉，二者都不会卡住下载流程。\n\n"
-            "进度直接记录在 txt 文件本身：可随时按 Ctrl+C 中断，重跑即从断点续传。"
+            "进度先追加进 txt 旁的 .done 日志，攒够 --compact-every 条或结束时才压实\n"
+            "回 txt，避免大文件被高频全量重写。可随时按 Ctrl+C 中断，重跑即从断点续传；\n"
+            "下到一半的文件也会按 Range 从已下载的字节处接着下。\n\n"
+            "同一主机的请求复用 keep-alive 连接（连接池大小随 -j）；\n"
+            "--engine asyncio 用 aiohttp 事件循环代替线程，适合上百并发。\n"
+            "并发模式按主机限并发（--per-host）并自适应限速（429/503/超时降速），\n"
+            "各主机轮流派发，慢主机不会占满全部名额。\n\n"
+            "给一个目录或通配符则进入批量模式：多份清单共用一个下载池，轮流派发。"
         ),
         epilog=(
             "示例:\n"
@@ -143,10 +203,14 @@ def parse_args():
             "      使用默认 7890 代理，串行下载到 ./images/ 目录\n\n"
             "  uv run download_images.py urls.txt -j 8\n"
             "      开 8 个线程并发下载\n\n"
+            "  uv run --with aiohttp download_images.py urls.txt -j 200 --engine asyncio\n"
+            "      用 asyncio 引擎维持 200 个在途请求\n\n"
             "  uv run download_images.py urls.txt -j 8 --log-file dl.log\n"
             "      并发下载，同时把日志追加写入 dl.log\n\n"
             "  uv run download_images.py urls.txt -o 我的图片\n"
             "      下载到 ./我的图片/ 目录\n\n"
+            "  uv run download_images.py lists/ -j 32\n"
+            "      批量下载 lists/ 下全部 txt，共用 32 个并发，存到 ./images/<清单名>/\n\n"
             "  uv run download_images.py urls.txt --proxy \"\"\n"
             "      不走代理，直连下载\n\n"
             "  uv run download_images.py urls.txt --max-retries 5\n"
@@ -157,7 +221,12 @@ def parse_args():
     parser.add_argument(
         "txt",
         metavar="URL列表文件",
-        help="文本文件路径，每行一个图片 URL（空行会被清理，非 URL 行会被跳过并保留）",
+        help=(
+            "文本文件路径，每行一个图片 URL（空行会被清理，非 URL 行会被跳过并保留）。"
+            "也可以给一个目录或通配符（如 \"lists/*.txt\"，注意加引号）进入批量模式："
+            "所有清单共用一个下载池与并发/按主机限额、轮流派发，"
+            "各自保留进度日志与失败清单，图片存到 -o 下以清单名命名的子目录"
+        ),
     )
     parser.add_argument(
         "-o", "--output-dir",
@@ -174,10 +243,57 @@ def parse_args():
             "并发下载的线程数，默认 1（完全串行，行为与单线程一致）。"
             "设为大于 1 即开启并发：主线程统一读写 txt 与命名落盘、子线程只负责下载，"
             "因此不会产生 txt 并发写冲突；编号按 URL 在 txt 中的顺序预先固定，"
-            "下载完成后立即从内存写入正式文件。"
+            "下载完成后立即把 .part 改名为正式文件。"
             "调大能提速，但也会加大代理与目标站的压力，请酌情设置"
         ),
     )
+    parser.add_argument(
+        "--per-host",
+        metavar="并发数",
+        type=int,
+        default=6,
+        help=(
+            "并发模式下同一主机同时在途的请求上限（默认: %(default)s，与浏览器一致；"
+            "0 表示与 -j 相同）。慢主机最多占这么多名额，其余名额留给其他主机"
+        ),
+    )
+    parser.add_argument(
+        "--host-rate",
+        metavar="次/秒",
+        type=float,
+        default=10,
+        help=(
+            "并发模式下每个主机的初始请求速率（令牌桶，默认: %(default)s）。"
+            "成功后逐步加速，遇到 429/503/超时减半，并遵守 Retry-After"
+        ),
+    )
+    parser.add_argument(
+        "--max-host-rate",
+        metavar="次/秒",
+        type=float,
+        default=100,
+        help="每个主机自适应速率的上限（默认: %(default)s）",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=ENGINES,
+        default="threads",
+        help=(
+            "并发下载引擎：threads 为线程池（默认）；asyncio 用 aiohttp 事件循环，"
+            "在途请求数同样由 -j 控制，适合 100 以上的高并发（需要安装 aiohttp，"
+            "且只支持 http:// 代理）"
+        ),
+    )
+    parser.add_argument(
+        "--dedup",
+        choices=DEDUP_MODES,
+        default="off",
+        help=(
+            "按内容去重：下载时顺带算指纹，查输出目录下的指纹索引"
+            f"（{DIGEST_INDEX_NAME}），内容已存在时 link 建硬链接，"
+            "skip 直接跳过不落盘；默认 off 不去重、每个 URL 都存一份，也不建索引"
+        ),
+    )
     parser.add_argument(
         "--proxy",
         metavar="地址",
@@ -199,7 +315,10 @@ def parse_args():
         metavar="秒",
         type=float,
         default=10,
-        help="每次重试前的等待时间，单位秒（默认: %(default)s）",
+        help=(
+            "每次重试前的等待时间，单位秒（默认: %(default)s）。"
+            "并发模式下由主线程排期重试，等待期间不占并发名额"
+        ),
     )
     parser.add_argument(
         "--max-retries",
@@ -217,11 +336,22 @@ def parse_args():
         "--save-interval",
         metavar="秒",
         type=float,
-        default=300,
+        default=5,
+        help=(
+            "进度日志（txt 旁的 .done 文件）fsync 落盘的最小间隔，单位秒"
+            "（默认: %(default)s）。每处理完一条都会立即追加进日志，"
+            f"fsync 另按此间隔或每 {JOURNAL_SYNC_EVERY} 条攒批"
+        ),
+    )
+    parser.add_argument(
+        "--compact-every",
+        metavar="条数",
+        type=int,
+        default=100000,
         help=(
-            "并发模式下进度写回 txt 的最小间隔，单位秒（默认: %(default)s）。"
-            "每次写回都会全量重写剩余清单，对大文件相当耗磁盘，故按间隔攒批；"
-            "Ctrl+C 中断与全部完成时总会强制写回。串行模式不受此参数影响"
+            "进度日志累计这么多条后压实一次：把已处理的行从 txt 中删掉并清空日志"
+            "（默认: %(default)s）。压实要全量重写 txt，平时只追加日志；"
+            "Ctrl+C 中断与全部完成时总会压实"
         ),
     )
     parser.add_argument(
@@ -267,72 +397,573 @@ def make_filename(url, save_dir, sequence, content_type=""):
     return candidate
 
 
-def _fetch_once(url, proxies, timeout):
-    """发一次请求，把响应体分块读入内存，返回 Content-Type 和图片数据。"""
-    with requests.get(
-        url,
-        headers=HEADERS,
-        proxies=proxies,
-        timeout=timeout,
-        stream=True,
-    ) as r:
+def make_session(proxies, pool_size):
+    """创建共享的 requests.Session：每个主机一个连接池，池大小与并发数一致。
+
+    urllib3 的连接池本身线程安全，多个下载线程共用同一个 Session 只做 GET
+    即可复用 keep-alive 连接（经代理的 https 会复用 CONNECT 隧道）。
+    重试由 download_with_retry 负责，适配器自身不重试。
+    """
+    session = requests.Session()
+    session.headers.update(HEADERS)
+    if proxies:
+        session.proxies.update(proxies)
+    adapter = HTTPAdapter(
+        pool_connections=max(pool_size, 10),
+        pool_maxsize=pool_size,
+        max_retries=0,
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def make_part_path(url, save_dir, occurrence=0):
+    """URL 对应的 .part 路径：同一 URL 每次重试、每次重跑都落到同一个文件，才能续传。
+
+    同一份清单里重复出现的 URL 用 occurrence 区分，避免并发写同一个 .part。
+    """
+    digest = hashlib.sha1(url.encode("utf-8")).hexdigest()
+    suffix = f"-{occurrence}" if occurrence else ""
+    return os.path.join(save_dir, PART_DIR_NAME, f"{digest}{suffix}.part")
+
+
+def _load_part_meta(part_path):
+    try:
+        with open(part_path + ".json", "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def resume_headers(part_path):
+    """返回 (已下载字节数, 请求头)。
+
+    只有记录过 ETag 或 Last-Modified 时才续传：带上 Range 和 If-Range，
+    服务端文件若已变化会直接回 200 整个文件，不会拼出坏图。
+    """
+    headers = dict(IDENTITY_ENCODING)
+    try:
+        offset = os.path.getsize(part_path)
+    except OSError:
+        return 0, headers
+    meta = _load_part_meta(part_path)
+    validator = meta.get("etag") or meta.get("last_modified")
+    if offset and validator:
+        headers["Range"] = f"bytes={offset}-"
+        headers["If-Range"] = validator
+        return offset, headers
+    return 0, headers
+
+
+def _content_range(headers):
+    """解析 Content-Range: bytes 起点-终点/总长（或 bytes */总长），返回 (起点, 总长)，缺失的项为 None。"""
+    value = headers.get("Content-Range", "")
+    try:
+        unit, _, spec = value.partition(" ")
+        span, _, total = spec.partition("/")
+        start = None if span == "*" else int(span.split("-")[0])
+        return start, (None if total in ("", "*") else int(total))
+    except ValueError:
+        return None, None
+
+
+def prepare_part(part_path, url, status, headers, offset):
+    """根据响应决定怎么写 .part，返回 (打开模式, 预期总字节数或 None)。
+
+    206 且起点与本地长度吻合 → 追加；200（不支持续传或文件已变）→ 从头写，
+    并记下新的 ETag/Last-Modified/Content-Type 供下次续传。
+    """
+    if status == 206:
+        start, total = _content_range(headers)
+        if start != offset:
+            discard_part(part_path)
+            raise IOError(f"Content-Range 与已下载长度 {offset} 不符: {headers.get('Content-Range')}")
+        logger.info("续传 %s：已有 %d 字节", url, offset)
+        return "ab", total
+    meta = {
+        "url": url,
+        "etag": headers.get("ETag"),
+        "last_modified": headers.get("Last-Modified"),
+        "content_type": headers.get("Content-Type", ""),
+    }
+    with open(part_path + ".json", "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+    length = headers.get("Content-Length")
+    return "wb", (int(length) if length and length.isdigit() else None)
+
+
+def part_already_complete(part_path, headers, offset):
+    """416 时判断本地 .part 是否其实已经完整（上次写完但没来得及改名）。"""
+    _start, total = _content_range(headers)
+    if total is not None and total == offset:
+        return True
+    discard_part(part_path)
+    return False
+
+
+def check_part_size(part_path, expected):
+    written = os.path.getsize(part_path)
+    if expected is not None and written != expected:
+        raise IOError(f"下载不完整：{written}/{expected} 字节，下次从断点续传")
+
+
+def part_content_type(part_path, headers):
+    return headers.get("Content-Type") or _load_part_meta(part_path).get("content_type", "")
+
+
+def part_hasher(part_path, mode):
+    """新建内容指纹；续传（追加写）时先把 .part 里已有的字节补算进去。"""
+    h = hashlib.blake2b(digest_size=16)
+    if mode == "ab":
+        with open(part_path, "rb") as f:
+            for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b""):
+                h.update(chunk)
+    return h
+
+
+def finish_part(part_path, final):
+    """把下载完成的 .part 原子改名为正式文件，并删掉校验信息。"""
+    replace_with_retry(part_path, final)
+    discard_part(part_path)
+
+
+def discard_part(part_path):
+    for path in (part_path, part_path + ".json"):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def _fetch_once(url, session, timeout, part_path):
+    """发一次请求，响应体按块边收边写进 .part（有断点则续传）并同时算指纹。
+
+    返回 (Content-Type, 内容指纹)。
+    """
+    offset, headers = resume_headers(part_path)
+    with session.get(url, headers=headers, timeout=timeout, stream=True) as r:
+        if r.status_code == 416 and part_already_complete(part_path, r.headers, offset):
+            return part_content_type(part_path, r.headers), part_hasher(part_path, "ab").hexdigest()
         r.raise_for_status()
-        data = bytearray()
-        for chunk in r.iter_content(chunk_size=64 * 1024):
-            if chunk:
-                data.extend(chunk)
-        return r.headers.get("Content-Type", ""), data
+        mode, expected = prepare_part(part_path, url, r.status_code, r.headers, offset)
+        h = part_hasher(part_path, mode)
+        with open(part_path, mode) as f:
+            for chunk in r.iter_content(chunk_size=READ_CHUNK_SIZE):
+                if chunk:
+                    f.write(chunk)
+                    h.update(chunk)
+        check_part_size(part_path, expected)
+        return part_content_type(part_path, r.headers), h.hexdigest()
+
+
+def fetch_attempt(url, session, timeout, part_path):
+    """只尝试一次，返回 (Content-Type, .part 路径, 内容指纹, 异常)，不在子线程里等待重试。"""
+    try:
+        content_type, digest = _fetch_once(url, session, timeout, part_path)
+        return content_type, part_path, digest, None
+    except Exception as e:
+        return None, None, None, e
 
 
-def download_with_retry(url, proxies, timeout, retry_wait, max_retries,
-                        stop_event=None, tag=""):
-    """带重试地把 url 下载到内存（只下载、不命名，供主/子线程复用）。
+def throttle_info(error):
+    """判断失败是否说明目标主机过载，返回 (是否应降速, Retry-After 秒数或 None)。
 
-    返回 (Content-Type, bytearray, 失败类型)。成功时失败类型为 None；超过重试
-    上限时前两项为 None，并返回最终异常的分类；收到 stop_event 时三项均为
-    None。max_retries 为 0 表示无限重试，但 404 始终不重试。
+    HTTP 429/503 与超时视为过载；429/503 若带数字形式的 Retry-After 则一并返回。
+    """
+    status, headers = None, None
+    if isinstance(error, requests.exceptions.HTTPError) and error.response is not None:
+        status, headers = error.response.status_code, error.response.headers
+    elif aiohttp is not None and isinstance(error, aiohttp.ClientResponseError):
+        status, headers = error.status, error.headers
+    if status in (429, 503):
+        value = (headers or {}).get("Retry-After", "")
+        try:
+            return True, max(float(value), 0.0)
+        except ValueError:
+            return True, None
+    return classify_failure(error) == "timeout", None
+
+
+class TokenBucket:
+    """单个主机的令牌桶，速率按 AIMD 自适应。
+
+    成功一次速率加 RATE_INCREASE，遇到过载（429/503/超时）速率减半，
+    始终夹在 [min_rate, max_rate] 之间。
+    """
+
+    RATE_INCREASE = 0.5
+    RATE_DECREASE = 0.5
+
+    def __init__(self, rate, burst, min_rate, max_rate):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now):
+        """距离下一个令牌可用还要等多久（秒），0 表示现在就有。"""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def on_success(self):
+        self.rate = min(self.max_rate, self.rate + self.RATE_INCREASE)
+
+    def on_throttle(self):
+        self.rate = max(self.min_rate, self.rate * self.RATE_DECREASE)
+        self.tokens = min(self.tokens, 0.0)
+
+
+class HostState:
+    def __init__(self, limit, bucket):
+        self.queued = 0             # 各清单里排队等这个主机的任务数之和
+        self.inflight = 0
+        self.limit = limit          # 该主机的并发上限（信号量），所有清单共用
+        self.bucket = bucket
+        self.paused_until = 0.0     # Retry-After 或过载后的暂停截止时间
+
+
+class ListLane:
+    """一份清单的待发任务：按主机分队列，在本清单的主机之间轮转。"""
+
+    def __init__(self):
+        self.queues = {}            # 主机 -> 待发任务 [任务顺序, 行索引, url, 已尝试次数, .part 路径, 清单序号]
+        self.order = []
+        self.cursor = 0
+
+
+class HostScheduler:
+    """按清单、主机两级分队列的公平调度器，只在主线程使用。
+
+    next_task 先在各清单之间轮转（多清单时每份清单分到相同的派发机会），
+    再在该清单的主机之间轮转，跳过已达并发上限、令牌不足或暂停中的主机，
+    保证滑动窗口里都是能立刻推进的请求。主机的并发上限与限速对所有清单全局生效。
+    """
+
+    def __init__(self, per_host, rate, max_rate, min_rate=0.2):
+        self.per_host = per_host
+        self.rate = rate
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.hosts = {}
+        self.lanes = {}
+        self.lane_order = []
+        self.cursor = 0
+
+    def host(self, name):
+        state = self.hosts.get(name)
+        if state is None:
+            bucket = TokenBucket(self.rate, max(1, self.per_host), self.min_rate, self.max_rate)
+            state = self.hosts[name] = HostState(self.per_host, bucket)
+        return state
+
+    def add(self, task, front=False):
+        name = urlparse(task[2]).netloc
+        self.host(name).queued += 1
+        lane = self.lanes.get(task[5])
+        if lane is None:
+            lane = self.lanes[task[5]] = ListLane()
+            self.lane_order.append(task[5])
+        queue = lane.queues.get(name)
+        if queue is None:
+            queue = lane.queues[name] = deque()
+            lane.order.append(name)
+        if front:
+            queue.appendleft(task)
+        else:
+            queue.append(task)
+
+    def _ready(self, state, now):
+        return (
+            state.inflight < state.limit
+            and state.paused_until <= now
+            and state.bucket.wait_time(now) <= 0
+        )
+
+    def next_task(self, now):
+        for lane_step in range(len(self.lane_order)):
+            lane_idx = (self.cursor + lane_step) % len(self.lane_order)
+            lane = self.lanes[self.lane_order[lane_idx]]
+            for step in range(len(lane.order)):
+                idx = (lane.cursor + step) % len(lane.order)
+                name = lane.order[idx]
+                state = self.hosts[name]
+                if not lane.queues[name] or not self._ready(state, now):
+                    continue
+                state.bucket.take(now)
+                state.inflight += 1
+                state.queued -= 1
+                lane.cursor = idx + 1
+                self.cursor = lane_idx + 1
+                return lane.queues[name].popleft()
+        return None
+
+    def next_ready_in(self, now):
+        """有任务但被速率/暂停挡住时，最早多久后能再发；没有可等的返回 None。"""
+        waits = [
+            max(state.paused_until - now, state.bucket.wait_time(now))
+            for state in self.hosts.values()
+            if state.queued and state.inflight < state.limit
+        ]
+        return min(waits) if waits else None
+
+    def pending(self):
+        return sum(state.queued for state in self.hosts.values())
+
+    def on_done(self, url, error, now):
+        state = self.hosts[urlparse(url).netloc]
+        state.inflight -= 1
+        if error is None:
+            state.bucket.on_success()
+            return
+        throttled, retry_after = throttle_info(error)
+        if throttled:
+            state.bucket.on_throttle()
+            if retry_after is not None:
+                state.paused_until = max(state.paused_until, now + retry_after)
+            logger.warning(
+                "主机 %s 过载（%s），速率降至 %.1f 次/秒%s",
+                urlparse(url).netloc, error, state.bucket.rate,
+                f"，暂停 {retry_after:.0f} 秒" if retry_after else "",
+            )
+
+
+def download_with_retry(url, session, timeout, retry_wait, max_retries,
+                        part_path, stop_event=None, tag=""):
+    """带重试地把 url 下载到 part_path（只下载、不命名）；每次重试从断点续传。
+
+    返回 (Content-Type, .part 路径, 内容指纹, 失败类型)。成功时失败类型为 None；
+    超过重试上限时前三项为 None，并返回最终异常的分类；收到 stop_event 时四项
+    均为 None。max_retries 为 0 表示无限重试，但 404 始终不重试。
     """
     attempt = 0
     while True:
         if stop_event is not None and stop_event.is_set():
-            return None, None, None
+            return None, None, None, None
         attempt += 1
         try:
-            content_type, data = _fetch_once(url, proxies, timeout)
-            return content_type, data, None
+            content_type, digest = _fetch_once(url, session, timeout, part_path)
+            return content_type, part_path, digest, None
         except KeyboardInterrupt:
             raise
         except Exception as e:
             failure_type = classify_failure(e)
             if failure_type == "404":
                 logger.error("%s收到 HTTP 404，不再重试并放弃: %s", tag, e)
-                return None, None, failure_type
+                return None, None, None, failure_type
             if max_retries and attempt >= max_retries:
                 logger.error(
                     "%s已重试 %d 次仍失败，归类为%s并放弃: %s",
                     tag, attempt, FAILURE_LABELS[failure_type], e,
                 )
-                return None, None, failure_type
+                return None, None, None, failure_type
             logger.warning("%s[重试 %d] 失败: %s", tag, attempt, e)
             # 可中断的等待：并发时若被叫停则立刻返回，串行时退化为普通 sleep
             if stop_event is not None:
                 if stop_event.wait(retry_wait):
-                    return None, None, None
+                    return None, None, None, None
             else:
                 time.sleep(retry_wait)
 
 
-def download(url, save_dir, proxies, timeout, retry_wait, max_retries, sequence):
-    """串行下载单个 url：完整读入内存后直接写入正式文件。"""
-    ct, data, failure_type = download_with_retry(
-        url, proxies, timeout, retry_wait, max_retries
+class AsyncFetcher:
+    """asyncio 下载引擎：事件循环跑在后台线程里，由 aiohttp 维持连接池。
+
+    submit() 通过 run_coroutine_threadsafe 返回 concurrent.futures.Future，
+    结果格式与 fetch_attempt 相同，所以主线程的调度、命名落盘、
+    写回进度逻辑与线程池引擎完全共用。
+
+    事件循环里只做网络收发；读写 .part（续传时补算已有字节的指纹、逐块写入）
+    都交给小线程池，大文件续传或磁盘慢时不会卡住其他在途请求。
+    """
+
+    IO_THREADS = 16
+
+    def __init__(self, proxy, concurrency, timeout):
+        self.proxy = proxy or None
+        self.io_pool = ThreadPoolExecutor(
+            max_workers=min(self.IO_THREADS, max(1, concurrency)), thread_name_prefix="async-io"
+        )
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.session = self._call(self._open(concurrency, timeout))
+
+    def _call(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    async def _open(self, concurrency, timeout):
+        connector = aiohttp.TCPConnector(limit=concurrency, limit_per_host=concurrency)
+        return aiohttp.ClientSession(
+            connector=connector,
+            headers=HEADERS,
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=timeout, sock_read=timeout),
+        )
+
+    def _io(self, func, *args):
+        """在 I/O 线程池里执行阻塞的文件操作，返回可 await 的 Future。"""
+        return self.loop.run_in_executor(self.io_pool, func, *args)
+
+    @staticmethod
+    def _write_chunk(f, h, chunk):
+        f.write(chunk)
+        h.update(chunk)
+
+    async def _fetch_once(self, url, part_path):
+        offset, headers = await self._io(resume_headers, part_path)
+        async with self.session.get(url, proxy=self.proxy, headers=headers) as r:
+            if r.status == 416 and await self._io(part_already_complete, part_path, r.headers, offset):
+                h = await self._io(part_hasher, part_path, "ab")
+                return await self._io(part_content_type, part_path, r.headers), h.hexdigest()
+            r.raise_for_status()
+            mode, expected = await self._io(prepare_part, part_path, url, r.status, r.headers, offset)
+            # 续传时要把已有的 .part 整个读一遍补算指纹，放在线程池里做
+            h = await self._io(part_hasher, part_path, mode)
+            f = await self._io(open, part_path, mode)
+            try:
+                async for chunk in r.content.iter_chunked(READ_CHUNK_SIZE):
+                    # 同一文件的块按顺序 await，写入与指纹更新不会乱序
+                    await self._io(self._write_chunk, f, h, chunk)
+            finally:
+                await self._io(f.close)
+            await self._io(check_part_size, part_path, expected)
+            return await self._io(part_content_type, part_path, r.headers), h.hexdigest()
+
+    async def _attempt(self, url, part_path):
+        try:
+            content_type, digest = await self._fetch_once(url, part_path)
+            return content_type, part_path, digest, None
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            return None, None, None, e
+
+    def submit(self, url, part_path):
+        """提交一次下载尝试，返回 Future，结果同 fetch_attempt。"""
+        return asyncio.run_coroutine_threadsafe(self._attempt(url, part_path), self.loop)
+
+    async def _close(self):
+        tasks = [t for t in asyncio.all_tasks() if t is not asyncio.current_task()]
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await self.session.close()
+
+    def close(self):
+        self._call(self._close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+        self.io_pool.shutdown()
+
+
+class DigestIndex:
+    """输出目录的内容指纹索引，内容相同的图片只落盘一份。只在主线程使用。
+
+    存在输出目录下的 SQLite 里（digest 为主键），启动时不必整表载入，
+    百万条记录也是毫秒级打开、按主键查。路径存相对输出目录的形式，
+    目录整体搬走后依然可用。命中时若原文件已被删或大小对不上，视为失效，
+    照常保存并更新记录。
+    """
+
+    def __init__(self, save_dir, mode):
+        self.save_dir = save_dir
+        self.mode = mode
+        self.conn = sqlite3.connect(os.path.join(save_dir, DIGEST_INDEX_NAME))
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS digests ("
+            "digest TEXT PRIMARY KEY, path TEXT NOT NULL, size INTEGER NOT NULL)"
+        )
+        self.conn.commit()
+        self.uncommitted = 0
+        self.duplicates = 0
+        self.saved_bytes = 0
+
+    def _existing(self, digest, size):
+        row = self.conn.execute(
+            "SELECT path, size FROM digests WHERE digest = ?", (digest,)
+        ).fetchone()
+        if row is None or row[1] != size:
+            return None
+        path = os.path.join(self.save_dir, row[0])
+        try:
+            return path if os.path.getsize(path) == size else None
+        except OSError:
+            return None
+
+    def place(self, part_path, digest, final):
+        """把下完的 .part 落盘或按内容去重，返回这个 URL 的内容所在路径。"""
+        size = os.path.getsize(part_path)
+        existing = self._existing(digest, size)
+        if existing is not None:
+            if self.mode == "skip":
+                discard_part(part_path)
+                self._count_duplicate(size, "跳过", existing)
+                return existing
+            try:
+                os.link(existing, final)
+            except OSError as e:
+                logger.warning("硬链接 %s 失败，改为保存副本: %s", existing, e)
+            else:
+                discard_part(part_path)
+                self._count_duplicate(size, "硬链接", existing)
+                return final
+        finish_part(part_path, final)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO digests (digest, path, size) VALUES (?, ?, ?)",
+            (digest, os.path.relpath(final, self.save_dir), size),
+        )
+        self.uncommitted += 1
+        if self.uncommitted >= DIGEST_INDEX_COMMIT_EVERY:
+            self.commit()
+        return final
+
+    def _count_duplicate(self, size, action, existing):
+        self.duplicates += 1
+        self.saved_bytes += size
+        logger.info("      内容与 %s 相同，已%s", os.path.basename(existing), action)
+
+    def commit(self):
+        self.conn.commit()
+        self.uncommitted = 0
+
+    def close(self):
+        self.commit()
+        self.conn.close()
+
+
+def store_part(part_path, digest, final, index=None):
+    """下载完成后的落盘：有指纹索引时按内容去重，否则直接改名为正式文件。"""
+    if index is None:
+        finish_part(part_path, final)
+        return final
+    return index.place(part_path, digest, final)
+
+
+def download(url, save_dir, session, timeout, retry_wait, max_retries, sequence,
+             index=None):
+    """串行下载单个 url：边下边写 .part，完成后原子改名为正式文件（或按内容去重）。"""
+    part_path = make_part_path(url, save_dir)
+    ct, part, digest, failure_type = download_with_retry(
+        url, session, timeout, retry_wait, max_retries, part_path
     )
-    if data is None:
+    if part is None:
+        discard_part(part_path)
         return None, failure_type
     final = make_filename(url, save_dir, next(sequence), ct)
-    with open(final, "wb") as f:
-        f.write(data)
-    return final, None
+    return store_part(part, digest, final, index), None
 
 
 def load_entries(txt_path):
@@ -365,232 +996,471 @@ def replace_with_retry(src, dst, attempts=8, base_delay=0.1):
             delay = min(delay * 2, 2.0)
 
 
+def find_lists(pattern):
+    """解析 URL 列表参数，返回 (清单路径列表, 是否批量模式)。
+
+    单个文件即普通模式；目录取其中全部 *.txt，其他视为通配符。批量模式下
+    脚本自己生成的失败清单（*.failed.*.txt）不算在内。
+    """
+    if os.path.isfile(pattern):
+        return [pattern], False
+    if os.path.isdir(pattern):
+        paths = glob.glob(os.path.join(glob.escape(pattern), "*.txt"))
+    else:
+        paths = glob.glob(pattern)
+    failure_suffixes = tuple(FAILURE_FILE_SUFFIXES.values())
+    paths = sorted(
+        p for p in paths if os.path.isfile(p) and not p.endswith(failure_suffixes)
+    )
+    return paths, True
+
+
 def save_entries(txt_path, entries):
     """把剩余条目原子写回，每行一个，不留空行；为空则清空文件。"""
     tmp = txt_path + ".tmp"
     with open(tmp, "w", encoding="utf-8") as f:
         if entries:
             f.write("\n".join(entries) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
     replace_with_retry(tmp, txt_path)
 
 
-def run_serial(args, proxies, failure_paths, sequence):
-    """串行路径：取第一个 URL 下载、删行、下一个。行为与并发功能引入前一致。"""
-    ok = failed = 0
-    failure_counts = {failure_type: 0 for failure_type in FAILURE_TYPES}
-    while True:
-        lines = load_entries(args.txt)
-        # 找到第一个 URL 行；前面的非 URL 行跳过、原样留在文件里
-        idx = next((i for i, s in enumerate(lines) if is_url(s)), None)
-        if idx is None:
-            break  # 再没有可下载的 URL 了
-
-        url = lines[idx]
-        logger.info("[%d] 下载: %s", ok + failed + 1, url)
-        path, failure_type = download(
-            url,
-            args.output_dir,
-            proxies,
-            args.timeout,
-            args.retry_wait,
-            args.max_retries,
-            sequence,
-        )
+def entries_fingerprint(entries):
+    """条目列表的指纹（与换行风格无关），用来判断进度日志是否对应当前 txt。"""
+    h = hashlib.sha1()
+    for s in entries:
+        h.update(s.encode("utf-8"))
+        h.update(b"\n")
+    return h.hexdigest()
 
-        if path is not None:
-            ok += 1
-            logger.info("      已保存 -> %s", path)
-        else:
-            failed += 1
-            failure_type, failure_path = append_failure(
-                url, failure_type, failure_paths
-            )
-            failure_counts[failure_type] += 1
-            logger.error(
-                "      下载失败并放弃，归类为%s并记入 %s",
-                FAILURE_LABELS[failure_type], failure_path,
-            )
 
-        # 删掉这一行 URL，其余（含跳过的非 URL 行）原样写回，空行不保留
-        del lines[idx]
-        save_entries(args.txt, lines)
-    return ok, failure_counts
+class ProgressJournal:
+    """txt 旁的追加写进度日志（<txt>.done），代替每处理完一条就全量重写 txt。
 
+    首行是 "# <指纹>"，对应当前 txt 的条目；其后每行一个已处理完的条目下标。
+    每条立即写入（进程崩溃不丢），fsync 按 sync_interval 秒或 JOURNAL_SYNC_EVERY
+    条攒批。txt 只在累计 compact_every 条或收尾时压实一次：先用 save_entries
+    原子替换 txt，再原子重置日志。两步之间崩溃时，旧日志与新 txt 指纹不符，
+    续跑时整个忽略，不会误删行。
 
-def run_concurrent(args, proxies, failure_paths):
-    """并发路径：子线程下载到内存，主线程按任务序号立即正式落盘。"""
-    all_lines = load_entries(args.txt)
-    tasks = [
-        (order, i, s)
-        for order, (i, s) in enumerate(
-            ((i, s) for i, s in enumerate(all_lines) if is_url(s)),
-            start=1,
-        )
-    ]
-    total = len(tasks)
-    failure_counts = {failure_type: 0 for failure_type in FAILURE_TYPES}
-    if total == 0:
-        return 0, failure_counts
-
-    done = set()               # 已处理完（成功/放弃）的行索引，用于从 txt 移除
-    stop_event = threading.Event()
-    meta = {}                  # future -> (任务顺序, 行索引, url)
-    task_iter = iter(tasks)
-    dirty = False              # 上次写回后是否有新完成的条目
-    last_save = time.monotonic()
-
-    def rewrite():
-        # 未完成的 URL 行 + 全部非 URL 行按原顺序写回；只有主线程会调用
-        save_entries(args.txt, [s for i, s in enumerate(all_lines) if i not in done])
-
-    def flush(force=False):
-        # 攒批写回进度：平时按 --save-interval 节流，中断/收尾时强制执行。
-        # 写回失败不致命——进度仍在内存（done 集合）里，下一轮会再试。
-        nonlocal dirty, last_save
-        if not dirty:
-            return
-        if not force and time.monotonic() - last_save < args.save_interval:
+    调用方始终使用 open() 返回的条目下标，压实后的行号换算在内部完成。
+    """
+
+    def __init__(self, txt_path, sync_interval, compact_every):
+        self.txt_path = txt_path
+        self.path = txt_path + JOURNAL_SUFFIX
+        self.sync_interval = sync_interval
+        self.compact_every = compact_every
+        self.entries = []
+        self.live = []        # 当前 txt 各行对应的条目下标（升序）
+        self.done = set()     # 上次压实以来处理完的条目下标
+        self.compact_at = compact_every
+        self.file = None
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def open(self):
+        """读取 txt 并套用匹配的旧日志，返回 (条目列表, 已处理完的下标集合)。"""
+        self.entries = load_entries(self.txt_path)
+        self.live = list(range(len(self.entries)))
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                header = f.readline().strip()
+                if header == f"# {entries_fingerprint(self.entries)}":
+                    for line in f:
+                        if not line.endswith("\n"):
+                            break  # 崩溃时只写了一半的末行
+                        try:
+                            i = int(line)
+                        except ValueError:
+                            continue
+                        if 0 <= i < len(self.entries):
+                            self.done.add(i)
+                else:
+                    logger.warning(
+                        "进度日志 %s 与当前 txt 不匹配（txt 已压实或被改动），忽略",
+                        self.path,
+                    )
+        except FileNotFoundError:
+            pass
+        if self.done:
+            logger.info("从进度日志 %s 恢复: 已处理 %d 条", self.path, len(self.done))
+        # 重写一份干净的日志，顺带丢掉可能残缺的末行
+        self._reset(self.done)
+        return self.entries, set(self.done)
+
+    def _reset(self, done):
+        if self.file is not None:
+            self.file.close()
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(f"# {entries_fingerprint(self.entries[i] for i in self.live)}\n")
+            f.writelines(f"{bisect.bisect_left(self.live, i)}\n" for i in sorted(done))
+            f.flush()
+            os.fsync(f.fileno())
+        replace_with_retry(tmp, self.path)
+        self.file = open(self.path, "a", encoding="utf-8")
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def record(self, index):
+        """记下一条已处理完（成功或放弃）的条目；必要时 fsync 或压实。"""
+        self.done.add(index)
+        self.file.write(f"{bisect.bisect_left(self.live, index)}\n")
+        self.file.flush()
+        self.unsynced += 1
+        if len(self.done) >= self.compact_at:
+            self.compact()
+        else:
+            self.sync()
+
+    def sync(self, force=False):
+        if not self.unsynced:
             return
+        if (
+            force
+            or self.unsynced >= JOURNAL_SYNC_EVERY
+            or time.monotonic() - self.last_sync >= self.sync_interval
+        ):
+            os.fsync(self.file.fileno())
+            self.unsynced = 0
+            self.last_sync = time.monotonic()
+
+    def compact(self, final=False):
+        """把已处理的条目从 txt 里真正删掉。成功返回 True。
+
+        写回失败不致命：日志仍然有效，进度不丢，过一批再试（final 时留给下次重跑）。
+        """
+        self.sync(force=True)
+        if not self.done:
+            return True
+        live = [i for i in self.live if i not in self.done]
         try:
-            rewrite()
+            save_entries(self.txt_path, [self.entries[i] for i in live])
         except PermissionError as e:
-            if force:
+            if final:
                 logger.error(
-                    "进度写回 %s 失败: %s；完整剩余清单已写入 %s.tmp，"
-                    "可手动改名替换后再续跑", args.txt, e, args.txt,
+                    "进度写回 %s 失败: %s；进度仍记在 %s，重跑即可续传",
+                    self.txt_path, e, self.path,
                 )
             else:
                 logger.warning(
-                    "进度写回 %s 失败: %s；进度仍在内存中，稍后自动重试",
-                    args.txt, e,
+                    "进度写回 %s 失败: %s；进度仍记在日志中，稍后自动重试",
+                    self.txt_path, e,
                 )
+                self.compact_at = len(self.done) + self.compact_every
+            return False
+        self.live = live
+        self.done = set()
+        self.compact_at = self.compact_every
+        self._reset(self.done)
+        return True
+
+    def close(self):
+        """收尾：压实进 txt；成功则日志已无用，直接删掉。"""
+        if self.file is None:
             return
-        dirty = False
-        last_save = time.monotonic()
+        compacted = self.compact(final=True)
+        self.file.close()
+        self.file = None
+        if compacted:
+            os.remove(self.path)
+
+
+class DownloadList:
+    """一份 URL 清单在本次运行中的状态：进度日志、失败清单、输出目录与计数。"""
+
+    def __init__(self, txt_path, output_dir, args, name=""):
+        self.txt = txt_path
+        self.output_dir = output_dir
+        self.name = name
+        self.journal = ProgressJournal(txt_path, args.save_interval, args.compact_every)
+        self.failure_paths = make_failure_paths(txt_path)
+        self.ok = 0
+        self.failure_counts = {failure_type: 0 for failure_type in FAILURE_TYPES}
+
+
+def run_serial(args, session, dl, sequence, index=None):
+    """串行路径：按 txt 顺序逐个下载 URL，每处理完一个记入进度日志；结果计入 dl。"""
+    lines, done = dl.journal.open()
+    try:
+        for idx, url in enumerate(lines):
+            # 非 URL 行跳过、原样留在文件里
+            if idx in done or not is_url(url):
+                continue
+
+            logger.info("[%d] 下载: %s", dl.ok + sum(dl.failure_counts.values()) + 1, url)
+            path, failure_type = download(
+                url,
+                dl.output_dir,
+                session,
+                args.timeout,
+                args.retry_wait,
+                args.max_retries,
+                sequence,
+                index,
+            )
+
+            if path is not None:
+                dl.ok += 1
+                logger.info("      已保存 -> %s", path)
+            else:
+                failure_type, failure_path = append_failure(
+                    url, failure_type, dl.failure_paths
+                )
+                dl.failure_counts[failure_type] += 1
+                logger.error(
+                    "      下载失败并放弃，归类为%s并记入 %s",
+                    FAILURE_LABELS[failure_type], failure_path,
+                )
+
+            dl.journal.record(idx)
+    finally:
+        dl.journal.close()
+
+
+def run_concurrent(args, session, lists, index=None):
+    """并发路径：子线程（或 asyncio 引擎）下载到 .part，主线程按任务序号立即改名为正式文件。
+
+    子线程每次只尝试一次；重试由主线程按时间排进 retry_heap，等待期间不占
+    并发名额。待发任务按清单、主机分队列，由 HostScheduler 轮转派发；多份
+    清单共用同一个下载池、并发上限与按主机的限额。结果计入各 DownloadList。
+    """
+    scheduler = HostScheduler(
+        min(args.per_host or args.concurrency, args.concurrency),
+        args.host_rate,
+        args.max_host_rate,
+    )
+    total = 0
+    try:
+        for lane, dl in enumerate(lists):
+            all_lines, done = dl.journal.open()
+            urls = [(i, s) for i, s in enumerate(all_lines) if i not in done and is_url(s)]
+            occurrences = {}
+            for order, (i, url) in enumerate(urls, start=1):
+                occurrence = occurrences[url] = occurrences.get(url, -1) + 1
+                part_path = make_part_path(url, dl.output_dir, occurrence)
+                scheduler.add([order, i, url, 0, part_path, lane])
+            total += len(urls)
+    except BaseException:
+        for dl in lists:
+            dl.journal.close()
+        raise
+    if total == 0:
+        for dl in lists:
+            dl.journal.close()
+        return
+
+    meta = {}                  # future -> [任务顺序, 行索引, url, 已尝试次数, .part 路径, 清单序号]
+    retry_heap = []            # (可重试时间, 清单序号, 任务顺序, 任务)
 
     def short(u):
         return u if len(u) <= 48 else u[:45] + "..."
 
-    def submit_next(ex):
-        try:
-            order, i, url = next(task_iter)
-        except StopIteration:
-            return None
-        fut = ex.submit(
-            download_with_retry,
-            url, proxies, args.timeout, args.retry_wait,
-            args.max_retries, stop_event, f"<{short(url)}> ",
+    if args.engine == "asyncio":
+        fetcher = AsyncFetcher(args.proxy, args.concurrency, args.timeout)
+        submit = fetcher.submit
+        close_engine = fetcher.close
+    else:
+        ex = ThreadPoolExecutor(max_workers=args.concurrency)
+
+        def submit(url, part_path):
+            return ex.submit(fetch_attempt, url, session, args.timeout, part_path)
+
+        close_engine = ex.shutdown
+
+    if len(lists) > 1:
+        logger.info("共 %d 份清单、%d 个 URL，分布在 %d 个主机", len(lists), total, len(scheduler.hosts))
+    else:
+        logger.info("共 %d 个 URL，分布在 %d 个主机", total, len(scheduler.hosts))
+
+    def give_up(dl, url, failure_type):
+        nonlocal finished
+        finished += 1
+        failure_type, failure_path = append_failure(url, failure_type, dl.failure_paths)
+        dl.failure_counts[failure_type] += 1
+        logger.error(
+            "[%d/%d] %s放弃 %s（%s，已记入 %s）",
+            finished, total, dl.name, url,
+            FAILURE_LABELS[failure_type],
+            os.path.basename(failure_path),
         )
-        meta[fut] = (order, i, url)
-        return fut
-
-    ok = failed = 0
-    with ThreadPoolExecutor(max_workers=args.concurrency) as ex:
-        # 预填充滑动窗口：在途任务维持在并发数量级，避免一次性提交撑爆内存
-        inflight = set()
-        for _ in range(args.concurrency):
-            fut = submit_next(ex)
-            if fut is None:
-                break
-            inflight.add(fut)
 
-        try:
-            while inflight:
-                done_set, inflight = wait(inflight, return_when=FIRST_COMPLETED)
-                inflight = set(inflight)
-                for fut in done_set:
-                    order, i, url = meta.pop(fut)
-                    ct, data, failure_type = fut.result()
-
-                    nf = submit_next(ex)  # 补充一个新任务，维持窗口
-                    if nf is not None:
-                        inflight.add(nf)
-
-                    if data is not None:
-                        # order 在提交时已按 TXT 中的 URL 顺序固定，无需等待前序任务
-                        final = make_filename(url, args.output_dir, order, ct)
-                        with open(final, "wb") as f:
-                            f.write(data)
-                        ok += 1
-                        done.add(i)
-                        logger.info("[%d/%d] 已保存 %s -> %s",
-                                    ok + failed, total, url, os.path.basename(final))
-                    else:
-                        failed += 1
-                        done.add(i)
-                        failure_type, failure_path = append_failure(
-                            url, failure_type, failure_paths
-                        )
-                        failure_counts[failure_type] += 1
+    finished = 0
+    inflight = set()
+    try:
+        while inflight or retry_heap or scheduler.pending():
+            now = time.monotonic()
+            while retry_heap and retry_heap[0][0] <= now:
+                scheduler.add(heapq.heappop(retry_heap)[3], front=True)
+
+            # 把窗口填满：只派发当前真正能发出去的请求
+            while len(inflight) < args.concurrency:
+                task = scheduler.next_task(now)
+                if task is None:
+                    break
+                task[3] += 1
+                fut = submit(task[2], task[4])
+                meta[fut] = task
+                inflight.add(fut)
+
+            # 等到有请求完成，或下一个重试/令牌就绪
+            timeouts = [1.0]
+            if retry_heap:
+                timeouts.append(retry_heap[0][0] - now)
+            ready_in = scheduler.next_ready_in(now)
+            if ready_in is not None:
+                timeouts.append(ready_in)
+            timeout = max(min(timeouts), 0.01)
+            if not inflight:
+                time.sleep(timeout)
+                continue
+            done_set, inflight = wait(inflight, timeout=timeout, return_when=FIRST_COMPLETED)
+            inflight = set(inflight)
+
+            now = time.monotonic()
+            for fut in done_set:
+                task = meta.pop(fut)
+                order, i, url, attempt, part_path, lane = task
+                dl = lists[lane]
+                ct, part, digest, error = fut.result()
+                scheduler.on_done(url, error, now)
+
+                if part is not None:
+                    # order 在提交时已按 TXT 中的 URL 顺序固定，无需等待前序任务
+                    final = make_filename(url, dl.output_dir, order, ct)
+                    final = store_part(part, digest, final, index)
+                    dl.ok += 1
+                    finished += 1
+                    logger.info("[%d/%d] %s已保存 %s -> %s",
+                                finished, total, dl.name, url, os.path.basename(final))
+                else:
+                    failure_type = classify_failure(error)
+                    tag = f"{dl.name}<{short(url)}> "
+                    if failure_type == "404":
+                        logger.error("%s收到 HTTP 404，不再重试并放弃: %s", tag, error)
+                    elif args.max_retries and attempt >= args.max_retries:
                         logger.error(
-                            "[%d/%d] 放弃 %s（%s，已记入 %s）",
-                            ok + failed, total, url,
-                            FAILURE_LABELS[failure_type],
-                            os.path.basename(failure_path),
+                            "%s已重试 %d 次仍失败，归类为%s并放弃: %s",
+                            tag, attempt, FAILURE_LABELS[failure_type], error,
                         )
+                    else:
+                        logger.warning("%s[重试 %d] 失败: %s", tag, attempt, error)
+                        heapq.heappush(retry_heap, (now + args.retry_wait, lane, order, task))
+                        continue
+                    discard_part(part_path)
+                    give_up(dl, url, failure_type)
 
-                    dirty = True
-                    flush()  # 攒批写回：距上次落盘超过 --save-interval 才真正重写 txt
-        except KeyboardInterrupt:
-            # 叫停所有子线程，把已完成的进度落盘后向上抛出，交给 main 统一收尾
-            stop_event.set()
-            logger.warning("正在停止（等待进行中的下载收尾）...")
-            flush(force=True)
-            raise
-
-    flush(force=True)
-    return ok, failure_counts
+                dl.journal.record(i)
+    except KeyboardInterrupt:
+        # 不再派发新请求，等进行中的下载收尾后向上抛出，交给 main 统一收尾
+        logger.warning("正在停止（等待进行中的下载收尾）...")
+        raise
+    finally:
+        close_engine()
+        for dl in lists:
+            dl.journal.close()
 
 
 def main():
     args = parse_args()
     setup_logging(args.log_file)
 
-    if not os.path.isfile(args.txt):
+    txt_paths, batch = find_lists(args.txt)
+    if not txt_paths:
         logger.error("找不到文件: %s", args.txt)
         sys.exit(1)
+    if batch:
+        # 每份清单下载到输出目录下以清单名命名的子目录
+        names = [os.path.splitext(os.path.basename(p))[0] for p in txt_paths]
+        clashes = sorted({n for n in names if names.count(n) > 1})
+        if clashes:
+            logger.error("批量模式下清单文件名重复，无法分配输出子目录: %s", "、".join(clashes))
+            sys.exit(1)
+        lists = [
+            DownloadList(p, os.path.join(args.output_dir, n), args, f"[{n}] ")
+            for p, n in zip(txt_paths, names)
+        ]
+    else:
+        lists = [DownloadList(args.txt, args.output_dir, args)]
 
     # 空字符串表示不走代理
     proxies = {"http": args.proxy, "https": args.proxy} if args.proxy else None
 
-    os.makedirs(args.output_dir, exist_ok=True)
+    if args.save_interval < 0 or args.compact_every < 1:
+        logger.error("--save-interval 不能为负，--compact-every 至少为 1")
+        sys.exit(1)
+    if args.per_host < 0 or args.host_rate <= 0 or args.max_host_rate < args.host_rate:
+        logger.error("--per-host 不能为负，--host-rate 须大于 0 且不超过 --max-host-rate")
+        sys.exit(1)
+    if args.engine == "asyncio":
+        if aiohttp is None:
+            logger.error("--engine asyncio 需要 aiohttp，请先安装: pip install aiohttp")
+            sys.exit(1)
+        if args.proxy and not args.proxy.startswith("http://"):
+            logger.error("--engine asyncio 只支持 http:// 代理: %s", args.proxy)
+            sys.exit(1)
+
+    for dl in lists:
+        os.makedirs(os.path.join(dl.output_dir, PART_DIR_NAME), exist_ok=True)
     logger.info("输出目录: %s", os.path.abspath(args.output_dir))
-    if args.concurrency > 1:
-        logger.info("并发数: %d", args.concurrency)
-    failure_paths = make_failure_paths(args.txt)
+    if batch:
+        logger.info("批量模式: %d 份清单共用一个下载池", len(lists))
+    # 批量模式总是走并发路径，-j 1 时也由同一个调度器在各清单间轮转
+    concurrent_mode = batch or args.concurrency > 1 or args.engine == "asyncio"
+    if concurrent_mode:
+        logger.info("并发数: %d（引擎: %s）", args.concurrency, args.engine)
+    session = make_session(proxies, args.concurrency)
     sequence = count(1)
+    index = DigestIndex(args.output_dir, args.dedup) if args.dedup != "off" else None
 
-    ok = 0
-    failure_counts = {failure_type: 0 for failure_type in FAILURE_TYPES}
     interrupted = False
     try:
-        if args.concurrency > 1:
-            ok, failure_counts = run_concurrent(args, proxies, failure_paths)
+        if concurrent_mode:
+            run_concurrent(args, session, lists, index)
         else:
-            ok, failure_counts = run_serial(
-                args, proxies, failure_paths, sequence
-            )
+            run_serial(args, session, lists[0], sequence, index)
     except KeyboardInterrupt:
         interrupted = True
         logger.warning("已中断，未下载的 URL 仍保留在 txt 中，重跑即可续传。")
+    finally:
+        session.close()
+        if index is not None:
+            index.close()
 
     if interrupted:
         sys.exit(130)
 
-    leftover = load_entries(args.txt)
-    failed = sum(failure_counts.values())
-    parts = [f"成功 {ok} 个，保存在: {os.path.abspath(args.output_dir)}"]
-    if failed:
-        details = [
-            f"{FAILURE_LABELS[failure_type]} {count} 个: "
-            f"{failure_paths[failure_type]}"
-            for failure_type, count in failure_counts.items()
-            if count
-        ]
-        parts.append(f"失败 {failed} 个（{'；'.join(details)}）")
-    if leftover:
-        parts.append(f"另有 {len(leftover)} 行非 URL 内容原样保留在 {args.txt}")
-    logger.info("全部完成，%s", "；".join(parts))
+    for dl in lists:
+        leftover = load_entries(dl.txt)
+        failed = sum(dl.failure_counts.values())
+        parts = [f"成功 {dl.ok} 个，保存在: {os.path.abspath(dl.output_dir)}"]
+        if failed:
+            details = [
+                f"{FAILURE_LABELS[failure_type]} {count} 个: "
+                f"{dl.failure_paths[failure_type]}"
+                for failure_type, count in dl.failure_counts.items()
+                if count
+            ]
+            parts.append(f"失败 {failed} 个（{'；'.join(details)}）")
+        if leftover:
+            parts.append(f"另有 {len(leftover)} 行非 URL 内容原样保留在 {dl.txt}")
+        logger.info("%s%s，%s", dl.name, "已完成" if batch else "全部完成", "；".join(parts))
+    if batch:
+        logger.info(
+            "全部完成，%d 份清单共成功 %d 个，失败 %d 个",
+            len(lists),
+            sum(dl.ok for dl in lists),
+            sum(sum(dl.failure_counts.values()) for dl in lists),
+        )
+    if index is not None and index.duplicates:
+        logger.info(
+            "内容重复 %d 个（已%s），节省 %.1f MiB",
+            index.duplicates,
+            "硬链接" if args.dedup == "link" else "跳过",
+            index.saved_bytes / 1024 / 1024,
+        )
 
 
 if __name__ == "__main__":
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# /// script
+# requires-python = ">=3.8"
+# dependencies = ["requests"]
+# ///
+"""
+download_images 连接复用基准
+
+在本机起一个替身 HTTP 服务（ThreadingHTTPServer，返回固定大小的假图片），
+分别用三种方式下载同一批 URL，对比耗时与服务端实际接受的 TCP 连接数：
+
+- bare：每个 URL 一次裸 requests.get（引入连接池之前的做法）
+- session：download_images 的共享 Session + 按主机连接池
+- asyncio：download_images 的 aiohttp 引擎（未安装 aiohttp 时跳过）
+
+服务端分别以 keep-alive（HTTP/1.1）和短连接（HTTP/1.0）两种模式运行。
+每个新连接会先等待 --connect-delay 毫秒，模拟经代理建立 TCP/TLS 的开销。
+"""
+
+import argparse
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+import download_images as di
+
+
+class CountingServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address, handler, connect_delay):
+        super().__init__(address, handler)
+        self.connect_delay = connect_delay
+        self.connections = 0
+        self.lock = threading.Lock()
+
+    def process_request(self, request, client_address):
+        with self.lock:
+            self.connections += 1
+        super().process_request(request, client_address)
+
+
+def make_handler(keep_alive, payload):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1" if keep_alive else "HTTP/1.0"
+
+        def setup(self):
+            super().setup()
+            time.sleep(self.server.connect_delay)  # type: ignore[attr-defined]
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def _drain(part_path):
+    """基准只关心传输：量完大小就删掉 .part。"""
+    if part_path is None:
+        return 0
+    size = os.path.getsize(part_path)
+    di.discard_part(part_path)
+    return size
+
+
+def run_bare(urls, concurrency, timeout, part_dir):
+    def fetch(url):
+        with requests.get(url, headers=di.HEADERS, timeout=timeout) as r:
+            r.raise_for_status()
+            return len(r.content)
+
+    with ThreadPoolExecutor(concurrency) as ex:
+        return sum(ex.map(fetch, urls))
+
+
+def run_session(urls, concurrency, timeout, part_dir):
+    session = di.make_session(None, concurrency)
+    try:
+        with ThreadPoolExecutor(concurrency) as ex:
+            results = ex.map(
+                lambda u: _drain(di.fetch_attempt(u, session, timeout, di.make_part_path(u, part_dir))[1]),
+                urls,
+            )
+            return sum(results)
+    finally:
+        session.close()
+
+
+def run_asyncio(urls, concurrency, timeout, part_dir):
+    fetcher = di.AsyncFetcher(None, concurrency, timeout)
+    try:
+        futures = [fetcher.submit(u, di.make_part_path(u, part_dir)) for u in urls]
+        return sum(_drain(f.result()[1]) for f in futures)
+    finally:
+        fetcher.close()
+
+
+MODES = {"bare": run_bare, "session": run_session, "asyncio": run_asyncio}
+
+
+def bench_one(mode, keep_alive, args, payload):
+    server = CountingServer(
+        ("127.0.0.1", 0), make_handler(keep_alive, payload), args.connect_delay / 1000
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    host, port = server.server_address[:2]
+    urls = [f"http://{host}:{port}/img/{i}.jpg" for i in range(args.requests)]
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            os.makedirs(os.path.join(tmp, di.PART_DIR_NAME))
+            t = time.perf_counter()
+            total_bytes = MODES[mode](urls, args.concurrency, args.timeout, tmp)
+            elapsed = time.perf_counter() - t
+    finally:
+        server.shutdown()
+        server.server_close()
+    return elapsed, total_bytes, server.connections
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="在本机替身服务器上对比 download_images 各下载方式的连接复用效果",
+    )
+    parser.add_argument("-n", "--requests", type=int, default=2000, help="请求数（默认: %(default)s）")
+    parser.add_argument("-j", "--concurrency", type=int, default=16, help="并发数（默认: %(default)s）")
+    parser.add_argument("--size", type=int, default=64 * 1024, help="每张假图片的字节数（默认: %(default)s）")
+    parser.add_argument(
+        "--connect-delay", type=float, default=20,
+        help="每个新连接的模拟建连耗时，毫秒（默认: %(default)s）",
+    )
+    parser.add_argument("--timeout", type=float, default=30, help="请求超时，秒（默认: %(default)s）")
+    parser.add_argument(
+        "--modes", nargs="+", choices=list(MODES), default=list(MODES),
+        help="要测的下载方式（默认全部）",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    payload = b"\xff" * args.size
+    modes = [m for m in args.modes if m != "asyncio" or di.aiohttp is not None]
+    if len(modes) < len(args.modes):
+        print("未安装 aiohttp，跳过 asyncio")
+
+    print(f"{'方式':<10}{'服务端':<12}{'耗时(s)':>10}{'请求/s':>10}{'MiB/s':>10}{'连接数':>8}")
+    for keep_alive in (True, False):
+        for mode in modes:
+            elapsed, total_bytes, connections = bench_one(mode, keep_alive, args, payload)
+            print(
+                f"{mode:<10}{'keep-alive' if keep_alive else 'close':<12}"
+                f"{elapsed:>10.2f}{args.requests / elapsed:>10.0f}"
+                f"{total_bytes / 1024 / 1024 / elapsed:>10.1f}{connections:>8}"
+            )
+
+
+if __name__ == "__main__":
+    main()
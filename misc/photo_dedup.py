@@ -1,32 +1,62 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
-照片查重器：按文件内容 MD5 精确查重，递归扫描，重复项软删除（移动到指定目录）。
+照片查重器：按文件内容哈希（默认 MD5）精确查重，递归扫描，重复项软删除（移动到指定目录）。
 
 规则：
-1. 只有字节内容完全相同的图片才算重复（MD5）
+1. 只有字节内容完全相同的图片才算重复（MD5，或 --hash 指定的算法）
 2. 递归扫描指定目录下所有图片（跨子目录）
-3. 每组重复只保留第一张，其余移动到软删除目录
+3. 每组重复只保留第一张，其余移动到软删除目录（或用 --link 替换为硬链接/reflink）
+4. 每个动作都记入操作日志，可用 --undo 回滚
 
-效率策略（仍保证最终结果 = 全文件 MD5 一致）：
+效率策略（仍保证最终结果 = 全文件哈希一致）：
 - os.scandir 递归扫描，扫描时顺带取 size（少一次 stat）
 - 体积唯一的文件直接跳过
 - 同体积先算「头+尾采样哈希」预筛，筛掉绝大部分非重复
 - 小文件采样即等于全量 MD5，无需二遍读取
 - 剩余候选多线程并行计算全量 MD5
+- 读盘按设备（st_dev）分组：同一设备内按 inode（取不到时按路径）顺序读、并发数单独限制，
+  避免机械盘来回寻道、NAS 共享超出并发；全量 MD5 用大块顺序读
+- 大文件的全量哈希走 mmap，直接从页缓存喂给哈希函数，不产生 Python 层拷贝
+- --hash 可改用 blake2b / xxh3（需 xxhash），auto 则先做微基准选本机最快的
+- 采样/全量哈希持久化到用户缓存目录下的 SQLite 缓存（键为 设备+inode，取不到 inode 时为路径；
+  size/mtime_ns 变化即失效），重复运行时未变化的文件只需扫描、不再读盘；
+  --list-only / --dry-run 默认只读缓存，不往任何地方写文件
+
+可选感知哈希模式（--perceptual dhash/phash，需要 Pillow）：
+- 找出重新编码、缩放、另存为后的近似重复
+- 借助 PIL draft 在解码阶段就缩小，多进程并行计算哈希
+- BK-tree 按汉明距离检索候选（非两两比较），并查集合并成组
 """
 
 from __future__ import annotations
 
 import argparse
 import hashlib
+import json
+import math
+import mmap
 import os
+import queue
 import shutil
+import sqlite3
 import sys
+import threading
 import time
-from collections import defaultdict
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait
 from pathlib import Path
+from typing import NamedTuple
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
 
 # 常见图片扩展名（小写，比较时统一 lower）
 IMAGE_EXTENSIONS = {
@@ -50,9 +80,28 @@ IMAGE_EXTENSIONS = {
 }
 
 DEFAULT_TRASH_DIR_NAME = "_photo_duplicates_trash"
-CHUNK_SIZE = 1024 * 1024  # 全量 MD5 读块：1 MiB
+CACHE_FILE_NAME = "hash_cache.sqlite3"
+DEFAULT_JOURNAL_NAME = ".photo_dedup_journal.jsonl"
+LINK_MODES = ("hard", "reflink")
+CHUNK_SIZE = 4 * 1024 * 1024  # 全量 MD5 读块：4 MiB，大块顺序读对机械盘/NAS 更友好
 SAMPLE_SIZE = 64 * 1024  # 预筛采样：头/尾各 64 KiB
+MMAP_THRESHOLD = 32 * 1024 * 1024  # 不小于此大小的文件全量哈希走 mmap
 PROGRESS_BAR_WIDTH = 30
+HASH_ALGOS = ("md5", "blake2b", "xxh3")
+BENCHMARK_SIZE = 64 * 1024 * 1024  # --hash auto 时每种算法的测试数据量
+DEFAULT_PER_DEVICE_WORKERS = 4
+DEFAULT_SCAN_WORKERS = 16  # 列目录以等待 I/O 为主（尤其 NAS），线程数可以远高于 CPU 核数
+PERCEPTUAL_METHODS = ("dhash", "phash")
+DEFAULT_PERCEPTUAL_THRESHOLD = 8  # 64 位哈希的最大汉明距离
+PHASH_SIZE = 32  # pHash 先缩到 32x32 再取 DCT 左上 8x8
+
+
+class ImageEntry(NamedTuple):
+    path: str
+    size: int
+    dev: int
+    ino: int
+    mtime_ns: int
 
 
 def _md5() -> hashlib._Hash:
@@ -63,6 +112,40 @@ def _md5() -> hashlib._Hash:
         return hashlib.md5()
 
 
+def available_hash_algos() -> list[str]:
+    return [a for a in HASH_ALGOS if a != "xxh3" or xxhash is not None]
+
+
+def new_hasher(algo: str = "md5"):
+    """返回一个支持 update()/hexdigest() 的哈希对象；摘要都是 128 位，与 MD5 长度一致。"""
+    if algo == "md5":
+        return _md5()
+    if algo == "blake2b":
+        return hashlib.blake2b(digest_size=16)
+    if algo == "xxh3":
+        if xxhash is None:
+            raise ValueError("xxh3 需要安装 xxhash: pip install xxhash")
+        return xxhash.xxh3_128()
+    raise ValueError(f"未知的哈希算法: {algo}")
+
+
+def pick_fastest_hash() -> str:
+    """微基准：对同一块内存数据逐个算法计时，返回本机吞吐最高的算法。"""
+    block = os.urandom(CHUNK_SIZE)
+    view = memoryview(block)
+    best, best_speed = "md5", 0.0
+    for algo in available_hash_algos():
+        hasher = new_hasher(algo)
+        t = time.perf_counter()
+        for _ in range(BENCHMARK_SIZE // CHUNK_SIZE):
+            hasher.update(view)
+        speed = BENCHMARK_SIZE / 1024 / 1024 / max(time.perf_counter() - t, 1e-9)
+        print(f"  {algo:8s} {speed:8.0f} MiB/s")
+        if speed > best_speed:
+            best, best_speed = algo, speed
+    return best
+
+
 def is_image_filename(name: str) -> bool:
     dot = name.rfind(".")
     if dot < 0:
@@ -129,6 +212,7 @@ class ProgressBar:
             line = (
                 f"\r{self.desc} {spinner} "
                 f"已处理 {self.current} "
+                f"{self.current / elapsed:.1f} it/s "
                 f"耗时 {self._fmt_time(elapsed)}"
             )
 
@@ -157,41 +241,154 @@ class ProgressBar:
         return f"{m:02d}:{s:02d}"
 
 
-def compute_full_md5(path: str) -> str:
-    """全文件 MD5（最终判定依据）。"""
-    md5 = _md5()
-    with open(path, "rb") as f:
+def compute_full_hash(path: str, algo: str = "md5") -> str:
+    """
+    全文件哈希（最终判定依据）。
+    大文件 mmap 后按 memoryview 切片直接送进哈希函数（不拷贝）；其余用复用缓冲区 readinto 顺序读。
+    """
+    hasher = new_hasher(algo)
+    with open(path, "rb", buffering=0) as f:
+        size = os.fstat(f.fileno()).st_size
+        if size >= MMAP_THRESHOLD:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                if hasattr(mm, "madvise"):
+                    mm.madvise(mmap.MADV_SEQUENTIAL)
+                with memoryview(mm) as view:
+                    for offset in range(0, size, CHUNK_SIZE):
+                        hasher.update(view[offset : offset + CHUNK_SIZE])
+            return hasher.hexdigest()
+
+        if hasattr(os, "posix_fadvise"):
+            # 提示内核按顺序预读
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        buf = bytearray(CHUNK_SIZE)
+        view = memoryview(buf)
         while True:
-            chunk = f.read(CHUNK_SIZE)
-            if not chunk:
+            n = f.readinto(buf)
+            if not n:
                 break
-            md5.update(chunk)
-    return md5.hexdigest()
+            hasher.update(view[:n])
+    return hasher.hexdigest()
+
+
+def compute_full_md5(path: str) -> str:
+    """全文件 MD5。"""
+    return compute_full_hash(path, "md5")
 
 
-def compute_sample_hash(path: str, size: int) -> tuple[str, bool]:
+def compute_sample_hash(path: str, size: int, algo: str = "md5") -> tuple[str, bool]:
     """
     采样哈希用于预筛。
     返回 (hex_digest, is_full_content)：
-    - 小文件（整文件已被采样读完）→ is_full_content=True，可直接当最终 MD5
-    - 大文件只读头/尾 → is_full_content=False，碰撞后再全量 MD5
+    - 小文件（整文件已被采样读完）→ is_full_content=True，可直接当最终哈希
+    - 大文件只读头/尾 → is_full_content=False，碰撞后再算全量哈希
     """
-    md5 = _md5()
+    hasher = new_hasher(algo)
     with open(path, "rb") as f:
         if size <= SAMPLE_SIZE:
-            md5.update(f.read(size))
-            return md5.hexdigest(), True
+            hasher.update(f.read(size))
+            return hasher.hexdigest(), True
 
         if size <= SAMPLE_SIZE * 2:
-            # 整文件两次读完，结果仍是完整 MD5
-            md5.update(f.read())
-            return md5.hexdigest(), True
+            # 整文件两次读完，结果仍是完整哈希
+            hasher.update(f.read())
+            return hasher.hexdigest(), True
 
-        # 大文件：头 + 尾 各 SAMPLE_SIZE（仅用于预筛，不是完整 MD5）
-        md5.update(f.read(SAMPLE_SIZE))
+        # 大文件：头 + 尾 各 SAMPLE_SIZE（仅用于预筛，不是完整哈希）
+        hasher.update(f.read(SAMPLE_SIZE))
         f.seek(size - SAMPLE_SIZE)
-        md5.update(f.read(SAMPLE_SIZE))
-        return md5.hexdigest(), False
+        hasher.update(f.read(SAMPLE_SIZE))
+        return hasher.hexdigest(), False
+
+
+def default_cache_path() -> Path:
+    """用户级缓存目录下的哈希缓存：Windows 为 %LOCALAPPDATA%\\photo_dedup，其他系统为 $XDG_CACHE_HOME（默认 ~/.cache）/photo_dedup。"""
+    if sys.platform == "win32" and os.environ.get("LOCALAPPDATA"):
+        base = Path(os.environ["LOCALAPPDATA"])
+    else:
+        base = Path(os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache")
+    return base / "photo_dedup" / CACHE_FILE_NAME
+
+
+def cache_key(entry: ImageEntry) -> str:
+    """缓存键：有 inode 时为 设备:inode（改名/移动后仍命中）；Windows 下 scandir 不给 inode，改用路径。"""
+    if entry.ino:
+        return f"{entry.dev}:{entry.ino}"
+    return "path:" + os.path.normcase(entry.path)
+
+
+class HashCache:
+    """
+    跨运行的哈希缓存（SQLite）。
+    以 cache_key 定位文件，size、mtime_ns 与哈希算法都一致才算命中；
+    只在主线程读写，写入按批提交。
+    用默认的回滚日志而不是 WAL：缓存文件可能放在 SMB/NAS 共享上，那里 WAL 的共享内存不可靠。
+    read_only 时只查不写（--list-only / --dry-run），文件须已存在。
+    """
+
+    def __init__(self, path: Path, algo: str = "md5", read_only: bool = False) -> None:
+        self.path = path
+        self.algo = algo
+        self.read_only = read_only
+        if read_only:
+            self.conn = sqlite3.connect(f"{path.resolve().as_uri()}?mode=ro", uri=True)
+            tables = {row[0] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            self.usable = "file_hashes" in tables
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(path))
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS file_hashes (
+                file_key TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                sample_digest TEXT NOT NULL,
+                sample_full INTEGER NOT NULL,
+                full_digest TEXT,
+                algo TEXT NOT NULL
+            )
+            """
+        )
+        # 旧版按 (dev, ino) 建表，Windows 上键不可靠；缓存丢了只是重新读盘，直接删掉
+        self.conn.execute("DROP TABLE IF EXISTS hashes")
+        self.conn.commit()
+        self.usable = True
+
+    def lookup(self, entry: ImageEntry) -> tuple[str, bool, str | None] | None:
+        """命中返回 (sample_digest, sample_full, full_digest)，未命中或已失效返回 None。"""
+        if not self.usable:
+            return None
+        row = self.conn.execute(
+            "SELECT sample_digest, sample_full, full_digest FROM file_hashes WHERE file_key = ? AND size = ? AND mtime_ns = ? AND algo = ?",
+            (cache_key(entry), entry.size, entry.mtime_ns, self.algo),
+        ).fetchone()
+        if row is None:
+            return None
+        return row[0], bool(row[1]), row[2]
+
+    def store_samples(self, rows: list[tuple[ImageEntry, str, bool]]) -> None:
+        if self.read_only:
+            return
+        # 采样重新计算说明旧记录已失效，全量哈希一并重置（小文件采样即全量）
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO file_hashes (file_key, size, mtime_ns, sample_digest, sample_full, full_digest, algo) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(cache_key(e), e.size, e.mtime_ns, digest, int(is_full), digest if is_full else None, self.algo) for e, digest, is_full in rows],
+            )
+
+    def store_full(self, rows: list[tuple[ImageEntry, str]]) -> None:
+        if self.read_only:
+            return
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE file_hashes SET full_digest = ? WHERE file_key = ? AND size = ? AND mtime_ns = ? AND algo = ?",
+                [(digest, cache_key(e), e.size, e.mtime_ns, self.algo) for e, digest in rows],
+            )
+
+    def close(self) -> None:
+        self.conn.close()
 
 
 def _is_under(path: str, parent: str) -> bool:
@@ -202,70 +399,165 @@ def _is_under(path: str, parent: str) -> bool:
     return path.startswith(prefix)
 
 
-def collect_images(root: Path, trash_dir: Path) -> list[tuple[str, int]]:
+def _scan_one_dir(current: str, trash_s: str, root_dev: int) -> tuple[list[str], list[ImageEntry], int]:
+    """列出单个目录：返回 (子目录, 命中的图片, 遍历项数)。打不开目录时抛 OSError。"""
+    subdirs: list[str] = []
+    images: list[ImageEntry] = []
+    scanned = 0
+    with os.scandir(current) as it:
+        for entry in it:
+            scanned += 1
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    p = entry.path
+                    if not _is_under(p, trash_s):
+                        subdirs.append(p)
+                    continue
+                if not entry.is_file(follow_symlinks=False):
+                    continue
+                name = entry.name
+                if not is_image_filename(name):
+                    continue
+                # DirEntry.stat 通常带缓存，比 Path.stat 更省
+                st = entry.stat(follow_symlinks=False)
+                images.append(
+                    ImageEntry(
+                        os.path.abspath(entry.path),
+                        st.st_size,
+                        st.st_dev or root_dev,
+                        st.st_ino,
+                        st.st_mtime_ns,
+                    )
+                )
+            except OSError:
+                continue
+    return subdirs, images, scanned
+
+
+def collect_images(root: Path, trash_dir: Path, workers: int = DEFAULT_SCAN_WORKERS) -> list[ImageEntry]:
     """
-    用 os.scandir 递归收集图片，并顺带记录 size。
-    返回 [(abspath, size), ...]，按路径排序。
+    用 os.scandir 递归收集图片，并顺带记录 size、设备号、inode、mtime_ns（供哈希缓存使用）。
+    NAS 上每列一次目录都是一次网络往返，因此用 workers 个线程从共享队列取目录并行列举，
+    新发现的子目录放回队列由空闲线程取走。
+    返回 [ImageEntry, ...]，按路径排序（与遍历顺序无关）。
     """
     root_s = os.path.abspath(str(root))
     trash_s = os.path.abspath(str(trash_dir))
-    images: list[tuple[str, int]] = []
-
-    bar = ProgressBar(total=0, desc="扫描文件")
+    # Windows 下 DirEntry.stat 的 st_dev/st_ino 恒为 0：设备号退回扫描根目录的；inode 留 0，
+    # 不调用 DirEntry.inode()（SMB 上每个文件多一次网络往返），缓存改按路径定位（见 cache_key）
+    root_dev = os.stat(root_s).st_dev
+    images: list[ImageEntry] = []
+
+    bar = ProgressBar(total=0, desc="扫描目录")
+    pending: queue.Queue = queue.Queue()
+    lock = threading.Lock()
+    # 已入队但尚未列完的目录数，降到 0 说明整棵树已遍历完
+    outstanding = 0
+    dirs_done = 0
     scanned = 0
-    stack = [root_s]
 
-    while stack:
-        current = stack.pop()
-        # 整棵软删除目录跳过
-        if _is_under(current, trash_s):
-            continue
-        try:
-            with os.scandir(current) as it:
-                for entry in it:
-                    scanned += 1
-                    if scanned % 50 == 0:
-                        bar.update(50)
-                    try:
-                        if entry.is_dir(follow_symlinks=False):
-                            p = entry.path
-                            if not _is_under(p, trash_s):
-                                stack.append(p)
-                            continue
-                        if not entry.is_file(follow_symlinks=False):
-                            continue
-                        name = entry.name
-                        if not is_image_filename(name):
-                            continue
-                        # DirEntry.stat 通常带缓存，比 Path.stat 更省
-                        size = entry.stat(follow_symlinks=False).st_size
-                        images.append((os.path.abspath(entry.path), size))
-                    except OSError:
-                        continue
-        except OSError as e:
-            sys.stdout.write("\n")
-            print(f"[警告] 无法打开目录，跳过: {current} ({e})", file=sys.stderr)
+    def _walker() -> None:
+        nonlocal outstanding, dirs_done, scanned
+        while True:
+            current = pending.get()
+            if current is None:
+                return
+            try:
+                subdirs, found, n = _scan_one_dir(current, trash_s, root_dev)
+            except OSError as e:
+                subdirs, found, n = [], [], 0
+                with lock:
+                    sys.stdout.write("\n")
+                    print(f"[警告] 无法打开目录，跳过: {current} ({e})", file=sys.stderr)
+            with lock:
+                # 先登记子目录再入队，避免其他线程提前把计数减到 0
+                outstanding += len(subdirs) - 1
+                finished = outstanding == 0
+                images.extend(found)
+                dirs_done += 1
+                scanned += n
+            for d in subdirs:
+                pending.put(d)
+            if finished:
+                for _ in range(workers):
+                    pending.put(None)
+
+    # 整棵软删除目录跳过
+    if not _is_under(root_s, trash_s):
+        outstanding = 1
+        pending.put(root_s)
+    else:
+        for _ in range(workers):
+            pending.put(None)
 
-    remainder = scanned % 50
-    if remainder:
-        bar.update(remainder)
+    reported = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_walker) for _ in range(workers)]
+        while True:
+            finished_all, _not_done = wait(futures, timeout=0.2)
+            bar.update(dirs_done - reported)
+            reported = dirs_done
+            for fut in finished_all:
+                if fut.exception() is not None:
+                    for _ in range(workers):
+                        pending.put(None)
+                    raise fut.exception()  # type: ignore[misc]
+            if len(finished_all) == len(futures):
+                break
     bar.close()
-    print(f"  扫描完成，命中图片 {len(images)} 张（共遍历 {scanned} 项）")
+    print(f"  扫描完成，命中图片 {len(images)} 张（共遍历 {dirs_done} 个目录、{scanned} 项）")
 
     # 稳定排序，保证“第一张”可复现
-    images.sort(key=lambda x: x[0].lower())
+    images.sort(key=lambda x: x.path.lower())
     return images
 
 
+class DeviceStats:
+    """按设备累计读取的文件数、字节数和耗时（每个阶段取该设备第一个任务开始到最后一个结束）。"""
+
+    def __init__(self) -> None:
+        self.files: dict[int, int] = defaultdict(int)
+        self.bytes: dict[int, int] = defaultdict(int)
+        self.seconds: dict[int, float] = defaultdict(float)
+        self.sample_dir: dict[int, str] = {}
+
+    def add(self, dev: int, files: int, nbytes: int, seconds: float, sample_path: str) -> None:
+        self.files[dev] += files
+        self.bytes[dev] += nbytes
+        self.seconds[dev] += seconds
+        self.sample_dir.setdefault(dev, os.path.dirname(sample_path))
+
+    def print_summary(self) -> None:
+        if not self.files:
+            return
+        print("各设备读盘吞吐:")
+        for dev in sorted(self.files):
+            mib = self.bytes[dev] / 1024 / 1024
+            seconds = self.seconds[dev]
+            speed = mib / seconds if seconds > 0 else 0.0
+            print(
+                f"  设备 {dev}（如 {self.sample_dir[dev]}）: "
+                f"{self.files[dev]} 个文件，{mib:.1f} MiB，"
+                f"{seconds:.2f}s，{speed:.1f} MiB/s"
+            )
+
+
 def _parallel_map(
-    items: list,
+    items: list[ImageEntry],
     worker,
     desc: str,
     workers: int,
+    per_device: int = DEFAULT_PER_DEVICE_WORKERS,
+    bytes_of=None,
+    stats: DeviceStats | None = None,
 ) -> list:
     """
-    多线程并行处理，保持与 items 相同顺序的结果列表。
-    worker(item) -> result；失败时 worker 应抛异常，此处捕获为 None。
+    按设备调度的多线程并行处理，保持与 items 相同顺序的结果列表。
+    - 按 st_dev 分组，同一设备内按 inode 升序读（多数文件系统上 inode 顺序与写入/物理位置大致一致，减少寻道）；
+      取不到 inode（Windows）时按路径，同目录的文件挨着读
+    - 每个设备最多 per_device 个线程同时读，总线程数不超过 workers
+    worker(item) -> result；OSError 捕获为 None，其他异常照常抛出。
+    bytes_of(item) 为该任务的读盘字节数，用于统计吞吐。
     """
     if not items:
         return []
@@ -273,54 +565,87 @@ def _parallel_map(
     results: list = [None] * len(items)
     bar = ProgressBar(total=len(items), desc=desc)
 
-    # 少量任务串行更省调度开销
-    if len(items) < 4 or workers <= 1:
-        for i, item in enumerate(items):
-            try:
-                results[i] = worker(item)
-            except OSError as e:
-                sys.stdout.write("\n")
-                print(f"[警告] 处理失败，跳过: {item} ({e})", file=sys.stderr)
-                results[i] = None
-            bar.update(1)
-        bar.close()
-        return results
+    by_dev: dict[int, list[int]] = defaultdict(list)
+    for i, item in enumerate(items):
+        by_dev[item.dev].append(i)
+    queues = {dev: deque(sorted(idx, key=lambda i: (items[i].ino, items[i].path))) for dev, idx in by_dev.items()}
+    spans: dict[int, list[float]] = {}
+    lock = threading.Lock()
+    done: queue.Queue = queue.Queue()
 
-    with ThreadPoolExecutor(max_workers=workers) as pool:
-        future_map = {pool.submit(worker, item): i for i, item in enumerate(items)}
-        for fut in as_completed(future_map):
-            i = future_map[fut]
+    def _lane(dev: int) -> None:
+        pending = queues[dev]
+        while True:
+            with lock:
+                if not pending:
+                    return
+                i = pending.popleft()
+            start = time.monotonic()
             try:
-                results[i] = fut.result()
-            except OSError as e:
+                done.put((i, worker(items[i]), None))
+            except BaseException as e:
+                done.put((i, None, e))
+            end = time.monotonic()
+            with lock:
+                span = spans.setdefault(dev, [start, end])
+                span[0] = min(span[0], start)
+                span[1] = max(span[1], end)
+
+    # 各设备的读线程轮流提交，保证每个设备都能尽早开始
+    lanes = {dev: min(per_device, len(idx)) for dev, idx in by_dev.items()}
+    order: list[int] = []
+    while any(lanes.values()):
+        for dev in lanes:
+            if lanes[dev]:
+                order.append(dev)
+                lanes[dev] -= 1
+
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(order)))) as pool:
+        for dev in order:
+            pool.submit(_lane, dev)
+        for _ in range(len(items)):
+            i, result, error = done.get()
+            if error is not None:
+                if not isinstance(error, OSError):
+                    raise error
                 sys.stdout.write("\n")
-                print(f"[警告] 处理失败，跳过: {items[i]} ({e})", file=sys.stderr)
-                results[i] = None
+                print(f"[警告] 处理失败，跳过: {items[i].path} ({error})", file=sys.stderr)
+            results[i] = result
             bar.update(1)
     bar.close()
+
+    if stats is not None:
+        for dev, (start, end) in spans.items():
+            nbytes = sum(bytes_of(items[i]) for i in by_dev[dev]) if bytes_of else 0
+            stats.add(dev, len(by_dev[dev]), nbytes, end - start, items[by_dev[dev][0]].path)
     return results
 
 
 def find_duplicates(
-    images: list[tuple[str, int]],
+    images: list[ImageEntry],
     workers: int,
+    cache: HashCache | None = None,
+    per_device: int = DEFAULT_PER_DEVICE_WORKERS,
+    stats: DeviceStats | None = None,
+    algo: str = "md5",
 ) -> dict[str, list[str]]:
     """
-    三级过滤：size → 采样哈希 → 全量 MD5。
-    返回：full_md5 -> 按保留顺序排列的路径列表（仅 >=2 的组）。
+    三级过滤：size → 采样哈希 → 全量哈希（algo 指定算法，默认 MD5）。
+    传入 cache 时先查缓存，只有新增/变化的文件才真正读盘，算完后批量写回。
+    返回：全量哈希 -> 按保留顺序排列的路径列表（仅 >=2 的组）。
     """
-    by_size: dict[int, list[str]] = defaultdict(list)
-    for path, size in images:
-        by_size[size].append(path)
+    label = algo.upper()
+    by_size: dict[int, list[ImageEntry]] = defaultdict(list)
+    for entry in images:
+        by_size[entry.size].append(entry)
 
-    size_candidates: list[tuple[str, int]] = []
+    size_candidates: list[ImageEntry] = []
     unique_size_skipped = 0
-    for size, paths in by_size.items():
-        if len(paths) < 2:
-            unique_size_skipped += len(paths)
+    for size, entries in by_size.items():
+        if len(entries) < 2:
+            unique_size_skipped += len(entries)
             continue
-        for p in paths:
-            size_candidates.append((p, size))
+        size_candidates.extend(entries)
 
     print(
         f"  体积预筛: 候选 {len(size_candidates)} 张，"
@@ -330,30 +655,48 @@ def find_duplicates(
     if not size_candidates:
         return {}
 
-    # --- 阶段 A：采样哈希 ---
-    def _sample_job(item: tuple[str, int]) -> tuple[str, int, str, bool] | None:
-        path, size = item
-        digest, is_full = compute_sample_hash(path, size)
-        return path, size, digest, is_full
+    # --- 阶段 A：采样哈希（先查缓存）---
+    cached: dict[str, tuple[str, bool, str | None]] = {}
+    sample_misses: list[ImageEntry] = []
+    for entry in size_candidates:
+        hit = cache.lookup(entry) if cache is not None else None
+        if hit is None:
+            sample_misses.append(entry)
+        else:
+            cached[entry.path] = hit
+    if cache is not None:
+        print(f"  哈希缓存: 命中 {len(cached)} 张，需读取 {len(sample_misses)} 张")
+
+    def _sample_job(entry: ImageEntry) -> tuple[str, bool]:
+        return compute_sample_hash(entry.path, entry.size, algo)
 
     sample_results = _parallel_map(
-        size_candidates,
+        sample_misses,
         _sample_job,
         desc="采样预筛",
         workers=workers,
+        per_device=per_device,
+        bytes_of=lambda e: e.size if e.size <= SAMPLE_SIZE * 2 else SAMPLE_SIZE * 2,
+        stats=stats,
     )
-
-    # key: (size, sample_digest) -> list of (path, is_full)
-    by_sample: dict[tuple[int, str], list[tuple[str, bool]]] = defaultdict(list)
-    for row in sample_results:
-        if row is None:
+    if cache is not None:
+        cache.store_samples([(e, row[0], row[1]) for e, row in zip(sample_misses, sample_results) if row is not None])
+    for entry, row in zip(sample_misses, sample_results):
+        if row is not None:
+            cached[entry.path] = (row[0], row[1], row[0] if row[1] else None)
+
+    # key: (size, sample_digest) -> list of (entry, is_full)
+    by_sample: dict[tuple[int, str], list[tuple[ImageEntry, bool]]] = defaultdict(list)
+    for entry in size_candidates:
+        hit = cached.get(entry.path)
+        if hit is None:
             continue
-        path, size, digest, is_full = row
-        by_sample[(size, digest)].append((path, is_full))
+        digest, is_full, _full_digest = hit
+        by_sample[(entry.size, digest)].append((entry, is_full))
 
     # 采样后仍可能重复的组
-    need_full: list[str] = []
-    # 已可直接确认的全量 MD5 组（小文件）
+    need_full: list[ImageEntry] = []
+    # 已可直接确认的全量哈希组（小文件）
     confirmed: dict[str, list[str]] = defaultdict(list)
 
     sample_filtered_out = 0
@@ -364,41 +707,51 @@ def find_duplicates(
 
         all_full = all(is_full for _p, is_full in members)
         if all_full:
-            # 采样已读完整文件，sample_digest 就是 MD5
-            paths = [p for p, _ in members]
+            # 采样已读完整文件，sample_digest 就是全量哈希
+            paths = [e.path for e, _ in members]
             paths.sort(key=str.lower)
             confirmed[sample_digest].extend(paths)
         else:
-            # 大文件：头尾采样相同仍可能中间不同，必须全量 MD5 最终判定
-            need_full.extend(p for p, _ in members)
+            # 大文件：头尾采样相同仍可能中间不同，必须全量哈希最终判定
+            need_full.extend(e for e, _ in members)
 
     print(
-        f"  采样预筛: 待全量 MD5 {len(need_full)} 张，"
+        f"  采样预筛: 待全量 {label} {len(need_full)} 张，"
         f"采样即确认(小文件)组内文件 "
         f"{sum(len(v) for v in confirmed.values())} 张，"
         f"采样已排除 {sample_filtered_out} 张"
     )
 
-    # --- 阶段 B：全量 MD5（仅剩候选）---
+    # --- 阶段 B：全量哈希（仅剩候选，缓存里已有的直接用）---
     if need_full:
         # 去重保序
         seen: set[str] = set()
-        unique_need: list[str] = []
-        for p in need_full:
-            if p not in seen:
-                seen.add(p)
-                unique_need.append(p)
+        unique_need: list[ImageEntry] = []
+        for e in need_full:
+            if e.path in seen:
+                continue
+            seen.add(e.path)
+            full_digest = cached[e.path][2]
+            if full_digest is not None:
+                confirmed[full_digest].append(e.path)
+            else:
+                unique_need.append(e)
 
         full_results = _parallel_map(
             unique_need,
-            compute_full_md5,
-            desc="全量 MD5",
+            lambda e: compute_full_hash(e.path, algo),
+            desc=f"全量 {label}",
             workers=workers,
+            per_device=per_device,
+            bytes_of=lambda e: e.size,
+            stats=stats,
         )
-        for path, digest in zip(unique_need, full_results):
+        if cache is not None:
+            cache.store_full([(e, digest) for e, digest in zip(unique_need, full_results) if digest is not None])
+        for entry, digest in zip(unique_need, full_results):
             if digest is None:
                 continue
-            confirmed[digest].append(path)
+            confirmed[digest].append(entry.path)
 
     # 每组内按路径排序，只保留真正重复
     result: dict[str, list[str]] = {}
@@ -410,55 +763,361 @@ def find_duplicates(
     return result
 
 
-def unique_dest_path(dest_dir: Path, src: Path) -> Path:
-    """在目标目录生成不冲突的文件名；冲突时追加 _1, _2 ..."""
-    candidate = dest_dir / src.name
-    if not candidate.exists():
-        return candidate
+def _load_reduced_gray(path: str, size: tuple[int, int]):
+    img = Image.open(path)  # type: ignore[union-attr]
+    # JPEG 等格式可在解码时按 1/2、1/4、1/8 缩小，省掉大部分解码开销
+    img.draft("L", (size[0] * 4, size[1] * 4))
+    return img.convert("L").resize(size, Image.BILINEAR)  # type: ignore[union-attr]
 
-    stem = src.stem
-    suffix = src.suffix
-    n = 1
-    while True:
-        candidate = dest_dir / f"{stem}_{n}{suffix}"
-        if not candidate.exists():
-            return candidate
-        n += 1
 
+def compute_dhash(path: str) -> int:
+    """差值哈希：9x8 灰度图，逐行比较相邻像素，得到 64 位整数。"""
+    pixels = list(_load_reduced_gray(path, (9, 8)).getdata())
+    value = 0
+    for row in range(8):
+        base = row * 9
+        for col in range(8):
+            value = (value << 1) | (pixels[base + col] > pixels[base + col + 1])
+    return value
 
-def soft_delete(
-    path: Path,
-    trash_dir: Path,
-    dry_run: bool,
-    quiet: bool = False,
-) -> Path | None:
-    """将文件移动到软删除目录，返回目标路径。"""
-    trash_dir.mkdir(parents=True, exist_ok=True)
-    dest = unique_dest_path(trash_dir, path)
 
-    if dry_run:
-        if not quiet:
-            print(f"  [预览] 移动: {path}  ->  {dest}")
-        return dest
+_DCT_COS = [[math.cos(math.pi * (2 * x + 1) * u / (2 * PHASH_SIZE)) for x in range(PHASH_SIZE)] for u in range(8)]
+
+
+def compute_phash(path: str) -> int:
+    """感知哈希：32x32 灰度图做 DCT，只取左上 8x8 低频系数，与其中位数比较得到 64 位整数。"""
+    pixels = list(_load_reduced_gray(path, (PHASH_SIZE, PHASH_SIZE)).getdata())
+    rows = [pixels[i * PHASH_SIZE : (i + 1) * PHASH_SIZE] for i in range(PHASH_SIZE)]
+    # 可分离 DCT：先对每行只算前 8 个系数，再对列算前 8 个
+    row_dct = [[sum(c * v for c, v in zip(cos_u, row)) for cos_u in _DCT_COS] for row in rows]
+    coeffs = [sum(_DCT_COS[v][y] * row_dct[y][u] for y in range(PHASH_SIZE)) for v in range(8) for u in range(8)]
+    median = sorted(coeffs[1:])[len(coeffs[1:]) // 2]  # 去掉直流分量再取中位数
+    value = 0
+    for c in coeffs:
+        value = (value << 1) | (c > median)
+    return value
+
 
+def _perceptual_job(args: tuple[str, str]) -> int | None:
+    method, path = args
     try:
-        shutil.move(str(path), str(dest))
-        if not quiet:
-            print(f"  [已移动] {path}  ->  {dest}")
-        return dest
-    except OSError as e:
-        if quiet:
-            sys.stdout.write("\n")
-        print(f"  [失败] 移动失败: {path} ({e})", file=sys.stderr)
+        return compute_phash(path) if method == "phash" else compute_dhash(path)
+    except Exception:
+        # 损坏或 Pillow 不支持的格式（如部分 RAW/HEIC）直接跳过
         return None
 
 
+def _hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """按汉明距离组织的 BK-tree；相同哈希共用一个节点。节点: [hash, ids, {distance: child}]"""
+
+    def __init__(self) -> None:
+        self.root: list | None = None
+
+    def add(self, value: int, item_id: int) -> None:
+        if self.root is None:
+            self.root = [value, [item_id], {}]
+            return
+        node = self.root
+        while True:
+            d = _hamming(node[0], value)
+            if d == 0:
+                node[1].append(item_id)
+                return
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [value, [item_id], {}]
+                return
+            node = child
+
+    def search(self, value: int, threshold: int) -> list[int]:
+        """返回与 value 汉明距离 <= threshold 的所有 id。"""
+        found: list[int] = []
+        if self.root is None:
+            return found
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            d = _hamming(node[0], value)
+            if d <= threshold:
+                found.extend(node[1])
+            # 三角不等式：只有距离落在 [d-threshold, d+threshold] 的子树可能命中
+            for child_d, child in node[2].items():
+                if d - threshold <= child_d <= d + threshold:
+                    stack.append(child)
+        return found
+
+
+def find_similar(
+    images: list[ImageEntry],
+    workers: int,
+    method: str = "dhash",
+    threshold: int = DEFAULT_PERCEPTUAL_THRESHOLD,
+) -> dict[str, list[str]]:
+    """
+    感知哈希近似查重。
+    A~B、B~C 不代表 A~C，所以按保留顺序分组：取剩余首张作为保留图，
+    用 BK-tree 找出与它距离 <= threshold 且尚未归组的图片归入该组，其余的继续分到后面的组。
+    返回：组内首张（保留）图片的哈希(16 位十六进制) -> 按保留顺序排列的路径列表（仅 >=2 的组），格式与 find_duplicates 一致。
+    """
+    paths = [e.path for e in images]
+    hashes: list[int | None] = []
+    bar = ProgressBar(total=len(paths), desc=f"计算 {method}")
+    with ProcessPoolExecutor(max_workers=max(1, min(workers, os.cpu_count() or 1))) as pool:
+        for value in pool.map(_perceptual_job, [(method, p) for p in paths], chunksize=64):
+            hashes.append(value)
+            bar.update(1)
+    bar.close()
+    failed = sum(1 for h in hashes if h is None)
+    if failed:
+        print(f"  [警告] {failed} 张图片无法解码，已跳过", file=sys.stderr)
+
+    tree = BKTree()
+    for i, value in enumerate(hashes):
+        if value is not None:
+            tree.add(value, i)
+
+    # 相似关系不传递，所以不能整块合并：按保留顺序逐张取未归组的图片作为保留图，
+    # 用 BK-tree 只检索它的邻居，把其中尚未归组的图片并入该组。
+    # 每张图片只归组一次，检索次数等于保留图数量，不再对大分量做平方级的两两比较。
+    order = sorted((i for i, value in enumerate(hashes) if value is not None), key=lambda i: paths[i].lower())
+    rank = {i: r for r, i in enumerate(order)}
+    assigned: set[int] = set()
+    result: dict[str, list[str]] = {}
+    bar = ProgressBar(total=len(order), desc="近似检索")
+    for i in order:
+        if i in assigned:
+            continue
+        keep = hashes[i]
+        close = sorted((j for j in tree.search(keep, threshold) if j not in assigned), key=rank.__getitem__)
+        assigned.update(close)
+        bar.update(len(close))
+        if len(close) >= 2:
+            result[f"{keep:016x}"] = [paths[j] for j in close]
+    bar.close()
+    return result
+
+
+def plan_moves(paths: list[str], trash_dir: Path) -> list[tuple[str, str]]:
+    """
+    一次性规划所有移动目标：软删除目录只列一次，之后在内存里分配不冲突的文件名（冲突时追加 _1, _2 ...）。
+    返回 [(src, dest), ...]，与 paths 顺序一致。
+    """
+    try:
+        taken = {name.lower() for name in os.listdir(trash_dir)}
+    except FileNotFoundError:
+        taken = set()
+    plan: list[tuple[str, str]] = []
+    for src in paths:
+        name = os.path.basename(src)
+        stem, suffix = os.path.splitext(name)
+        n = 0
+        while name.lower() in taken:
+            n += 1
+            name = f"{stem}_{n}{suffix}"
+        taken.add(name.lower())
+        plan.append((src, os.path.join(str(trash_dir), name)))
+    return plan
+
+
+FICLONE = 0x40049409  # linux/fs.h: _IOW(0x94, 9, int)
+
+
+def _reflink(src: str, dest: str) -> None:
+    """用 FICLONE 让 dest 与 src 共享数据块（Btrfs/XFS 等支持）；不支持时抛 OSError。"""
+    import fcntl
+
+    with open(src, "rb") as fsrc, open(dest, "wb") as fdest:
+        fcntl.ioctl(fdest.fileno(), FICLONE, fsrc.fileno())
+
+
+def link_duplicate(keep: str, dup: str, mode: str) -> None:
+    """
+    用指向 keep 的硬链接/reflink 替换 dup：先在同目录建临时文件，再 os.replace 原子替换，
+    中途失败不会丢掉 dup。reflink 会保留 dup 原来的权限和时间戳。
+    """
+    tmp = f"{dup}.photo_dedup_tmp"
+    try:
+        if mode == "hard":
+            os.link(keep, tmp)
+        else:
+            _reflink(keep, tmp)
+            shutil.copystat(dup, tmp)
+        os.replace(tmp, dup)
+    except BaseException:
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        raise
+
+
+class ActionJournal:
+    """
+    JSONL 操作日志，每个动作完成后立即追加一行，供 --undo 回滚。
+    记录: {"run": 运行ID, "action": "move"|"hard"|"reflink", "src": 原路径, "dest": 移动目标, "keep": 保留文件, "mode", "mtime_ns"}
+    回滚时每恢复一项追加 {"run": 运行ID, "action": "restored", "src": 原路径}，全部恢复后再追加 {"run": 运行ID, "action": "undone"}。
+    """
+
+    def __init__(self, path: Path, run_id: str) -> None:
+        self.path = path
+        self.run_id = run_id
+        self.lock = threading.Lock()
+        self.f = None
+
+    def record(self, **fields) -> None:
+        line = json.dumps({"run": self.run_id, **fields}, ensure_ascii=False)
+        with self.lock:
+            if self.f is None:
+                self.path.parent.mkdir(parents=True, exist_ok=True)
+                self.f = open(self.path, "a", encoding="utf-8")
+            self.f.write(line + "\n")
+            self.f.flush()
+
+    def close(self) -> None:
+        if self.f is not None:
+            self.f.close()
+
+
+def apply_actions(
+    jobs: list[tuple[ImageEntry, str]],
+    trash_dir: Path,
+    link: str | None,
+    journal: ActionJournal,
+    workers: int,
+    per_device: int,
+) -> tuple[int, int, int]:
+    """
+    批量执行软删除或链接替换，按设备并行（复用 _parallel_map 的调度）。
+    jobs: [(重复文件, 保留文件路径), ...]。返回 (成功数, 失败数, 释放字节数)。
+    """
+    keep_of = {entry.path: keep for entry, keep in jobs}
+    entries = [entry for entry, _keep in jobs]
+
+    if link:
+        def _job(entry: ImageEntry) -> bool:
+            keep = keep_of[entry.path]
+            st = os.stat(entry.path)
+            if os.path.samefile(keep, entry.path):
+                return False
+            link_duplicate(keep, entry.path, link)
+            journal.record(action=link, src=entry.path, keep=keep, mode=st.st_mode, mtime_ns=st.st_mtime_ns)
+            return True
+
+        desc = "硬链接替换" if link == "hard" else "reflink 替换"
+    else:
+        trash_dir.mkdir(parents=True, exist_ok=True)
+        dest_of = dict(plan_moves([e.path for e in entries], trash_dir))
+
+        def _job(entry: ImageEntry) -> bool:
+            dest = dest_of[entry.path]
+            # 同设备 rename 只改目录项；跨设备才退回 shutil.move 的复制+删除
+            shutil.move(entry.path, dest)
+            journal.record(action="move", src=entry.path, dest=dest, keep=keep_of[entry.path])
+            return True
+
+        desc = "软删除"
+
+    results = _parallel_map(entries, _job, desc=desc, workers=workers, per_device=per_device)
+    done = sum(1 for r in results if r)
+    failed = sum(1 for r in results if r is None)
+    freed = sum(e.size for e, r in zip(entries, results) if r) if link else 0
+    return done, failed, freed
+
+
+def undo_journal(journal_path: Path, run_id: str | None = None) -> int:
+    """
+    回滚日志里指定（默认最近一次未回滚完的）运行：移动的文件移回原处，链接替换的文件复制成独立文件。
+    已恢复的项逐条记入日志，部分失败时可再次 --undo，只重试尚未恢复的项。
+    """
+    if not journal_path.exists():
+        print(f"[错误] 操作日志不存在: {journal_path}", file=sys.stderr)
+        return 1
+    records: list[dict] = []
+    undone: set[str] = set()
+    restored_srcs: set[tuple[str, str]] = set()
+    with open(journal_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError:
+                # 进程被杀时最后一行可能只写了一半
+                continue
+            if rec.get("action") == "undone":
+                undone.add(rec["run"])
+            elif rec.get("action") == "restored":
+                restored_srcs.add((rec["run"], rec["src"]))
+            else:
+                records.append(rec)
+    if run_id is None:
+        runs = [rec["run"] for rec in records if rec["run"] not in undone]
+        if not runs:
+            print("没有可回滚的操作。")
+            return 0
+        run_id = runs[-1]
+    targets = [rec for rec in records if rec["run"] == run_id]
+    pending = [rec for rec in targets if (run_id, rec["src"]) not in restored_srcs]
+    skipped = len(targets) - len(pending)
+    print(f"回滚运行 {run_id}：共 {len(targets)} 项" + (f"，其中 {skipped} 项此前已恢复" if skipped else ""))
+
+    restored = 0
+    failed = 0
+    log = open(journal_path, "a", encoding="utf-8")
+    bar = ProgressBar(total=len(pending), desc="回滚")
+    for rec in reversed(pending):
+        src = rec["src"]
+        try:
+            if rec["action"] == "move":
+                if os.path.lexists(src):
+                    raise FileExistsError(f"原位置已存在文件: {src}")
+                os.makedirs(os.path.dirname(src), exist_ok=True)
+                shutil.move(rec["dest"], src)
+            else:
+                # 内容本就相同，复制一份独立数据再原子替换，恢复原权限与时间戳
+                tmp = f"{src}.photo_dedup_tmp"
+                shutil.copyfile(rec["keep"], tmp)
+                os.chmod(tmp, rec["mode"] & 0o7777)
+                os.utime(tmp, ns=(rec["mtime_ns"], rec["mtime_ns"]))
+                os.replace(tmp, src)
+            log.write(json.dumps({"run": run_id, "action": "restored", "src": src}, ensure_ascii=False) + "\n")
+            log.flush()
+            restored += 1
+        except OSError as e:
+            failed += 1
+            sys.stdout.write("\n")
+            print(f"[警告] 回滚失败: {src} ({e})", file=sys.stderr)
+        bar.update(1)
+    bar.close()
+
+    # 有失败项时不标记整次运行已回滚，修复问题后可再次 --undo 重试剩下的项
+    if failed == 0:
+        log.write(json.dumps({"run": run_id, "action": "undone"}) + "\n")
+    log.close()
+    print(f"回滚完成。恢复 {restored} 项，失败 {failed} 项。")
+    if failed:
+        print(f"[提示] 处理失败原因后可再次运行 --undo {run_id} 重试未恢复的项。", file=sys.stderr)
+    return 0 if failed == 0 else 2
+
+
 def process(
     root: Path,
     trash_dir: Path,
     dry_run: bool,
     list_only: bool,
     workers: int,
+    cache_path: Path | None = None,
+    write_cache: bool = True,
+    perceptual: str | None = None,
+    threshold: int = DEFAULT_PERCEPTUAL_THRESHOLD,
+    per_device: int = DEFAULT_PER_DEVICE_WORKERS,
+    scan_workers: int = DEFAULT_SCAN_WORKERS,
+    link: str | None = None,
+    journal_path: Path = Path(DEFAULT_JOURNAL_NAME),
+    hash_algo: str = "md5",
 ) -> int:
     root = root.resolve()
     if not root.is_dir():
@@ -472,29 +1131,64 @@ def process(
 
     print(f"扫描目录: {root}")
     print(f"软删除目录: {trash_dir}")
-    print(f"并行线程: {workers}")
+    print(f"并行线程: {workers}（每个设备最多 {per_device}）")
+    if cache_path is not None:
+        if not cache_path.is_absolute():
+            cache_path = (root / cache_path).resolve()
+        if not write_cache and not cache_path.exists():
+            print(f"哈希缓存: {cache_path}（不存在，只读运行不创建）")
+            cache_path = None
+        else:
+            print(f"哈希缓存: {cache_path}{'' if write_cache else '（只读）'}")
+    if perceptual:
+        print(f"查重方式: 感知哈希 {perceptual}，汉明距离阈值 {threshold}")
+    elif hash_algo == "auto":
+        print("哈希算法微基准:")
+        hash_algo = pick_fastest_hash()
+        print(f"哈希算法: {hash_algo}（自动选择）")
+    else:
+        print(f"哈希算法: {hash_algo}")
+    if not journal_path.is_absolute():
+        journal_path = (root / journal_path).resolve()
     if dry_run:
         print("模式: 预览（不会真正移动文件）")
     elif list_only:
         print("模式: 仅列出重复，不移动")
+    elif link:
+        print(f"模式: 用{'硬链接' if link == 'hard' else ' reflink '}替换重复项（不移动数据）")
     else:
         print("模式: 执行软删除（移动重复项）")
     print("-" * 60)
 
     t0 = time.monotonic()
     print("阶段 1/3: 递归扫描图片...")
-    images = collect_images(root, trash_dir)
+    images = collect_images(root, trash_dir, workers=scan_workers)
     print(f"共发现图片: {len(images)} 张")
 
     if not images:
         print("没有可处理的图片。")
         return 0
 
-    print("阶段 2/3: 查重（体积 → 采样 → 全量 MD5）...")
-    duplicates = find_duplicates(images, workers=workers)
+    if perceptual:
+        digest_label = perceptual
+        print(f"阶段 2/3: 近似查重（{perceptual} → BK-tree 检索）...")
+        duplicates = find_similar(images, workers=workers, method=perceptual, threshold=threshold)
+    else:
+        digest_label = hash_algo.upper()
+        print(f"阶段 2/3: 查重（体积 → 采样 → 全量 {digest_label}）...")
+        cache = HashCache(cache_path, hash_algo, read_only=not write_cache) if cache_path is not None else None
+        device_stats = DeviceStats()
+        try:
+            duplicates = find_duplicates(
+                images, workers=workers, cache=cache, per_device=per_device, stats=device_stats, algo=hash_algo
+            )
+        finally:
+            if cache is not None:
+                cache.close()
+        device_stats.print_summary()
 
     if not duplicates:
-        print(f"未发现完全相同的重复图片。（耗时 {time.monotonic() - t0:.2f}s）")
+        print(f"未发现{'近似' if perceptual else '完全相同的'}重复图片。（耗时 {time.monotonic() - t0:.2f}s）")
         return 0
 
     group_count = len(duplicates)
@@ -511,6 +1205,7 @@ def process(
 
     moved = 0
     failed = 0
+    freed = 0
 
     group_sizes: dict[int, int] = defaultdict(int)
     group_keep: dict[int, tuple[str, Path]] = {}
@@ -520,26 +1215,31 @@ def process(
 
     for i in sorted(group_sizes):
         digest, keep = group_keep[i]
-        print(f"[组 {i}] MD5={digest}  共 {group_sizes[i] + 1} 张")
+        print(f"[组 {i}] {digest_label}={digest}  共 {group_sizes[i] + 1} 张")
         print(f"  保留: {keep}")
         for _i, _digest, _keep, p in jobs:
             if _i == i:
                 print(f"  重复: {p}")
 
-    if not list_only:
-        print(f"阶段 3/3: {'预览移动' if dry_run else '软删除移动'}...")
-        move_bar = ProgressBar(
-            total=len(jobs),
-            desc="预览移动" if dry_run else "软删除",
-        )
-        for _i, _digest, _keep, p in jobs:
-            result = soft_delete(p, trash_dir, dry_run=dry_run, quiet=True)
-            if result is not None:
-                moved += 1
-            else:
-                failed += 1
-            move_bar.update(1)
-        move_bar.close()
+    if dry_run:
+        moved = len(jobs)
+    elif not list_only:
+        print(f"阶段 3/3: {'链接替换' if link else '软删除移动'}...")
+        entry_of = {e.path: e for e in images}
+        run_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+        journal = ActionJournal(journal_path, run_id)
+        try:
+            moved, failed, freed = apply_actions(
+                [(entry_of[str(p)], str(keep)) for _i, _digest, keep, p in jobs],
+                trash_dir,
+                link=link,
+                journal=journal,
+                workers=workers,
+                per_device=per_device,
+            )
+        finally:
+            journal.close()
+        print(f"操作日志: {journal_path}（运行 {run_id}，可用 --undo 回滚）")
 
     print("-" * 60)
     if list_only:
@@ -547,6 +1247,8 @@ def process(
     elif dry_run:
         print(f"预览完成。将软删除 {moved} 张，失败 {failed} 张。")
         print("去掉 --dry-run 后会真正移动文件。")
+    elif link:
+        print(f"完成。已替换为链接 {moved} 张，失败 {failed} 张，释放约 {freed / 1024 / 1024:.1f} MiB。")
     else:
         print(f"完成。已软删除 {moved} 张，失败 {failed} 张。")
         print(f"重复文件已移动到: {trash_dir}")
@@ -571,10 +1273,29 @@ def build_parser() -> argparse.ArgumentParser:
   # 指定并行线程数（读盘慢可试 8~32）
   uv run photo_dedup.py "D:\\Photos" --workers 16
 
+  # 机械硬盘：每个设备只用 1 个线程顺序读
+  uv run photo_dedup.py "D:\\Photos" --per-device 1
+
   # 指定软删除目录
   uv run photo_dedup.py "D:\\Photos" --trash-dir "D:\\Photos\\_trash"
 
+  # 近似查重：找出缩放/重新压缩过的副本（需要 Pillow）
+  uv run photo_dedup.py "D:\\Photos" --perceptual dhash --threshold 8 --list-only
+
+  # 不移动：用硬链接替换重复项（需与保留文件在同一分区），reflink 需 Btrfs/XFS 等
+  uv run photo_dedup.py "/mnt/photos" --link hard
+
+  # 回滚最近一次软删除/链接替换
+  uv run photo_dedup.py "D:\\Photos" --undo
+
+  # 换用更快的哈希（auto 会先做微基准；xxh3 需 pip install xxhash）
+  uv run photo_dedup.py "D:\\Photos" --hash auto
+
+  # 不使用哈希缓存（每次全部重新读盘）
+  uv run photo_dedup.py "D:\\Photos" --no-cache
+
 默认软删除目录名: {DEFAULT_TRASH_DIR_NAME}（位于扫描根目录下）
+默认哈希缓存文件: {default_cache_path()}（--list-only / --dry-run 时只读）
 """,
     )
     parser.add_argument(
@@ -604,6 +1325,76 @@ def build_parser() -> argparse.ArgumentParser:
         default=default_workers(),
         help=f"并行哈希线程数（默认 {default_workers()}）。设为 1 可关闭并行",
     )
+    parser.add_argument(
+        "--scan-workers",
+        type=int,
+        default=DEFAULT_SCAN_WORKERS,
+        help=f"并行列目录的线程数（默认 {DEFAULT_SCAN_WORKERS}）。NAS 上目录很多时可调高",
+    )
+    parser.add_argument(
+        "--per-device",
+        type=int,
+        default=DEFAULT_PER_DEVICE_WORKERS,
+        help=(
+            f"每个设备（磁盘/共享）同时读取的线程数上限（默认 {DEFAULT_PER_DEVICE_WORKERS}）。"
+            "机械硬盘建议 1~2，SSD 可调高，NAS 按共享的并发限制设置"
+        ),
+    )
+    parser.add_argument(
+        "--cache-path",
+        type=Path,
+        default=None,
+        help=(
+            f"哈希缓存文件（相对路径则相对于扫描根目录）。默认: {default_cache_path()}；"
+            "--list-only / --dry-run 时默认缓存只读，显式指定本参数则照常写入"
+        ),
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="不读写哈希缓存",
+    )
+    parser.add_argument(
+        "--hash",
+        choices=HASH_ALGOS + ("auto",),
+        default="md5",
+        help=(
+            "全量/采样哈希算法（默认 md5）。xxh3 需要 xxhash；auto 先做微基准选本机最快的。"
+            "缓存按算法区分，换算法后首次运行需重新读盘"
+        ),
+    )
+    parser.add_argument(
+        "--link",
+        choices=LINK_MODES,
+        default=None,
+        help="不移动重复项，改为替换成指向保留文件的硬链接(hard)或 reflink（不能与 --perceptual 同用）",
+    )
+    parser.add_argument(
+        "--journal",
+        type=Path,
+        default=Path(DEFAULT_JOURNAL_NAME),
+        help=f"操作日志（相对路径则相对于扫描根目录）。默认: {DEFAULT_JOURNAL_NAME}",
+    )
+    parser.add_argument(
+        "--undo",
+        nargs="?",
+        const="",
+        default=None,
+        metavar="RUN_ID",
+        help="按操作日志回滚指定运行（不写则回滚最近一次未回滚完的），部分失败时可再次运行重试剩下的项，不做查重",
+    )
+    parser.add_argument(
+        "--perceptual",
+        choices=PERCEPTUAL_METHODS,
+        default=None,
+        help="改用感知哈希做近似查重（需要 Pillow）。不指定则按 MD5 精确查重",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=int,
+        default=DEFAULT_PERCEPTUAL_THRESHOLD,
+        help=f"感知哈希的最大汉明距离（0~64，越小越严格）。默认: {DEFAULT_PERCEPTUAL_THRESHOLD}",
+    )
     return parser
 
 
@@ -611,12 +1402,37 @@ def main(argv: list[str] | None = None) -> int:
     parser = build_parser()
     args = parser.parse_args(argv)
 
+    if args.undo is not None:
+        journal_path = args.journal if args.journal.is_absolute() else args.directory.resolve() / args.journal
+        return undo_journal(journal_path, args.undo or None)
+
     if args.dry_run and args.list_only:
         print("[错误] --dry-run 与 --list-only 不能同时使用。", file=sys.stderr)
         return 1
     if args.workers < 1:
         print("[错误] --workers 必须 >= 1。", file=sys.stderr)
         return 1
+    if args.scan_workers < 1:
+        print("[错误] --scan-workers 必须 >= 1。", file=sys.stderr)
+        return 1
+    if args.per_device < 1:
+        print("[错误] --per-device 必须 >= 1。", file=sys.stderr)
+        return 1
+    if args.perceptual and Image is None:
+        print("[错误] --perceptual 需要 Pillow，请先安装: pip install Pillow", file=sys.stderr)
+        return 1
+    if args.hash == "xxh3" and xxhash is None:
+        print("[错误] --hash xxh3 需要 xxhash，请先安装: pip install xxhash", file=sys.stderr)
+        return 1
+    if args.link and args.perceptual:
+        print("[错误] 感知哈希结果不是字节相同，不能用 --link 替换。", file=sys.stderr)
+        return 1
+    if args.link == "reflink" and sys.platform != "linux":
+        print("[错误] --link reflink 仅支持 Linux（FICLONE）。", file=sys.stderr)
+        return 1
+    if not 0 <= args.threshold <= 64:
+        print("[错误] --threshold 必须在 0~64 之间。", file=sys.stderr)
+        return 1
 
     return process(
         root=args.directory,
@@ -624,6 +1440,15 @@ def main(argv: list[str] | None = None) -> int:
         dry_run=args.dry_run,
         list_only=args.list_only,
         workers=args.workers,
+        cache_path=None if args.no_cache else (args.cache_path or default_cache_path()),
+        write_cache=args.cache_path is not None or not (args.dry_run or args.list_only),
+        perceptual=args.perceptual,
+        threshold=args.threshold,
+        per_device=args.per_device,
+        scan_workers=args.scan_workers,
+        link=args.link,
+        journal_path=args.journal,
+        hash_algo=args.hash,
     )
 
 
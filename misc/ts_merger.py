@@ -4,17 +4,41 @@
 TS文件合并脚本
 将指定目录及其子目录中的每个目录内的所有TS文件合并成一个MP4文件
 生成的MP4文件保存在脚本所在目录
+各分段的PID与流类型一致、时间戳首尾相接时按字节直接拼接、只封装一次，否则退回ffmpeg concat
 """
 
 import os
 import subprocess
 import sys
 import argparse
+import errno
+import tempfile
 import time
 import shutil
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
 
 
+TS_PACKET_SIZE = 188
+TS_SYNC_BYTE = 0x47
+# 读取PAT/PMT时最多看每个分段开头这么多字节（HLS分段的PAT/PMT都在最前面）
+TS_PROBE_BYTES = 1024 * 1024
+COPY_CHUNK_SIZE = 64 * 1024 * 1024
+# PCR/PTS是90kHz的33位计数器
+TS_CLOCK_HZ = 90000
+TS_CLOCK_WRAP = 1 << 33
+# 后一分段的第一个时间戳比前一分段最后一个时间戳晚不超过这么多秒才算连续
+TS_MAX_GAP_SECONDS = 1.0
+
+
+def log_line(message):
+    """
+    整行一次写出（print会把内容和换行分两次写），多个目录并行合并时各行不会互相穿插
+    """
+    print(f"{message}\n", end="", flush=True)
+
+
 def check_dependencies():
     """
     检查必要的依赖是否已安装
@@ -99,117 +123,452 @@ def create_file_list(ts_files, list_file_path):
         return False
 
 
-def merge_ts_files(ts_files, output_file, delete_original=False):
+def _psi_section(packet):
+    """
+    取出TS包里从本包开始的PSI表段（PAT/PMT）
+    
+    Returns:
+        tuple: (table_id, 段内容) ；本包不是段起始或段跨包时返回None
+    """
+    if not packet[1] & 0x40:  # payload_unit_start_indicator
+        return None
+    adaptation = (packet[3] >> 4) & 0x3
+    pos = 4
+    if adaptation & 0x2:
+        pos += 1 + packet[4]
+    if not adaptation & 0x1 or pos >= TS_PACKET_SIZE:
+        return None
+    pos += 1 + packet[pos]  # pointer_field
+    if pos + 3 > TS_PACKET_SIZE:
+        return None
+    section_length = ((packet[pos + 1] & 0x0F) << 8) | packet[pos + 2]
+    body = packet[pos + 3:pos + 3 + section_length]
+    if len(body) < section_length:
+        return None
+    return packet[pos], body
+
+
+def read_ts_layout(ts_file):
+    """
+    读取TS分段开头的PAT/PMT，得到节目与基本流的布局
+    
+    Args:
+        ts_file (str): TS文件路径
+    
+    Returns:
+        tuple: ((节目号, PMT PID, ((流PID, 流类型), ...)), ...)；
+               不是按188字节对齐的规整TS、或读不全PAT/PMT时返回None
+    """
+    size = os.path.getsize(ts_file)
+    if size == 0 or size % TS_PACKET_SIZE:
+        return None
+    with open(ts_file, 'rb') as f:
+        data = f.read(min(size, TS_PROBE_BYTES))
+    
+    programs = None  # PMT PID -> 节目号
+    streams = {}     # PMT PID -> ((流PID, 流类型), ...)
+    for offset in range(0, len(data) - TS_PACKET_SIZE + 1, TS_PACKET_SIZE):
+        packet = data[offset:offset + TS_PACKET_SIZE]
+        if packet[0] != TS_SYNC_BYTE:
+            return None
+        pid = ((packet[1] & 0x1F) << 8) | packet[2]
+        if pid != 0 and (programs is None or pid not in programs or pid in streams):
+            continue
+        section = _psi_section(packet)
+        if section is None:
+            continue
+        table_id, body = section
+        if pid == 0 and table_id == 0x00 and programs is None:
+            # PAT: ts_id(2) version(1) section(1) last(1)，之后每4字节一个节目，末尾4字节CRC
+            entries = body[5:-4]
+            programs = {}
+            for i in range(0, len(entries) - 3, 4):
+                program_number = (entries[i] << 8) | entries[i + 1]
+                if program_number:
+                    programs[((entries[i + 2] & 0x1F) << 8) | entries[i + 3]] = program_number
+        elif pid != 0 and table_id == 0x02 and len(body) >= 13:
+            # PMT: program(2) version(1) section(1) last(1) PCR_PID(2) info_length(2)，之后是各基本流
+            info_length = ((body[7] & 0x0F) << 8) | body[8]
+            loop = body[9 + info_length:-4]
+            es = []
+            i = 0
+            while i + 5 <= len(loop):
+                es_pid = ((loop[i + 1] & 0x1F) << 8) | loop[i + 2]
+                es.append((es_pid, loop[i]))
+                i += 5 + (((loop[i + 3] & 0x0F) << 8) | loop[i + 4])
+            streams[pid] = tuple(sorted(es))
+            if len(streams) == len(programs):
+                break
+    
+    if not programs or len(streams) < len(programs):
+        return None
+    return tuple(sorted((programs[pid], pid, es) for pid, es in streams.items()))
+
+
+def _packet_clocks(packet):
+    """
+    取出TS包里的时间戳：自适应字段里的PCR、PES包头里的PTS
+    
+    Returns:
+        list: [(类型'pcr'/'pts', PID, 90kHz计数), ...]
+    """
+    pid = ((packet[1] & 0x1F) << 8) | packet[2]
+    adaptation = (packet[3] >> 4) & 0x3
+    clocks = []
+    pos = 4
+    if adaptation & 0x2:
+        length = packet[4]
+        if length >= 7 and packet[5] & 0x10:  # PCR_flag，只取33位的PCR base
+            pcr = (packet[6] << 25) | (packet[7] << 17) | (packet[8] << 9) | (packet[9] << 1) | (packet[10] >> 7)
+            clocks.append(('pcr', pid, pcr))
+        pos += 1 + length
+    if adaptation & 0x1 and packet[1] & 0x40 and pos + 14 <= TS_PACKET_SIZE \
+            and packet[pos:pos + 3] == b'\x00\x00\x01':
+        stream_id = packet[pos + 3]
+        # 只看音视频流与private_stream_1，这些PES才带可选包头；PTS_DTS_flags最高位表示有PTS
+        if (0xC0 <= stream_id <= 0xEF or stream_id == 0xBD) and packet[pos + 7] & 0x80:
+            p = packet[pos + 9:pos + 14]
+            pts = (((p[0] >> 1) & 0x7) << 30) | (p[1] << 22) | ((p[2] >> 1) << 15) | (p[3] << 7) | (p[4] >> 1)
+            clocks.append(('pts', pid, pts))
+    return clocks
+
+
+def _clock_offset(value, base):
+    """
+    value相对base的带符号差值（90kHz计数），处理33位回绕
+    """
+    half = TS_CLOCK_WRAP // 2
+    return (value - base + half) % TS_CLOCK_WRAP - half
+
+
+def read_ts_timing(ts_file):
+    """
+    读取TS分段开头与末尾的时间戳，用来判断相邻分段能否直接首尾相接
+    
+    Args:
+        ts_file (str): TS文件路径（应已通过read_ts_layout的检查）
+    
+    Returns:
+        dict: {(类型, PID): (开头最早的时间戳, 末尾最晚的时间戳)}；
+              PTS有B帧重排，所以开头取最小、末尾取最大
+    """
+    size = os.path.getsize(ts_file)
+    tail_start = max(0, size - TS_PROBE_BYTES)
+    tail_start -= tail_start % TS_PACKET_SIZE
+    with open(ts_file, 'rb') as f:
+        head = f.read(min(size, TS_PROBE_BYTES))
+        f.seek(tail_start)
+        tail = f.read()
+    
+    def scan(data, later):
+        found = {}
+        for offset in range(0, len(data) - TS_PACKET_SIZE + 1, TS_PACKET_SIZE):
+            for kind, pid, value in _packet_clocks(data[offset:offset + TS_PACKET_SIZE]):
+                key = (kind, pid)
+                if key not in found or (_clock_offset(value, found[key]) > 0) == later:
+                    found[key] = value
+        return found
+    
+    first = scan(head, later=False)
+    last = scan(tail, later=True)
+    return {key: (first[key], last[key]) for key in first if key in last}
+
+
+def clock_gap(previous, current):
+    """
+    计算后一分段开头相对前一分段末尾的时间戳间隔
+    
+    Args:
+        previous (dict): 前一分段的read_ts_timing结果
+        current (dict): 后一分段的read_ts_timing结果
+    
+    Returns:
+        float: 间隔秒数（两边都有同一PID的PCR时优先用PCR，否则用PTS）；没有共同的时间戳时返回None
+    """
+    keys = [key for key in current if key in previous]
+    if not keys:
+        return None
+    key = min(keys)  # 'pcr' < 'pts'
+    return _clock_offset(current[key][0], previous[key][1]) / TS_CLOCK_HZ
+
+
+def _append_file(src, dst):
+    """
+    把src剩余内容追加到dst：优先os.copy_file_range（数据不经过用户态，
+    部分文件系统上还能直接共享数据块），其次os.sendfile，都不可用时退回shutil.copyfileobj
+    """
+    for name in ('copy_file_range', 'sendfile'):
+        func = getattr(os, name, None)
+        if func is None:
+            continue
+        copied_any = False
+        try:
+            while True:
+                if name == 'copy_file_range':
+                    n = func(src.fileno(), dst.fileno(), COPY_CHUNK_SIZE)
+                else:
+                    offset = src.tell()
+                    n = func(dst.fileno(), src.fileno(), offset, COPY_CHUNK_SIZE)
+                    src.seek(offset + n)
+                if n == 0:
+                    return
+                copied_any = True
+        except OSError as e:
+            # 首次调用就不支持（跨文件系统、非Linux的sendfile等）才换下一种方式
+            if copied_any or e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL,
+                                              errno.EOPNOTSUPP, errno.ENOTSOCK, errno.EBADF):
+                raise
+    shutil.copyfileobj(src, dst, 1024 * 1024)
+    dst.flush()
+
+
+def concat_ts_bytes(ts_files, output_file):
+    """
+    按顺序把TS分段首尾相接写成一个TS文件（TS本身就是可直接拼接的包流）
+    
+    Args:
+        ts_files (list): TS文件路径列表
+        output_file (str): 输出的TS文件路径
+    """
+    with open(output_file, 'wb') as dst:
+        for ts_file in ts_files:
+            with open(ts_file, 'rb') as src:
+                _append_file(src, dst)
+
+
+def concat_ts_fast(ts_files, output_file, say=print):
+    """
+    字节级快速合并：各分段的节目、PID与流类型完全一致，且每段开头的PCR/PTS紧接上一段末尾时，
+    直接按字节拼接，经管道交给ffmpeg只做一次封装（输出为.ts时连封装都省掉），不落临时文件，
+    不再让concat demuxer逐个打开分段、逐包重封装。
+    时间戳不连续（分段各自从0开始、中间缺段、顺序错乱）时直接拼接会让播放器时间轴跳变，交给concat demuxer重新计算
+    
+    Args:
+        ts_files (list): TS文件路径列表
+        output_file (str): 输出文件路径，扩展名为.ts时直接输出拼接结果
+        say (callable): 输出信息的函数
+    
+    Returns:
+        bool: 是否已用快速路径合并成功；False表示应退回ffmpeg concat
+    """
+    layout = None
+    timing = None
+    for ts_file in ts_files:
+        current = read_ts_layout(ts_file)
+        if current is None:
+            say("  -> 分段不是规整的TS或读不到PAT/PMT，改用ffmpeg concat")
+            return False
+        if layout is not None and current != layout:
+            say(f"  -> 分段的PID/流类型不一致（{os.path.basename(ts_file)}），改用ffmpeg concat")
+            return False
+        layout = current
+        
+        current_timing = read_ts_timing(ts_file)
+        if timing is not None:
+            gap = clock_gap(timing, current_timing)
+            if gap is None or not 0 < gap <= TS_MAX_GAP_SECONDS:
+                detail = "读不到时间戳" if gap is None else f"间隔{gap:.3f}秒"
+                say(f"  -> 分段时间戳不连续（{os.path.basename(ts_file)}，{detail}），改用ffmpeg concat")
+                return False
+        timing = current_timing
+    
+    if output_file.lower().endswith('.ts'):
+        say("  -> 分段格式一致，按字节直接拼接")
+        concat_ts_bytes(ts_files, output_file)
+        return True
+    
+    say("  -> 分段格式一致，按字节拼接后经管道一次封装")
+    cmd = [
+        'ffmpeg',
+        '-f', 'mpegts',
+        '-i', 'pipe:0',
+        '-c', 'copy',
+        '-y',
+        '-loglevel', 'error',
+        output_file
+    ]
+    # 拼接流直接写进ffmpeg的标准输入，不落临时文件；错误输出写临时文件，避免管道写满互相等待
+    with tempfile.TemporaryFile() as stderr_file:
+        process = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=stderr_file)
+        try:
+            for ts_file in ts_files:
+                with open(ts_file, 'rb') as src:
+                    _append_file(src, process.stdin)
+            process.stdin.close()
+        except BrokenPipeError:
+            pass  # ffmpeg提前退出，下面按返回码处理
+        finally:
+            if not process.stdin.closed:
+                try:
+                    process.stdin.close()
+                except BrokenPipeError:
+                    pass
+            returncode = process.wait()
+        if returncode != 0:
+            say("  -> 拼接结果封装失败，改用ffmpeg concat")
+            stderr_file.seek(0)
+            error = stderr_file.read().decode('utf-8', errors='replace').strip()
+            if error:
+                say(f"错误信息: {error}")
+            return False
+    return True
+
+
+def merge_ts_files(ts_files, output_file, delete_original=False, tag="", fast=True):
     """
     将多个TS文件合并成一个MP4文件
     
     Args:
         ts_files (list): TS文件路径列表
-        output_file (str): 输出的MP4文件路径
+        output_file (str): 输出的MP4文件路径（扩展名为.ts时输出TS）
         delete_original (bool): 是否删除原始TS文件
+        tag (str): 输出信息的前缀，并行合并时用来区分各目录
+        fast (bool): 是否先尝试字节级快速合并（concat_ts_fast），不行再走ffmpeg concat
     
     Returns:
         bool: 合并是否成功
     """
+    def say(message):
+        log_line(f"{tag}{message}")
+
     if len(ts_files) == 0:
-        print("错误: 没有TS文件需要合并")
+        say("错误: 没有TS文件需要合并")
         return False
     
     # 计算原始文件总大小
     total_original_size = sum(get_file_size(ts_file) for ts_file in ts_files)
     
-    # 创建临时文件列表
-    temp_list_file = os.path.join(os.path.dirname(output_file), "filelist.txt")
-    if not create_file_list(ts_files, temp_list_file):
-        return False
-    
+    temp_list_file = None
     try:
-        print(f"正在合并 {len(ts_files)} 个TS文件...")
-        print(f"原始总大小: {total_original_size}MB")
+        say(f"正在合并 {len(ts_files)} 个TS文件...")
+        say(f"原始总大小: {total_original_size}MB")
         
         start_time = time.time()
         
-        # 使用ffmpeg的concat demuxer进行合并
-        cmd = [
-            'ffmpeg',
-            '-f', 'concat',  # 使用concat demuxer
-            '-safe', '0',    # 允许不安全的文件路径
-            '-i', temp_list_file,
-            '-c', 'copy',   # 无损复制音视频流
-            '-y',           # 覆盖已存在的输出文件
-            '-loglevel', 'error',  # 只显示错误信息
-            output_file
-        ]
-        
-        # 使用UTF-8编码处理输出
-        result = subprocess.run(cmd, capture_output=True, text=True, check=True, encoding='utf-8', errors='replace')
+        if not (fast and concat_ts_fast(ts_files, output_file, say)):
+            # 创建临时文件列表（每次合并一个独立文件，多个目录并行合并时互不覆盖）
+            fd, temp_list_file = tempfile.mkstemp(
+                prefix="filelist_", suffix=".txt", dir=os.path.dirname(output_file)
+            )
+            os.close(fd)
+            if not create_file_list(ts_files, temp_list_file):
+                return False
+            
+            # 使用ffmpeg的concat demuxer进行合并
+            cmd = [
+                'ffmpeg',
+                '-f', 'concat',  # 使用concat demuxer
+                '-safe', '0',    # 允许不安全的文件路径
+                '-i', temp_list_file,
+                '-c', 'copy',   # 无损复制音视频流
+                '-y',           # 覆盖已存在的输出文件
+                '-loglevel', 'error',  # 只显示错误信息
+                output_file
+            ]
+            
+            # 使用UTF-8编码处理输出；check=True，失败时抛出CalledProcessError
+            subprocess.run(cmd, capture_output=True, text=True, check=True, encoding='utf-8', errors='replace')
         
         end_time = time.time()
         conversion_time = round(end_time - start_time, 2)
         
-        if result.returncode == 0:
-            # 检查输出文件是否存在且大小合理
-            if os.path.exists(output_file):
-                output_size = get_file_size(output_file)
-                if output_size > 0:
-                    print(f"合并成功: {output_file} ({output_size}MB, 耗时: {conversion_time}秒)")
-                    
-                    # 显示文件大小变化
-                    size_diff = output_size - total_original_size
-                    size_percent = round((size_diff / total_original_size) * 100, 2) if total_original_size > 0 else 0
-                    size_change = f"+{size_diff}MB (+{size_percent}%)" if size_diff > 0 else f"{size_diff}MB ({size_percent}%)"
-                    print(f"文件大小变化: {total_original_size}MB -> {output_size}MB ({size_change})")
-                    
-                    # 如果需要删除原始文件
-                    if delete_original:
-                        deleted_count = 0
-                        for ts_file in ts_files:
-                            try:
-                                os.remove(ts_file)
-                                deleted_count += 1
-                            except Exception as e:
-                                print(f"删除原始文件失败: {ts_file}")
-                                print(f"错误信息: {str(e)}")
-                        print(f"已删除 {deleted_count}/{len(ts_files)} 个原始TS文件")
-                    
-                    return True
-                else:
-                    print(f"合并失败: 输出文件大小为0")
-                    return False
+        # 检查输出文件是否存在且大小合理
+        if os.path.exists(output_file):
+            output_size = get_file_size(output_file)
+            if output_size > 0:
+                say(f"合并成功: {output_file} ({output_size}MB, 耗时: {conversion_time}秒)")
+                
+                # 显示文件大小变化
+                size_diff = output_size - total_original_size
+                size_percent = round((size_diff / total_original_size) * 100, 2) if total_original_size > 0 else 0
+                size_change = f"+{size_diff}MB (+{size_percent}%)" if size_diff > 0 else f"{size_diff}MB ({size_percent}%)"
+                say(f"文件大小变化: {total_original_size}MB -> {output_size}MB ({size_change})")
+                
+                # 如果需要删除原始文件
+                if delete_original:
+                    deleted_count = 0
+                    for ts_file in ts_files:
+                        try:
+                            os.remove(ts_file)
+                            deleted_count += 1
+                        except Exception as e:
+                            say(f"删除原始文件失败: {ts_file}")
+                            say(f"错误信息: {str(e)}")
+                    say(f"已删除 {deleted_count}/{len(ts_files)} 个原始TS文件")
+                
+                return True
             else:
-                print(f"合并失败: 输出文件未创建")
+                say(f"合并失败: 输出文件大小为0")
                 return False
         else:
-            print(f"合并失败")
-            if result.stderr:
-                print(f"错误信息: {result.stderr}")
+            say(f"合并失败: 输出文件未创建")
             return False
             
     except subprocess.CalledProcessError as e:
-        print(f"合并过程中发生错误")
+        say(f"合并过程中发生错误")
         if e.stderr:
-            print(f"错误信息: {e.stderr}")
+            say(f"错误信息: {e.stderr}")
         return False
     except Exception as e:
-        print(f"未知错误")
-        print(f"错误信息: {str(e)}")
+        say(f"未知错误")
+        say(f"错误信息: {str(e)}")
         return False
     finally:
         # 删除临时文件列表
-        if os.path.exists(temp_list_file):
+        if temp_list_file and os.path.exists(temp_list_file):
             try:
                 os.remove(temp_list_file)
             except:
                 pass
 
 
-def find_and_merge_ts_files(directory, delete_original=False):
+def reserve_output_file(output_dir, dir_name, reserved, ext=".mp4"):
+    """
+    为目录生成不与已有文件、也不与本次已分配名字冲突的输出文件路径
+    
+    只在主线程里调用：并行合并时各目录的输出名在派发前就定好，
+    不会出现两个合并同时挑中同一个名字的情况。
+    
+    Args:
+        output_dir (str): 输出目录
+        dir_name (str): 源目录名
+        reserved (set): 本次已分配的输出路径（normcase 后），会被更新
+        ext (str): 输出文件扩展名
+    
+    Returns:
+        tuple: (输出文件路径, 是否因重名改过名)
+    """
+    safe_dir_name = "".join(c if c.isalnum() or c in (' ', '-', '_') else '_' for c in dir_name)
+    original_output_file = os.path.join(output_dir, f"{safe_dir_name}{ext}")
+    output_file = original_output_file
+    
+    # 如果输出文件已存在或已分配给别的目录，添加唯一标识符
+    counter = 1
+    while os.path.exists(output_file) or os.path.normcase(output_file) in reserved:
+        base, ext = os.path.splitext(original_output_file)
+        output_file = f"{base}_{counter}{ext}"
+        counter += 1
+    
+    reserved.add(os.path.normcase(output_file))
+    return output_file, output_file != original_output_file
+
+
+def find_and_merge_ts_files(directory, delete_original=False, jobs=1, per_device=2,
+                            fast=True, output_ext=".mp4"):
     """
     查找目录及其子目录中的TS文件，并将每个目录内的TS文件合并成一个MP4文件
     
+    jobs 大于 1 时用线程池同时合并多个目录。合并是纯 I/O（-c copy），瓶颈在磁盘，
+    所以另按设备限流：同一源设备或目标设备上同时进行的合并不超过 per_device 个。
+    派发与统计都在主线程完成，设备已满的目录先让后面其他设备上的目录插队。
+    
     Args:
         directory (str): 要搜索的目录路径
         delete_original (bool): 是否删除原始TS文件
+        jobs (int): 同时合并的目录数
+        per_device (int): 同一设备上同时进行的合并数上限
+        fast (bool): 是否先尝试字节级快速合并
+        output_ext (str): 输出文件扩展名，".ts"时快速路径不再封装
     
     Returns:
         tuple: (成功合并的目录数, 失败的目录数, 跳过的目录数)
@@ -253,62 +612,82 @@ def find_and_merge_ts_files(directory, delete_original=False):
     print(f"找到 {total_dirs} 个包含TS文件的目录")
     print("-" * 60)
     
-    # 处理每个目录
-    for i, (dir_path, ts_files) in enumerate(dirs_with_ts.items(), 1):
-        # 显示进度
-        dir_name = os.path.basename(dir_path)
-        relative_path = os.path.relpath(dir_path, directory)
-        print(f"[{i}/{total_dirs}] 处理目录: {relative_path} ({len(ts_files)}个TS文件)")
-        
-        # 生成输出文件名
-        safe_dir_name = "".join(c if c.isalnum() or c in (' ', '-', '_') else '_' for c in dir_name)
-        output_file = os.path.join(script_dir, f"{safe_dir_name}.mp4")
-        
-        # 如果输出文件已存在，添加唯一标识符
-        counter = 1
-        original_output_file = output_file
-        while os.path.exists(output_file):
-            base, ext = os.path.splitext(original_output_file)
-            output_file = f"{base}_{counter}{ext}"
-            counter += 1
-        
-        # 如果输出文件与原始文件不同，说明有重名文件
-        if output_file != original_output_file:
-            print(f"  -> 检测到同名文件，使用新文件名: {os.path.basename(output_file)}")
-        
-        # 计算原始文件总大小
-        dir_original_size = sum(get_file_size(ts_file) for ts_file in ts_files)
-        total_size_before += dir_original_size
-        
-        # 合并文件
+    # 待合并的目录：(序号, 目录路径, TS文件列表, 涉及的设备)；源和目标在同一设备时只占一个名额
+    dest_device = os.stat(script_dir).st_dev
+    pending = deque(
+        (i, dir_path, ts_files, frozenset((os.stat(dir_path).st_dev, dest_device)))
+        for i, (dir_path, ts_files) in enumerate(dirs_with_ts.items(), 1)
+    )
+    reserved = set()
+    device_busy = Counter()
+    running = {}  # future -> (序号, 目录路径, 输出文件, 涉及的设备)
+    finished = 0
+    
+    def run_merge(ts_files, output_file, tag):
         dir_start_time = time.time()
-        if merge_ts_files(ts_files, output_file, delete_original):
-            dir_end_time = time.time()
-            dir_merge_time = dir_end_time - dir_start_time
-            total_merge_time += dir_merge_time
-            
-            success_count += 1
-            
-            # 获取合并后文件大小
-            merged_size = get_file_size(output_file)
-            total_size_after += merged_size
-            
-            # 计算并显示处理时间和预估剩余时间
-            elapsed_time = time.time() - start_time
-            if success_count > 0:
-                avg_time_per_dir = total_merge_time / success_count
-                remaining_dirs = total_dirs - i
-                estimated_remaining_time = avg_time_per_dir * remaining_dirs
+        ok = merge_ts_files(ts_files, output_file, delete_original, tag, fast)
+        return ok, time.time() - dir_start_time
+    
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        while pending or running:
+            # 派发：凑满 jobs 个，跳过源或目标设备已满的目录
+            for job in list(pending):
+                if len(running) >= jobs:
+                    break
+                i, dir_path, ts_files, devices = job
+                if any(device_busy[d] >= per_device for d in devices):
+                    continue
+                pending.remove(job)
+                device_busy.update(devices)
                 
-                # 格式化时间显示
-                elapsed_str = format_time(elapsed_time)
-                remaining_str = format_time(estimated_remaining_time)
+                # 显示进度
+                dir_name = os.path.basename(dir_path)
+                relative_path = os.path.relpath(dir_path, directory)
+                log_line(f"[{i}/{total_dirs}] 处理目录: {relative_path} ({len(ts_files)}个TS文件)")
                 
-                print(f"  -> 已用时间: {elapsed_str}, 预估剩余: {remaining_str}")
-        else:
-            failure_count += 1
-        
-        print("-" * 40)
+                # 生成输出文件名
+                output_file, renamed = reserve_output_file(script_dir, dir_name, reserved, output_ext)
+                if renamed:
+                    log_line(f"  -> 检测到同名文件，使用新文件名: {os.path.basename(output_file)}")
+                
+                # 计算原始文件总大小
+                dir_original_size = sum(get_file_size(ts_file) for ts_file in ts_files)
+                total_size_before += dir_original_size
+                
+                # 合并文件；并行时给输出加上目录序号，便于区分
+                tag = f"  [{i}/{total_dirs}] " if jobs > 1 else ""
+                future = executor.submit(run_merge, ts_files, output_file, tag)
+                running[future] = (i, dir_path, output_file, devices)
+            
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                i, dir_path, output_file, devices = running.pop(future)
+                device_busy.subtract(devices)
+                finished += 1
+                ok, dir_merge_time = future.result()
+                if ok:
+                    total_merge_time += dir_merge_time
+                    success_count += 1
+                    
+                    # 获取合并后文件大小
+                    merged_size = get_file_size(output_file)
+                    total_size_after += merged_size
+                    
+                    # 计算并显示处理时间和预估剩余时间（按实际吞吐估算，已计入并行）
+                    elapsed_time = time.time() - start_time
+                    remaining_dirs = total_dirs - finished
+                    estimated_remaining_time = elapsed_time / finished * remaining_dirs
+                    
+                    # 格式化时间显示
+                    elapsed_str = format_time(elapsed_time)
+                    remaining_str = format_time(estimated_remaining_time)
+                    
+                    prefix = f"  [{i}/{total_dirs}]" if jobs > 1 else " "
+                    log_line(f"{prefix} -> 已用时间: {elapsed_str}, 预估剩余: {remaining_str}")
+                else:
+                    failure_count += 1
+                
+                log_line("-" * 40)
     
     # 显示总体统计信息
     total_elapsed_time = time.time() - start_time
@@ -351,18 +730,33 @@ def main():
 使用示例:
   python ts_merger.py "D:\\Videos"          # 合并并删除原始TS文件
   python ts_merger.py "D:\\Videos" --keep   # 合并并保留原始TS文件
+  python ts_merger.py "D:\\Videos" -j 4     # 同时合并4个目录（每个设备最多2个）
+  python ts_merger.py "D:\\Videos" --ts     # 输出拼接好的TS，分段兼容时完全不经过ffmpeg
 
 注意:
   - 每个目录内的TS文件将按文件名排序后合并
   - 合并后的MP4文件将保存在脚本所在目录
   - 输出文件名与目录名相同（特殊字符会被替换为下划线）
+  - 分段的PID与流类型一致时按字节拼接后只封装一次（需要临时占用一份TS大小的空间），
+    否则自动退回ffmpeg concat
         """
     )
     parser.add_argument('directory', help='要处理的目录路径')
     parser.add_argument('--keep', action='store_true', 
                        help='保留原始TS文件（默认情况下会删除合并成功的TS文件）')
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                       help='同时合并的目录数（默认: %(default)s，即逐个合并）')
+    parser.add_argument('--ts', action='store_true',
+                       help='输出合并后的TS文件而不封装为MP4')
+    parser.add_argument('--no-fast', action='store_true',
+                       help='不尝试字节级快速合并，始终使用ffmpeg concat')
+    parser.add_argument('--per-device', type=int, default=2,
+                       help='同一源设备或目标设备上同时进行的合并数上限，避免机械盘来回寻道（默认: %(default)s）')
     
     args = parser.parse_args()
+    if args.jobs < 1 or args.per_device < 1:
+        print("错误: --jobs 和 --per-device 至少为1")
+        sys.exit(1)
     
     # 获取绝对路径
     target_directory = os.path.abspath(args.directory)
@@ -370,10 +764,15 @@ def main():
     print(f"目标目录: {target_directory}")
     print(f"删除原始文件: {'否' if args.keep else '是'}")
     print(f"输出目录: {os.path.dirname(os.path.abspath(__file__))}")
+    if args.jobs > 1:
+        print(f"并行合并: {args.jobs} 个目录（每个设备最多 {args.per_device} 个）")
     print("-" * 60)
     
     # 执行合并（默认删除原始文件，除非指定了--keep参数）
-    success, failure, skipped = find_and_merge_ts_files(target_directory, not args.keep)
+    success, failure, skipped = find_and_merge_ts_files(
+        target_directory, not args.keep, args.jobs, args.per_device,
+        not args.no_fast, ".ts" if args.ts else ".mp4"
+    )
     
     print("=" * 60)
     print(f"合并完成!")
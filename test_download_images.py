@@ -0,0 +1,158 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "misc"))
+
+import download_images as backend  # noqa: E402
+
+
+class SimulatedCrash(Exception):
+    pass
+
+
+class ProgressJournalTests(unittest.TestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.txt_path = os.path.join(temp_dir.name, "urls.txt")
+        self.urls = [f"https://example.test/{i}.jpg" for i in range(6)]
+        with open(self.txt_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(self.urls) + "\n")
+
+    def make_journal(self, compact_every=100):
+        journal = backend.ProgressJournal(self.txt_path, sync_interval=5, compact_every=compact_every)
+        self.addCleanup(lambda: journal.file and journal.file.close())
+        return journal
+
+    def test_resume_after_crash_skips_recorded_entries(self):
+        journal = self.make_journal()
+        entries, done = journal.open()
+        self.assertEqual((entries, done), (self.urls, set()))
+        journal.record(1)
+        journal.record(4)
+        # 模拟崩溃：不调用close，日志末尾还留着写了一半的行
+        journal.file.write("5")
+        journal.file.flush()
+
+        entries, done = self.make_journal().open()
+
+        self.assertEqual(entries, self.urls)
+        self.assertEqual(done, {1, 4})
+
+    def test_crash_between_compaction_and_journal_reset_loses_nothing(self):
+        journal = self.make_journal(compact_every=2)
+        journal.open()
+        journal.record(0)
+        with patch.object(backend.ProgressJournal, "_reset", side_effect=SimulatedCrash):
+            with self.assertRaises(SimulatedCrash):
+                journal.record(2)  # 第二条触发压实：txt已写回，重置日志前崩溃
+
+        entries, done = self.make_journal().open()
+
+        # 旧日志的指纹与压实后的txt不符，整个忽略，不会按旧行号误删
+        self.assertEqual(entries, [self.urls[i] for i in (1, 3, 4, 5)])
+        self.assertEqual(done, set())
+
+    def test_records_after_compaction_map_to_original_indices(self):
+        journal = self.make_journal(compact_every=2)
+        journal.open()
+        journal.record(0)
+        journal.record(2)  # 压实，txt只剩1、3、4、5
+        journal.record(4)
+        journal.file.flush()
+
+        entries, done = self.make_journal().open()
+
+        self.assertEqual(entries, [self.urls[i] for i in (1, 3, 4, 5)])
+        self.assertEqual(done, {2})
+
+    def test_close_compacts_and_removes_journal(self):
+        journal = self.make_journal()
+        journal.open()
+        for i in (0, 1, 5):
+            journal.record(i)
+        journal.close()
+
+        self.assertFalse(os.path.exists(journal.path))
+        self.assertEqual(backend.load_entries(self.txt_path), [self.urls[i] for i in (2, 3, 4)])
+
+
+class TokenBucketTests(unittest.TestCase):
+    def test_burst_then_rate_limited(self):
+        bucket = backend.TokenBucket(rate=2, burst=2, min_rate=0.5, max_rate=8)
+        now = bucket.updated
+        bucket.take(now)
+        bucket.take(now)
+
+        self.assertAlmostEqual(bucket.wait_time(now), 0.5)
+        self.assertEqual(bucket.wait_time(now + 0.5), 0.0)
+
+    def test_aimd_rate_stays_within_bounds(self):
+        bucket = backend.TokenBucket(rate=2, burst=2, min_rate=0.5, max_rate=3)
+        bucket.on_throttle()
+        self.assertEqual(bucket.rate, 1)
+        self.assertLessEqual(bucket.tokens, 0)
+        bucket.on_throttle()
+        bucket.on_throttle()
+        self.assertEqual(bucket.rate, 0.5)
+        for _ in range(10):
+            bucket.on_success()
+        self.assertEqual(bucket.rate, 3)
+
+
+class HostSchedulerTests(unittest.TestCase):
+    @staticmethod
+    def task(order, url, lane=0):
+        return [order, order, url, 0, f"{order}.part", lane]
+
+    def test_per_host_limit_is_shared_by_all_lists(self):
+        scheduler = backend.HostScheduler(per_host=1, rate=100, max_rate=100)
+        scheduler.add(self.task(0, "https://a.test/0", lane=0))
+        scheduler.add(self.task(1, "https://a.test/1", lane=1))
+        scheduler.add(self.task(2, "https://b.test/2", lane=1))
+        now = max(state.bucket.updated for state in scheduler.hosts.values())
+
+        first = scheduler.next_task(now)
+        second = scheduler.next_task(now)
+
+        self.assertEqual([first[0], second[0]], [0, 2])  # type: ignore
+        self.assertIsNone(scheduler.next_task(now))
+        self.assertEqual(scheduler.pending(), 1)
+
+        scheduler.on_done(first[2], None, now)  # type: ignore
+        # burst 等于并发上限 1，腾出并发位后还要等令牌补上
+        self.assertIsNone(scheduler.next_task(now))
+        self.assertEqual(scheduler.next_task(now + 1)[0], 1)  # type: ignore
+
+    def test_lists_take_turns(self):
+        scheduler = backend.HostScheduler(per_host=10, rate=100, max_rate=100)
+        for order in range(4):
+            scheduler.add(self.task(order, f"https://a.test/{order}", lane=0))
+        for order in range(4, 6):
+            scheduler.add(self.task(order, f"https://b.test/{order}", lane=1))
+        now = max(state.bucket.updated for state in scheduler.hosts.values())
+
+        lanes = [scheduler.next_task(now)[5] for _ in range(4)]  # type: ignore
+
+        self.assertEqual(lanes, [0, 1, 0, 1])
+
+    def test_throttled_host_is_paused_for_retry_after(self):
+        scheduler = backend.HostScheduler(per_host=2, rate=100, max_rate=100)
+        scheduler.add(self.task(0, "https://a.test/0"))
+        scheduler.add(self.task(1, "https://a.test/1"))
+        now = scheduler.hosts["a.test"].bucket.updated
+        task = scheduler.next_task(now)
+
+        with patch.object(backend, "throttle_info", return_value=(True, 30)):
+            scheduler.on_done(task[2], "429", now)  # type: ignore
+
+        self.assertIsNone(scheduler.next_task(now + 1))
+        self.assertAlmostEqual(scheduler.next_ready_in(now + 1), 29)  # type: ignore
+        self.assertEqual(scheduler.hosts["a.test"].bucket.rate, 50)
+
+
+if __name__ == "__main__":
+    unittest.main()
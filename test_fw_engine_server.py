@@ -0,0 +1,115 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import MagicMock, patch
+
+import fw_engine_server as backend
+
+
+class JobQueueTests(unittest.TestCase):
+    def test_higher_priority_first_then_fifo(self):
+        queue = backend.JobQueue(maxsize=4)
+        first = backend.TranscribeJob("first.mp4")
+        urgent = backend.TranscribeJob("urgent.mp4", priority=3)
+        second = backend.TranscribeJob("second.mp4")
+        for job in (first, urgent, second):
+            self.assertTrue(queue.put(job))
+
+        self.assertEqual([queue.get(timeout=0) for _ in range(3)], [urgent, first, second])
+        self.assertIsNone(queue.get(timeout=0))
+
+    def test_removed_job_is_skipped_and_frees_its_slot(self):
+        queue = backend.JobQueue(maxsize=2)
+        dropped = backend.TranscribeJob("dropped.mp4")
+        kept = backend.TranscribeJob("kept.mp4")
+        queue.put(dropped)
+        queue.put(kept)
+        self.assertFalse(queue.put(backend.TranscribeJob("overflow.mp4")))
+
+        self.assertTrue(queue.remove(dropped.job_id))
+        self.assertFalse(queue.remove(dropped.job_id))
+        self.assertEqual(len(queue), 1)
+        self.assertIs(queue.get(timeout=0), kept)
+        self.assertFalse(queue.remove(kept.job_id))
+
+
+class TranscriptionServiceTests(unittest.TestCase):
+    def setUp(self):
+        self.whisper = MagicMock()
+        self.service = backend.TranscriptionService(self.whisper, max_queue=4)
+
+    def test_cancel_while_queued_removes_job(self):
+        job = self.service.submit("a.mp4")
+        assert job is not None
+
+        self.service.cancel(job.job_id)
+
+        self.assertEqual(job.status, backend.JOB_CANCELLED)
+        self.assertIsNone(self.service.queue.get(timeout=0))
+
+    def test_cancel_after_dequeue_finishes_job_without_running_it(self):
+        job = self.service.submit("a.mp4")
+        assert job is not None
+        # 工作线程已经get()出任务、还没标记为运行中时收到取消
+        dequeued = self.service.queue.get(timeout=0)
+        self.assertIs(dequeued, job)
+
+        self.service.cancel(job.job_id)
+        self.assertEqual(job.status, backend.JOB_QUEUED)
+        self.service._process_job(dequeued)
+
+        self.assertEqual(job.status, backend.JOB_CANCELLED)
+        self.assertIsNotNone(job.finished_at)
+        self.whisper.transcribe_to_file.assert_not_called()
+        self.assertEqual(self.service.describe(job)["status"], backend.JOB_CANCELLED)
+
+    def test_unknown_options_are_rejected(self):
+        with self.assertRaises(ValueError):
+            self.service.submit("a.mp4", options={"rm_rf": True})
+
+    def test_finished_jobs_are_pruned_by_count_and_age(self):
+        with patch.object(backend, "MAX_FINISHED_JOBS", 2):
+            jobs = [self.service.submit(f"{i}.mp4") for i in range(3)]
+            pending = self.service.submit("pending.mp4")
+            for job in jobs:
+                self.service.cancel(job.job_id)  # type: ignore
+
+        self.assertEqual(set(self.service.jobs), {jobs[1].job_id, jobs[2].job_id, pending.job_id})  # type: ignore
+
+        with patch.object(backend.time, "time", return_value=jobs[2].finished_at + backend.FINISHED_JOB_TTL + 1):  # type: ignore
+            self.service.cancel(pending.job_id)  # type: ignore
+
+        # 刚取消的任务保留，过期的已结束任务被清掉
+        self.assertEqual(set(self.service.jobs), {pending.job_id})  # type: ignore
+
+
+class RequestHandlerTests(unittest.TestCase):
+    def setUp(self):
+        self.service = backend.TranscriptionService(MagicMock(), max_queue=4)
+        server = backend.ThreadingHTTPServer(("127.0.0.1", 0), backend.make_request_handler(self.service))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.client = backend.TranscribeClient(*server.server_address[:2])
+
+    def test_non_object_bodies_are_rejected_with_400(self):
+        for payload in ([], "x", 1, {"media_path": 3}, {"media_path": __file__, "options": ["force_align"]}):
+            with self.subTest(payload=payload):
+                with self.assertRaisesRegex(UserWarning, "400"):
+                    self.client._request("POST", "/jobs", payload)
+        self.assertEqual(len(self.service.queue), 0)
+
+    def test_submit_and_fetch_status(self):
+        with tempfile.NamedTemporaryFile(suffix=".mp4") as media:
+            job = self.client.submit(media.name, priority=2)
+
+        self.assertEqual(job["status"], backend.JOB_QUEUED)
+        self.assertEqual(job["priority"], 2)
+        self.assertEqual(self.client.status(job["job_id"])["media_path"], os.path.abspath(media.name))
+        with self.assertRaisesRegex(UserWarning, "409"):
+            self.client.result(job["job_id"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,377 @@
+import hashlib
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "misc"))
+
+import photo_dedup as backend  # noqa: E402
+
+
+def write_file(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+class PhotoDedupTestCase(unittest.TestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.root = Path(temp_dir.name) / "photos"
+        self.trash = self.root / backend.DEFAULT_TRASH_DIR_NAME
+        self.cache_path = Path(temp_dir.name) / "cache" / backend.CACHE_FILE_NAME
+        patcher = patch("builtins.print")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_tree(self):
+        big = os.urandom(backend.SAMPLE_SIZE * 3)
+        # 头尾相同、中间不同：采样无法区分，必须走全量哈希
+        middle_changed = big[: backend.SAMPLE_SIZE] + os.urandom(backend.SAMPLE_SIZE) + big[-backend.SAMPLE_SIZE :]
+        small = b"small image"
+        write_file(str(self.root / "a" / "big1.jpg"), big)
+        write_file(str(self.root / "b" / "big2.jpg"), big)
+        write_file(str(self.root / "b" / "big3.jpg"), middle_changed)
+        write_file(str(self.root / "a" / "small1.png"), small)
+        write_file(str(self.root / "c" / "small2.png"), small)
+        write_file(str(self.root / "c" / "unique.gif"), b"unique")
+
+    def collect(self):
+        return backend.collect_images(self.root, self.trash, workers=4)
+
+
+class HashCacheTests(PhotoDedupTestCase):
+    def find(self, cache):
+        return backend.find_duplicates(self.collect(), workers=2, cache=cache)
+
+    def test_rerun_is_served_from_cache(self):
+        self.make_tree()
+        cache = backend.HashCache(self.cache_path)
+        first = self.find(cache)
+        cache.close()
+        self.assertEqual(sorted(len(v) for v in first.values()), [2, 2])
+
+        cache = backend.HashCache(self.cache_path)
+        self.addCleanup(cache.close)
+        with patch.object(backend, "compute_sample_hash", side_effect=AssertionError("读了盘")), patch.object(
+            backend, "compute_full_hash", side_effect=AssertionError("读了盘")
+        ):
+            second = self.find(cache)
+        self.assertEqual(second, first)
+
+    def test_changed_file_is_rehashed(self):
+        self.make_tree()
+        cache = backend.HashCache(self.cache_path)
+        self.find(cache)
+        cache.close()
+
+        path = str(self.root / "c" / "small2.png")
+        write_file(path, b"small imagf")
+        st = os.stat(path)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+
+        cache = backend.HashCache(self.cache_path)
+        self.addCleanup(cache.close)
+        real = backend.compute_sample_hash
+        with patch.object(backend, "compute_sample_hash", side_effect=real) as sample:
+            result = self.find(cache)
+        self.assertEqual([args[0] for args, _ in sample.call_args_list], [path])
+        self.assertEqual(len(result), 1)
+
+    def test_read_only_cache_never_writes(self):
+        self.make_tree()
+        cache = backend.HashCache(self.cache_path)
+        self.find(cache)
+        cache.close()
+        before = self.cache_path.read_bytes()
+
+        write_file(str(self.root / "d" / "new1.jpg"), b"new")
+        write_file(str(self.root / "d" / "new2.jpg"), b"new")
+        cache = backend.HashCache(self.cache_path, read_only=True)
+        self.addCleanup(cache.close)
+        self.assertEqual(len(self.find(cache)), 3)
+        self.assertEqual(self.cache_path.read_bytes(), before)
+
+    def test_list_only_does_not_create_cache(self):
+        self.make_tree()
+        code = backend.process(
+            self.root, self.trash, dry_run=False, list_only=True, workers=2, cache_path=self.cache_path, write_cache=False
+        )
+        self.assertEqual(code, 0)
+        self.assertFalse(self.cache_path.exists())
+
+
+class BKTreeTests(unittest.TestCase):
+    def test_search_matches_brute_force(self):
+        rng = random.Random(38)
+        base = [rng.getrandbits(64) for _ in range(40)]
+        # 围绕少量中心生成近邻，保证各阈值下都有命中
+        values = [b ^ (1 << rng.randrange(64)) ^ (1 << rng.randrange(64)) for b in base for _ in range(10)]
+        values += base + base[:5]
+        tree = backend.BKTree()
+        for i, value in enumerate(values):
+            tree.add(value, i)
+        for threshold in (0, 2, 5, 12):
+            for probe in values[::7] + [rng.getrandbits(64) for _ in range(20)]:
+                expected = [i for i, v in enumerate(values) if backend._hamming(v, probe) <= threshold]
+                self.assertEqual(sorted(tree.search(probe, threshold)), expected)
+
+    def test_empty_tree(self):
+        self.assertEqual(backend.BKTree().search(0, 64), [])
+
+
+class FindSimilarTests(unittest.TestCase):
+    def find(self, values, threshold):
+        images = [backend.ImageEntry(f"img{i:03d}.jpg", 1, 0, i, 0) for i in range(len(values))]
+        by_path = {e.path: v for e, v in zip(images, values)}
+        with patch.object(backend, "ProcessPoolExecutor", ThreadPoolExecutor), patch.object(
+            backend, "_perceptual_job", side_effect=lambda job: by_path[job[1]]
+        ), patch("builtins.print"):
+            return backend.find_similar(images, workers=2, threshold=threshold)
+
+    def test_chain_is_not_merged_transitively(self):
+        # 0~1、1~2 距离都为 4，但 0 与 2 相距 8
+        a, b, c = 0, 0xF, 0xFF
+        self.assertEqual(self.find([a, b, c], threshold=4), {f"{a:016x}": ["img000.jpg", "img001.jpg"]})
+
+    def test_groups_match_quadratic_reference(self):
+        rng = random.Random(380)
+        centers = [rng.getrandbits(64) for _ in range(15)]
+        values = []
+        for _ in range(300):
+            v = rng.choice(centers)
+            for _ in range(rng.randrange(6)):
+                v ^= 1 << rng.randrange(64)
+            values.append(v)
+        values[10] = None
+        threshold = 4
+
+        expected = {}
+        members = sorted((i for i, v in enumerate(values) if v is not None), key=lambda i: f"img{i:03d}.jpg")
+        while members:
+            keep = values[members[0]]
+            close = [i for i in members if backend._hamming(values[i], keep) <= threshold]
+            if len(close) >= 2:
+                expected[f"{keep:016x}"] = [f"img{i:03d}.jpg" for i in close]
+            members = [i for i in members if backend._hamming(values[i], keep) > threshold]
+
+        self.assertEqual(self.find(values, threshold), expected)
+
+
+class ParallelMapTests(unittest.TestCase):
+    def setUp(self):
+        patcher = patch("builtins.print")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_results_keep_input_order_and_reads_follow_inode_order(self):
+        items = [backend.ImageEntry(f"d{dev}/f{ino}", 10, dev, ino, 0) for dev, ino in [(1, 5), (2, 3), (1, 2), (2, 9), (1, 7)]]
+        seen = []
+
+        def worker(item):
+            seen.append(item)
+            return item.path.upper()
+
+        results = backend._parallel_map(items, worker, desc="t", workers=4, per_device=1)
+        self.assertEqual(results, [e.path.upper() for e in items])
+        for dev in (1, 2):
+            inodes = [e.ino for e in seen if e.dev == dev]
+            self.assertEqual(inodes, sorted(inodes))
+
+    def test_per_device_concurrency_is_capped(self):
+        items = [backend.ImageEntry(f"d{i % 2}/f{i}", 1, i % 2, i, 0) for i in range(24)]
+        lock = threading.Lock()
+        active = {0: 0, 1: 0}
+        peak = {0: 0, 1: 0}
+
+        def worker(item):
+            with lock:
+                active[item.dev] += 1
+                peak[item.dev] = max(peak[item.dev], active[item.dev])
+            time.sleep(0.005)
+            with lock:
+                active[item.dev] -= 1
+
+        stats = backend.DeviceStats()
+        backend._parallel_map(items, worker, desc="t", workers=16, per_device=2, bytes_of=lambda e: e.size, stats=stats)
+        self.assertEqual(peak, {0: 2, 1: 2})
+        self.assertEqual(dict(stats.files), {0: 12, 1: 12})
+        self.assertEqual(dict(stats.bytes), {0: 12, 1: 12})
+
+    def test_os_error_becomes_none_other_errors_propagate(self):
+        items = [backend.ImageEntry(f"f{i}", 1, 0, i, 0) for i in range(3)]
+
+        def flaky(item):
+            if item.ino == 1:
+                raise PermissionError("denied")
+            return item.ino
+
+        self.assertEqual(backend._parallel_map(items, flaky, desc="t", workers=2), [0, None, 2])
+        with self.assertRaises(ValueError):
+            backend._parallel_map(items, lambda item: int("x"), desc="t", workers=2)
+
+
+class CollectImagesTests(PhotoDedupTestCase):
+    def test_matches_os_walk_and_skips_trash(self):
+        for d in range(6):
+            for sub in range(4):
+                folder = self.root / f"d{d}" / f"s{sub}" / "deeper"
+                write_file(str(folder / f"p{d}{sub}.JPG"), b"x" * (d + sub))
+                write_file(str(folder / "notes.txt"), b"not an image")
+        write_file(str(self.root / "top.png"), b"top")
+        write_file(str(self.trash / "old.jpg"), b"trashed")
+        write_file(str(self.trash / "nested" / "old2.jpg"), b"trashed")
+        os.makedirs(self.root / "empty")
+
+        expected = []
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            dirnames[:] = [d for d in dirnames if os.path.join(dirpath, d) != str(self.trash)]
+            expected += [os.path.join(dirpath, f) for f in filenames if backend.is_image_filename(f)]
+        expected.sort(key=str.lower)
+
+        for workers in (1, 8):
+            images = backend.collect_images(self.root, self.trash, workers=workers)
+            self.assertEqual([e.path for e in images], expected)
+            top = next(e for e in images if e.path.endswith("top.png"))
+            st = os.stat(top.path)
+            self.assertEqual((top.size, top.mtime_ns), (st.st_size, st.st_mtime_ns))
+
+    def test_trash_as_root_yields_nothing(self):
+        write_file(str(self.trash / "old.jpg"), b"trashed")
+        self.assertEqual(backend.collect_images(self.trash, self.trash, workers=4), [])
+
+    @unittest.skipIf(os.name == "nt" or os.geteuid() == 0, "需要非 root 的 POSIX 权限")
+    def test_unreadable_directory_is_skipped(self):
+        write_file(str(self.root / "ok" / "a.jpg"), b"a")
+        locked = self.root / "locked"
+        write_file(str(locked / "b.jpg"), b"b")
+        os.chmod(locked, 0)
+        self.addCleanup(os.chmod, locked, 0o755)
+        images = backend.collect_images(self.root, self.trash, workers=4)
+        self.assertEqual([os.path.basename(e.path) for e in images], ["a.jpg"])
+
+
+class ActionUndoTests(PhotoDedupTestCase):
+    def setUp(self):
+        super().setUp()
+        self.make_tree()
+        self.journal = self.root / backend.DEFAULT_JOURNAL_NAME
+        self.dups = [str(self.root / "b" / "big2.jpg"), str(self.root / "c" / "small2.png")]
+        self.keeps = [str(self.root / "a" / "big1.jpg"), str(self.root / "a" / "small1.png")]
+        self.snapshot = {p: self.read(p) for p in self.dups + self.keeps}
+
+    def read(self, path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    def run_process(self, link=None):
+        code = backend.process(
+            self.root, self.trash, dry_run=False, list_only=False, workers=2, cache_path=None, link=link, journal_path=self.journal
+        )
+        self.assertEqual(code, 0)
+
+    def assert_restored(self):
+        for path, data in self.snapshot.items():
+            self.assertEqual(self.read(path), data)
+
+    def test_move_then_undo(self):
+        self.run_process()
+        for path in self.dups:
+            self.assertFalse(os.path.exists(path))
+        self.assertEqual(sorted(os.listdir(self.trash)), ["big2.jpg", "small2.png"])
+
+        self.assertEqual(backend.undo_journal(self.journal), 0)
+        self.assert_restored()
+        self.assertEqual(os.listdir(self.trash), [])
+        # 同一次运行已回滚，不会再被选中
+        self.assertEqual(backend.undo_journal(self.journal), 0)
+        self.assert_restored()
+
+    @unittest.skipUnless(hasattr(os, "link"), "需要硬链接")
+    def test_hard_link_then_undo(self):
+        dup = self.dups[0]
+        os.chmod(dup, 0o640)
+        os.utime(dup, ns=(1_500_000_000 * 10**9, 1_500_000_000 * 10**9))
+        before = os.stat(dup)
+
+        self.run_process(link="hard")
+        for keep, path in zip(self.keeps, self.dups):
+            self.assertTrue(os.path.samefile(keep, path))
+        self.assertFalse(os.path.exists(self.trash))
+
+        self.assertEqual(backend.undo_journal(self.journal), 0)
+        self.assert_restored()
+        for keep, path in zip(self.keeps, self.dups):
+            self.assertFalse(os.path.samefile(keep, path))
+        after = os.stat(dup)
+        self.assertEqual((after.st_mode, after.st_mtime_ns), (before.st_mode, before.st_mtime_ns))
+
+    def test_partial_undo_can_be_retried(self):
+        self.run_process()
+        blocker = self.dups[1]
+        write_file(blocker, b"someone put a file back")
+
+        self.assertEqual(backend.undo_journal(self.journal), 2)
+        self.assertEqual(self.read(self.dups[0]), self.snapshot[self.dups[0]])
+
+        os.remove(blocker)
+        with patch.object(backend.shutil, "move", wraps=backend.shutil.move) as move:
+            self.assertEqual(backend.undo_journal(self.journal), 0)
+        self.assertEqual([args[1] for args, _ in move.call_args_list], [blocker])
+        self.assert_restored()
+
+
+class HashingTests(PhotoDedupTestCase):
+    def test_mmap_and_buffered_paths_agree_with_hashlib(self):
+        chunk = 1024
+        sizes = [1, chunk - 1, chunk, chunk + 1, 5 * chunk, 5 * chunk + 17]
+        for algo in backend.available_hash_algos():
+            for size in sizes:
+                path = str(self.root / f"{algo}_{size}.bin")
+                data = os.urandom(size)
+                write_file(path, data)
+                with patch.object(backend, "CHUNK_SIZE", chunk):
+                    with patch.object(backend, "MMAP_THRESHOLD", 1):
+                        mapped = backend.compute_full_hash(path, algo)
+                    with patch.object(backend, "MMAP_THRESHOLD", 10**12):
+                        buffered = backend.compute_full_hash(path, algo)
+                reference = backend.new_hasher(algo)
+                reference.update(data)
+                self.assertEqual(mapped, reference.hexdigest(), (algo, size))
+                self.assertEqual(buffered, reference.hexdigest(), (algo, size))
+        self.assertEqual(backend.compute_full_md5(path), hashlib.md5(data).hexdigest())
+
+    def test_empty_file(self):
+        path = str(self.root / "empty.jpg")
+        write_file(path, b"")
+        self.assertEqual(backend.compute_full_hash(path, "blake2b"), hashlib.blake2b(b"", digest_size=16).hexdigest())
+
+    def test_unknown_algo_is_rejected(self):
+        with self.assertRaises(ValueError):
+            backend.new_hasher("sha1")
+
+    def test_cache_rows_are_per_algorithm(self):
+        self.make_tree()
+        images = self.collect()
+        md5_cache = backend.HashCache(self.cache_path, algo="md5")
+        md5_result = backend.find_duplicates(images, workers=2, cache=md5_cache, algo="md5")
+        md5_cache.close()
+
+        cache = backend.HashCache(self.cache_path, algo="blake2b")
+        self.addCleanup(cache.close)
+        self.assertTrue(all(cache.lookup(e) is None for e in images))
+        result = backend.find_duplicates(images, workers=2, cache=cache, algo="blake2b")
+        self.assertEqual(sorted(result.values()), sorted(md5_result.values()))
+        self.assertNotEqual(set(result), set(md5_result))
+
+
+if __name__ == "__main__":
+    unittest.main()
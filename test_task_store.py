@@ -0,0 +1,144 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "whisper_it"))
+
+from models.whisper_task import WhisperTask  # noqa: E402
+from stores import task_store as backend  # noqa: E402
+
+
+class TaskStoreTests(unittest.TestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory(ignore_cleanup_errors=True)
+        self.addCleanup(temp_dir.cleanup)
+        self.db_path = os.path.join(temp_dir.name, "tasks.sqlite3")
+
+    def make_store(self, **kwargs):
+        return backend.TaskStore(self.db_path, **kwargs)
+
+    def test_claim_follows_priority_then_insertion_order(self):
+        store = self.make_store()
+        low = store.add(WhisperTask("low.mp4"))
+        high = store.add(WhisperTask("high.mp4", priority=5))
+        later_low = store.add(WhisperTask("later_low.mp4"))
+
+        claimed = [store.claim("w1") for _ in range(3)]
+
+        self.assertEqual([task_id for task_id, _task in claimed], [high, low, later_low])  # type: ignore
+        self.assertEqual(claimed[0][1].media_path, "high.mp4")  # type: ignore
+        self.assertIsNone(store.claim("w1"))
+
+    def test_two_workers_racing_on_claim_never_share_a_task(self):
+        store = self.make_store()
+        task_ids = {store.add(WhisperTask(f"{i}.mp4")) for i in range(40)}
+        barrier = threading.Barrier(2)
+        claimed = {"w1": [], "w2": []}
+
+        def worker(name):
+            barrier.wait()
+            while True:
+                claim = store.claim(name)
+                if claim is None:
+                    return
+                claimed[name].append(claim[0])
+
+        threads = [threading.Thread(target=worker, args=(name,)) for name in claimed]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        all_claimed = claimed["w1"] + claimed["w2"]
+        self.assertEqual(len(all_claimed), len(task_ids))
+        self.assertEqual(set(all_claimed), task_ids)
+        self.assertEqual(store.pending_count(), 0)
+
+    def test_expired_lease_is_recovered_by_another_worker(self):
+        store = self.make_store(lease_seconds=60, max_attempts=2)
+        task_id = store.add(WhisperTask("stuck.mp4"))
+        with patch.object(backend.time, "time", return_value=1000.0):
+            self.assertEqual(store.claim("w1")[0], task_id)  # type: ignore
+        with patch.object(backend.time, "time", return_value=1030.0):
+            self.assertEqual(store.expired_workers(), [])
+        with patch.object(backend.time, "time", return_value=1061.0):
+            self.assertEqual(store.expired_workers(), ["w1"])
+
+        store.release_worker("w1")
+
+        self.assertEqual(store.pending_count(), 1)
+        reclaimed = store.claim("w2")
+        self.assertEqual(reclaimed[0], task_id)  # type: ignore
+        self.assertEqual(reclaimed[1].media_path, "stuck.mp4")  # type: ignore
+        # 过期的w1再释放一次，不能把w2已领取的任务放回队列
+        store.release_worker("w1")
+        self.assertEqual(store.pending_count(), 0)
+
+    def test_task_is_failed_after_max_attempts(self):
+        store = self.make_store(max_attempts=2)
+        store.add(WhisperTask("crashy.mp4"))
+        for worker in ("w1", "w2"):
+            self.assertIsNotNone(store.claim(worker))
+            store.release_worker(worker)
+
+        self.assertIsNone(store.claim("w3"))
+        self.assertEqual(store.fail_exhausted(), ["crashy.mp4"])
+        self.assertEqual(store.pending_count(), 0)
+
+    def test_restart_only_recovers_expired_leases(self):
+        store = self.make_store(lease_seconds=60)
+        crashed = store.add(WhisperTask("crashed.mp4"))
+        running = store.add(WhisperTask("running.mp4"))
+        with patch.object(backend.time, "time", return_value=1000.0):
+            store.claim("dead-worker")
+        store.claim("other-instance")
+
+        restarted = self.make_store(lease_seconds=60)
+
+        self.assertEqual(restarted.release_expired(), 1)
+        self.assertEqual(restarted.claim("new-worker")[0], crashed)  # type: ignore
+        # 另一个实例租约未过期的任务不能被抢走
+        self.assertIsNone(restarted.claim("new-worker"))
+        restarted.ack(crashed)
+        store.ack(running)
+        self.assertEqual(restarted.pending_count(), 0)
+
+    def test_release_expired_skips_excluded_workers(self):
+        store = self.make_store(lease_seconds=60)
+        store.add(WhisperTask("mine.mp4"))
+        store.add(WhisperTask("foreign.mp4"))
+        with patch.object(backend.time, "time", return_value=1000.0):
+            store.claim(123)
+            store.claim("foreign")
+
+        self.assertEqual(store.release_expired(exclude_workers=[123]), 1)
+        self.assertEqual(store.expired_workers(), ["123"])
+        self.assertEqual(store.claim("w")[1].media_path, "foreign.mp4")  # type: ignore
+
+    def test_pending_count_ignores_exhausted_tasks(self):
+        store = self.make_store(max_attempts=1)
+        store.add(WhisperTask("crashy.mp4"))
+        store.add(WhisperTask("fresh.mp4"))
+        store.claim("w1")
+        store.release_worker("w1")
+
+        self.assertEqual(store.pending_count(), 1)
+
+    def test_purge_failed_keeps_latest_records(self):
+        store = self.make_store()
+        task_ids = [store.add(WhisperTask(f"{i}.mp4")) for i in range(3)]
+        for task_id in task_ids:
+            store.fail(task_id, "boom")
+
+        self.assertEqual(store.purge_failed(keep_latest=1), 2)
+        rows = store.conn.execute("SELECT id FROM tasks WHERE status = ?", (backend.FAILED,)).fetchall()
+        self.assertEqual(rows, [(task_ids[-1],)])
+        self.assertEqual(store.purge_failed(), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,175 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "misc"))
+
+import ts_merger as backend  # noqa: E402
+
+PMT_PID = 0x1000
+VIDEO_PID = 0x100
+H264_AAC = ((VIDEO_PID, 0x1B), (0x101, 0x0F))
+FRAME_TICKS = 3600  # 25fps，90kHz
+# 代替ffmpeg：把标准输入原样写到最后一个参数（输出文件）
+FAKE_FFMPEG = "import shutil, sys; shutil.copyfileobj(sys.stdin.buffer, open(sys.argv[-1], 'wb'))"
+
+
+def ts_packet(pid, payload, start=True, adaptation=b""):
+    control = (0x20 if adaptation else 0) | (0x10 if payload else 0)
+    header = bytes([0x47, (0x40 if start else 0) | (pid >> 8), pid & 0xFF, control])
+    body = (bytes([len(adaptation)]) + adaptation if adaptation else b"") + payload
+    return header + body + b"\xff" * (backend.TS_PACKET_SIZE - 4 - len(body))
+
+
+def psi_packet(pid, table_id, body):
+    length = len(body) + 4  # 末尾CRC
+    section = bytes([table_id, 0xB0 | (length >> 8), length & 0xFF]) + body + b"\0\0\0\0"
+    return ts_packet(pid, b"\x00" + section)
+
+
+def pat_packet():
+    return psi_packet(0, 0x00, b"\x00\x01\xc1\x00\x00" + bytes([0, 1, 0xE0 | (PMT_PID >> 8), PMT_PID & 0xFF]))
+
+
+def pmt_packet(streams):
+    es = b"".join(bytes([stream_type, 0xE0 | (pid >> 8), pid & 0xFF, 0xF0, 0]) for pid, stream_type in streams)
+    return psi_packet(PMT_PID, 0x02, b"\x00\x01\xc1\x00\x00" + bytes([0xE0 | (VIDEO_PID >> 8), VIDEO_PID & 0xFF]) + b"\xf0\x00" + es)
+
+
+def video_packet(pts):
+    pcr = bytes([0x10, (pts >> 25) & 0xFF, (pts >> 17) & 0xFF, (pts >> 9) & 0xFF, (pts >> 1) & 0xFF, ((pts & 1) << 7) | 0x7E, 0])
+    pts_bytes = bytes([
+        0x21 | ((pts >> 29) & 0x0E), (pts >> 22) & 0xFF, ((pts >> 14) & 0xFE) | 1, (pts >> 7) & 0xFF, ((pts << 1) & 0xFE) | 1,
+    ])
+    return ts_packet(VIDEO_PID, b"\x00\x00\x01\xe0\x00\x00\x80\x80\x05" + pts_bytes, adaptation=pcr)
+
+
+class TsMergerTests(unittest.TestCase):
+    def setUp(self):
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        self.dir = temp_dir.name
+
+    def write_segment(self, name, streams=H264_AAC, start_pts=0, frames=10, tail=b""):
+        path = os.path.join(self.dir, name)
+        with open(path, "wb") as f:
+            f.write(pat_packet())
+            f.write(pmt_packet(streams))
+            for i in range(frames):
+                f.write(video_packet((start_pts + i * FRAME_TICKS) % backend.TS_CLOCK_WRAP))
+            f.write(tail)
+        return path
+
+    def consecutive_segments(self, count, start_pts=0, frames=10):
+        return [
+            self.write_segment(f"{i:03d}.ts", start_pts=start_pts + i * frames * FRAME_TICKS, frames=frames)
+            for i in range(count)
+        ]
+
+    def test_read_ts_layout_parses_pat_and_pmt(self):
+        path = self.write_segment("000.ts")
+
+        self.assertEqual(backend.read_ts_layout(path), ((1, PMT_PID, H264_AAC),))
+
+    def test_read_ts_layout_rejects_misaligned_size(self):
+        path = self.write_segment("000.ts", tail=b"\x47" * 100)
+
+        self.assertIsNone(backend.read_ts_layout(path))
+
+    def test_read_ts_layout_rejects_lost_sync(self):
+        path = self.write_segment("000.ts")
+        with open(path, "r+b") as f:
+            f.seek(backend.TS_PACKET_SIZE)  # PMT包
+            f.write(b"\x00")
+
+        self.assertIsNone(backend.read_ts_layout(path))
+
+    def test_read_ts_timing_handles_clock_wrap(self):
+        start = backend.TS_CLOCK_WRAP - 5 * FRAME_TICKS
+        path = self.write_segment("000.ts", start_pts=start, frames=10)
+
+        timing = backend.read_ts_timing(path)
+
+        self.assertEqual(timing[("pcr", VIDEO_PID)], (start, 4 * FRAME_TICKS))
+        self.assertEqual(timing[("pts", VIDEO_PID)], (start, 4 * FRAME_TICKS))
+
+    def test_fast_path_concatenates_matching_consecutive_segments(self):
+        segments = self.consecutive_segments(3, start_pts=backend.TS_CLOCK_WRAP - 15 * FRAME_TICKS)
+        output = os.path.join(self.dir, "out.ts")
+
+        self.assertTrue(backend.concat_ts_fast(segments, output, say=lambda _message: None))
+
+        expected = b"".join(open(path, "rb").read() for path in segments)
+        with open(output, "rb") as f:
+            self.assertEqual(f.read(), expected)
+
+    def test_mp4_output_pipes_joined_stream_into_ffmpeg(self):
+        segments = self.consecutive_segments(3)
+        output = os.path.join(self.dir, "out.mp4")
+        commands = []
+        real_popen = subprocess.Popen
+
+        def fake_popen(cmd, **kwargs):
+            commands.append(cmd)
+            return real_popen([sys.executable, "-c", FAKE_FFMPEG, *cmd[1:]], **kwargs)
+
+        with patch.object(backend.subprocess, "Popen", side_effect=fake_popen):
+            self.assertTrue(backend.concat_ts_fast(segments, output, say=lambda _message: None))
+
+        self.assertEqual(commands[0][:5], ["ffmpeg", "-f", "mpegts", "-i", "pipe:0"])
+        expected = b"".join(open(path, "rb").read() for path in segments)
+        with open(output, "rb") as f:
+            self.assertEqual(f.read(), expected)
+        # 不落临时的拼接文件
+        self.assertEqual(sorted(os.listdir(self.dir)), sorted([os.path.basename(p) for p in segments] + ["out.mp4"]))
+
+    def test_mp4_remux_failure_falls_back(self):
+        segments = self.consecutive_segments(2)
+        messages = []
+        failing = [sys.executable, "-c", "import sys; sys.stderr.write('bad input'); sys.exit(1)"]
+        real_popen = subprocess.Popen
+
+        with patch.object(backend.subprocess, "Popen", side_effect=lambda cmd, **kwargs: real_popen(failing, **kwargs)):
+            merged = backend.concat_ts_fast(segments, os.path.join(self.dir, "out.mp4"), say=messages.append)
+
+        self.assertFalse(merged)
+        self.assertEqual(messages[-1], "错误信息: bad input")
+
+    def test_fast_path_rejects_layout_mismatch(self):
+        segments = self.consecutive_segments(2)
+        self.write_segment("001.ts", streams=((VIDEO_PID, 0x24), (0x101, 0x0F)), start_pts=10 * FRAME_TICKS)
+        messages = []
+
+        with patch.object(backend.subprocess, "Popen") as popen:
+            merged = backend.concat_ts_fast(segments, os.path.join(self.dir, "out.mp4"), say=messages.append)
+
+        self.assertFalse(merged)
+        popen.assert_not_called()
+        self.assertIn("PID/流类型不一致", messages[-1])
+
+    def test_fast_path_rejects_misaligned_segment(self):
+        segments = self.consecutive_segments(2)
+        with open(segments[1], "ab") as f:
+            f.write(b"\xff" * 10)
+
+        self.assertFalse(backend.concat_ts_fast(segments, os.path.join(self.dir, "out.ts"), say=lambda _message: None))
+
+    def test_fast_path_rejects_timestamp_reset(self):
+        segments = [self.write_segment(f"{i:03d}.ts", start_pts=0) for i in range(2)]
+        messages = []
+
+        self.assertFalse(backend.concat_ts_fast(segments, os.path.join(self.dir, "out.ts"), say=messages.append))
+        self.assertIn("时间戳不连续", messages[-1])
+
+    def test_fast_path_rejects_missing_segment(self):
+        segments = self.consecutive_segments(3, frames=50)  # 每段2秒
+        del segments[1]
+
+        self.assertFalse(backend.concat_ts_fast(segments, os.path.join(self.dir, "out.ts"), say=lambda _message: None))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,118 @@
+"""
+在同一批音视频上对比各推理后端的速度与内存：
+
+    cd whisper_it
+    python -m benchmarks.engine_benchmark clip1.mp4 clip2.mp4 --engines openai faster
+
+每个引擎在独立子进程里运行，内存峰值互不干扰。RTF = 转写耗时 / 音频时长，越小越快。
+不写字幕文件。
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from multiprocessing import Process, Queue
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from engines.engine_factory import ENGINES, create_engine  # noqa: E402
+
+
+def get_media_duration(media_path):
+    cmd = ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=noprint_wrappers=1:nokey=1", media_path]
+    output = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT).stdout.decode("utf-8")
+    match = re.search(r"(\d+(?:\.\d+)?)", output)
+    if not match:
+        raise UserWarning(f"无法正确获取时长:\n{output}")
+    return float(match.group(1))
+
+
+def peak_rss_mb():
+    try:
+        import resource
+
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 / (1024 if sys.platform == "darwin" else 1), 1)
+    except ImportError:
+        pass
+    try:
+        import psutil
+
+        memory_info = psutil.Process().memory_info()
+        return round(getattr(memory_info, "peak_wset", memory_info.rss) / 1024 / 1024, 1)
+    except ImportError:
+        return None
+
+
+def gpu_peak_mb():
+    # 只能统计经过PyTorch分配器的显存；faster-whisper(CTranslate2)的显存不在其中，需另看nvidia-smi
+    try:
+        import torch
+
+        if torch.cuda.is_available():
+            return round(torch.cuda.max_memory_allocated() / 1024 / 1024, 1)
+    except ImportError:
+        pass
+    return None
+
+
+def run_engine(engine_name, media_paths, language, result_queue):
+    try:
+        b_time = time.perf_counter()
+        w = create_engine(engine_name)
+        load_time = time.perf_counter() - b_time
+        clips = []
+        for media_path in media_paths:
+            duration = get_media_duration(media_path)
+            b_time = time.perf_counter()
+            w.transcribe(media_path, language=language, write_txt=False, write_srt=False)
+            elapsed = time.perf_counter() - b_time
+            clips.append({"media_path": media_path, "duration": duration, "elapsed": elapsed, "rtf": elapsed / duration})
+            print(f"[{engine_name}] {os.path.basename(media_path)}：RTF={elapsed / duration:.3f}")
+        result_queue.put(
+            {
+                "engine": engine_name,
+                "load_time": load_time,
+                "clips": clips,
+                "rtf": sum(i["elapsed"] for i in clips) / sum(i["duration"] for i in clips),
+                "peak_rss_mb": peak_rss_mb(),
+                "gpu_peak_mb": gpu_peak_mb(),
+            }
+        )
+    except Exception as e:
+        result_queue.put({"engine": engine_name, "error": repr(e)})
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="对比各推理引擎的RTF与内存占用")
+    parser.add_argument("media_paths", nargs="+", help="用于测试的音视频")
+    parser.add_argument("--engines", nargs="+", default=list(ENGINES), choices=list(ENGINES))
+    parser.add_argument("--language", default=None, help="指定语言，避免语言检测影响计时")
+    parser.add_argument("--json", dest="json_path", default=None, help="把完整结果写入JSON文件")
+    args = parser.parse_args(argv)
+
+    media_paths = [os.path.abspath(i) for i in args.media_paths]
+    results = []
+    for engine_name in args.engines:
+        result_queue = Queue()
+        p = Process(target=run_engine, args=(engine_name, media_paths, args.language, result_queue))
+        p.start()
+        results.append(result_queue.get())
+        p.join()
+
+    print(f"{'引擎':<8}{'加载(s)':>10}{'RTF':>10}{'峰值内存(MB)':>16}{'显存(MB)':>12}")
+    for r in results:
+        if "error" in r:
+            print(f"{r['engine']:<8}  失败：{r['error']}")
+            continue
+        print(f"{r['engine']:<8}{r['load_time']:>10.1f}{r['rtf']:>10.3f}{str(r['peak_rss_mb']):>16}{str(r['gpu_peak_mb']):>12}")
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,19 @@
+import json
 import os
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
 
-from engines.openai_whisper import OpenAIWhisper
+from engines.engine_factory import create_engine
+from utils.audio_util import SAMPLING_RATE, load_audio_window, probe_duration
 from utils.file_util import change_ext
 
+LANG_INDEX_NAME = "lang_index.json"
+
 
 class MultiLangDispatcher:
-    def __init__(self, folder_path) -> None:
+    def __init__(self, folder_path, engine="openai", **engine_kwargs) -> None:
         self.folder_path = os.path.abspath(folder_path)
-        self.w = OpenAIWhisper()
+        self.w = create_engine(engine, **engine_kwargs)
 
     def get_files(self):
         self.files = []
@@ -21,4 +27,86 @@ class MultiLangDispatcher:
             with open(change_ext(media_path, ".txt", postfix="lang_result"), "w", encoding="utf-8") as f:
                 f.write(str(lang_result))
 
-    
\ No newline at end of file
+    @staticmethod
+    def _sample_starts(duration, samples_per_file, window_seconds):
+        if duration <= window_seconds:
+            return [0.0]
+        # 在整个时长上均匀取样，避开片头片尾
+        step = duration / samples_per_file
+        return [min(step * (i + 0.5), duration - window_seconds) for i in range(samples_per_file)]
+
+    def _decode_samples(self, media_path, samples_per_file, window_seconds):
+        try:
+            duration = probe_duration(media_path)
+            windows = [load_audio_window(media_path, start, window_seconds) for start in self._sample_starts(duration, samples_per_file, window_seconds)]
+            return media_path, duration, [w for w in windows if len(w) >= SAMPLING_RATE], None
+        except Exception as e:
+            return media_path, 0.0, [], repr(e)
+
+    def triage(self, samples_per_file=3, window_seconds=30, batch_size=32, decode_workers=None, index_path=None):
+        """
+        快速分拣：每个文件只抽samples_per_file个窗口，解码由多个ffmpeg进程并行完成，
+        多个文件的窗口拼成一批送入模型，结果汇总写入一个JSON索引，可用load_lang_index读取。
+        """
+        decode_workers = decode_workers or os.cpu_count() or 1
+        index_path = index_path or os.path.join(self.folder_path, LANG_INDEX_NAME)
+        media_paths = [f for f in self.files if os.path.isfile(f) and os.path.splitext(f)[1].lower() not in (".txt", ".srt", ".json")]
+        votes = defaultdict(lambda: defaultdict(int))
+        prob_sums = defaultdict(float)
+        index = {}
+        pending_windows, pending_owners = [], []
+
+        def flush():
+            if not pending_windows:
+                return
+            for media_path, (lang, prob) in zip(pending_owners, self.w.detect_language_windows(pending_windows)):
+                votes[media_path][lang] += 1
+                prob_sums[media_path] += prob
+            pending_windows.clear()
+            pending_owners.clear()
+
+        with ThreadPoolExecutor(decode_workers) as executor:
+            # 只保留有限个在途的解码任务，避免几千个文件的音频同时堆在内存里
+            in_flight = deque()
+            paths = iter(media_paths)
+            for media_path in paths:
+                in_flight.append(executor.submit(self._decode_samples, media_path, samples_per_file, window_seconds))
+                if len(in_flight) >= decode_workers * 2:
+                    break
+            done = 0
+            while in_flight:
+                media_path, duration, windows, error = in_flight.popleft().result()
+                next_path = next(paths, None)
+                if next_path is not None:
+                    in_flight.append(executor.submit(self._decode_samples, next_path, samples_per_file, window_seconds))
+                index[media_path] = {"duration": round(duration, 2), "error": error}
+                pending_windows.extend(windows)
+                pending_owners.extend([media_path] * len(windows))
+                if len(pending_windows) >= batch_size:
+                    flush()
+                done += 1
+                print(f"[{done}/{len(media_paths)}] 已解码：{os.path.basename(media_path)}")
+            flush()
+
+        for media_path, entry in index.items():
+            file_votes = votes.get(media_path, {})
+            sample_count = sum(file_votes.values())
+            entry["language"] = max(file_votes, key=file_votes.get) if file_votes else None  # type: ignore
+            entry["votes"] = dict(file_votes)
+            entry["mean_prob"] = round(prob_sums[media_path] / sample_count, 4) if sample_count else 0.0
+        result = {os.path.relpath(media_path, self.folder_path): index[media_path] for media_path in media_paths}
+        temp_path = index_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, index_path)
+        print(f"分拣完成，共{len(result)}个文件，索引已写入：{index_path}")
+        return result
+
+
+def load_lang_index(folder_or_index_path):
+    """读取triage生成的索引，返回{相对路径: {"language", "votes", "mean_prob", "duration", "error"}}。"""
+    index_path = folder_or_index_path
+    if os.path.isdir(index_path):
+        index_path = os.path.join(index_path, LANG_INDEX_NAME)
+    with open(index_path, "r", encoding="utf-8") as f:
+        return json.load(f)
@@ -0,0 +1,73 @@
+import os
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from typing import List, Optional, Tuple
+
+from utils.writer_util import write_srt
+
+SAMPLING_RATE = 16000
+WINDOW_SAMPLES = 30 * SAMPLING_RATE
+
+
+class BaseEngine(ABC):
+    """
+    各推理后端的公共接口。transcribe返回openai-whisper格式的结果：
+    {"text": str, "language": str, "segments": [{"id", "start", "end", "text"}, ...]}，
+    因此写字幕、后处理函数都不需要关心具体后端。
+    """
+
+    @abstractmethod
+    def transcribe(
+        self,
+        media_path,
+        verbose: Optional[bool] = False,
+        language: Optional[str] = None,
+        write_txt: bool = True,
+        write_srt: bool = True,
+    ) -> dict:
+        pass
+
+    @abstractmethod
+    def load_audio(self, media_path):
+        """解码为16kHz单声道float32的numpy数组。"""
+
+    @abstractmethod
+    def detect_language_windows(self, windows) -> List[Tuple[str, float]]:
+        """一批不超过30秒的音频片段一次送入模型，返回每段的(语言, 概率)。"""
+
+    def detect_language(self, media_path) -> str:
+        audio = self.load_audio(os.path.abspath(media_path))
+        return self.detect_language_windows([audio[:WINDOW_SAMPLES]])[0][0]
+
+    def detect_language_by_longer_material(self, media_path, batch_size=8, min_windows=3, confidence=0.8) -> defaultdict:
+        """
+        整个文件只解码一次，在内存里切成30秒窗口，按batch_size批量检测；
+        领先的语言已不可能被反超，或检测了至少min_windows个窗口且占比达到confidence时提前结束。
+        """
+        audio = self.load_audio(os.path.abspath(media_path))
+        starts = [i for i in range(0, len(audio), WINDOW_SAMPLES) if len(audio) - i >= SAMPLING_RATE]
+        lang_results = defaultdict(int)
+        done = 0
+        for batch_start in range(0, len(starts), batch_size):
+            batch = starts[batch_start : batch_start + batch_size]
+            for start, (lang_result, prob) in zip(batch, self.detect_language_windows([audio[i : i + WINDOW_SAMPLES] for i in batch])):
+                lang_results[lang_result] += 1
+                print(f"语言检测结果：{lang_result}（{prob:.2f}），时间：{start // SAMPLING_RATE} - {min(len(audio), start + WINDOW_SAMPLES) // SAMPLING_RATE}")
+            done += len(batch)
+            print(f"当前所有结果：{dict(lang_results)}")
+            ranked = sorted((v for k, v in lang_results.items() if k != "nn"), reverse=True) + [0, 0]
+            if ranked[0] - ranked[1] > len(starts) - done or (done >= min_windows and ranked[0] / done >= confidence):
+                if done < len(starts):
+                    print(f"结果已足够确定，跳过剩余{len(starts) - done}个窗口")
+                break
+
+        lang_results.pop("nn", None)
+        return lang_results
+
+    def write_srt_file(self, result, media_path):
+        write_srt(result, media_path)
+
+    def write_txt_file(self, result, media_path):
+        with open(os.path.splitext(media_path)[0] + ".txt", "a", encoding="utf-8") as f:
+            for segment in result["segments"]:
+                f.write(segment["text"].strip() + "\n")
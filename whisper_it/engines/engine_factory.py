@@ -0,0 +1,16 @@
+import importlib
+
+from engines.base_engine import BaseEngine
+
+# 按需导入，只用faster-whisper时不需要安装openai-whisper，反之亦然
+ENGINES = {
+    "openai": ("engines.openai_whisper", "OpenAIWhisper"),
+    "faster": ("engines.faster_whisper", "FasterWhisper"),
+}
+
+
+def create_engine(name="openai", **kwargs) -> BaseEngine:
+    if name not in ENGINES:
+        raise ValueError(f"未知的引擎：{name}，可选：{list(ENGINES)}")
+    module_name, class_name = ENGINES[name]
+    return getattr(importlib.import_module(module_name), class_name)(**kwargs)
@@ -1,16 +1,58 @@
+import os
+from typing import Optional
+
+import numpy as np
 from faster_whisper import WhisperModel
+from faster_whisper.audio import decode_audio
+
+from engines.base_engine import BaseEngine
 
 
-class FasterWhisper:
-    def __init__(self, model_size="large-v2") -> None:
-        self.model = WhisperModel(model_size, device="cuda", compute_type="float16")
+class FasterWhisper(BaseEngine):
+    def __init__(self, model_size="large-v2", device="cuda", compute_type="float16") -> None:
+        self.model = WhisperModel(model_size, device=device, compute_type=compute_type)
 
-    def transcribe(self, media_path, word_timestamps=False):
-        segments, info = self.model.transcribe(media_path, beam_size=5, word_timestamps=word_timestamps)
+    def transcribe(
+        self,
+        media_path,
+        verbose: Optional[bool] = False,
+        language: Optional[str] = None,
+        write_txt: bool = True,
+        write_srt: bool = True,
+        word_timestamps=False,
+    ):
+        media_path = os.path.abspath(media_path)
+        segments, info = self.model.transcribe(media_path, beam_size=5, language=language, word_timestamps=word_timestamps)
         print("Detected language '%s' with probability %f" % (info.language, info.language_probability))
-        return segments, info
+        result_segments = []
+        for segment in segments:
+            if verbose:
+                print(f"[{segment.start:.2f} --> {segment.end:.2f}] {segment.text}")
+            result_segments.append({"id": segment.id, "start": segment.start, "end": segment.end, "text": segment.text})
+        result = {"text": "".join(i["text"] for i in result_segments), "segments": result_segments, "language": info.language}
+        if write_srt:
+            self.write_srt_file(result, media_path)
+        if write_txt:
+            self.write_txt_file(result, media_path)
+        return result
+
+    def load_audio(self, media_path):
+        return decode_audio(media_path, sampling_rate=self.model.feature_extractor.sampling_rate)
+
+    def detect_language_windows(self, windows):
+        nb_max_frames = self.model.feature_extractor.nb_max_frames
+        features = []
+        for window in windows:
+            feature = self.model.feature_extractor(window)[:, :nb_max_frames]
+            features.append(np.pad(feature, ((0, 0), (0, nb_max_frames - feature.shape[-1]))))
+        encoder_output = self.model.encode(np.stack(features))
+        results = []
+        for window_probs in self.model.model.detect_language(encoder_output):
+            token, prob = max(window_probs, key=lambda x: x[-1])
+            results.append((token.replace("<|", "").replace("|>", ""), prob))
+        return results
+
 
 if __name__ == "__main__":
     w = FasterWhisper()
-    segments, info = w.transcribe("test.mp3")
-    
\ No newline at end of file
+    result = w.transcribe("test.mp3")
@@ -1,15 +1,13 @@
 import os
-from collections import defaultdict
 from typing import Optional
 
+import torch
 import whisper
-from moviepy.editor import VideoFileClip
-from moviepy.video.io.ffmpeg_tools import ffmpeg_extract_subclip
 
-from utils.writer_util import write_srt
+from engines.base_engine import BaseEngine
 
 
-class OpenAIWhisper:
+class OpenAIWhisper(BaseEngine):
     def __init__(self, model_name="large") -> None:
         self.model = whisper.load_model(model_name)
 
@@ -19,41 +17,28 @@ class OpenAIWhisper:
         verbose: Optional[bool] = False,
         language: Optional[str] = None,
         write_txt: bool = True,
+        write_srt: bool = True,
     ):
         media_path = os.path.abspath(media_path)
-        media_path_without_ext = os.path.splitext(media_path)[0]
         result = self.model.transcribe(media_path, verbose=verbose, language=language)
-        write_srt(result, media_path)
+        if write_srt:
+            self.write_srt_file(result, media_path)
         if write_txt:
-            with open(media_path_without_ext + ".txt", "a", encoding="utf-8") as f:
-                for segment in result["segments"]:
-                    f.write(segment["text"].strip() + "\n")  # type: ignore
+            self.write_txt_file(result, media_path)
         return result
 
-    def detect_language(self, media_path):
-        media_path = os.path.abspath(media_path)
-        audio = whisper.load_audio(media_path)
-        audio = whisper.pad_or_trim(audio)
-        mel = whisper.log_mel_spectrogram(audio).to(self.model.device)
-        _, probs = self.model.detect_language(mel)
-        real_probs = probs[0] if isinstance(probs, list) else probs
-        return max(probs, key=real_probs.get)  # type: ignore
+    def load_audio(self, media_path):
+        return whisper.load_audio(media_path)
 
-    def detect_language_by_longer_material(self, media_path):
-        lang_results = defaultdict(int)
-        with VideoFileClip(media_path) as clip:
-            duration = clip.duration
-        start_time = 0
-        while start_time < duration:
-            end_time = min(clip.duration, start_time + 30)
-            sub_media_file_path = f"_{start_time}_{end_time}".join(os.path.splitext(media_path))
-            ffmpeg_extract_subclip(media_path, start_time, end_time, targetname=sub_media_file_path)
-            lang_result = self.detect_language(sub_media_file_path)
-            lang_results[lang_result] += 1
-            print(f"语言检测结果：{lang_result}，时间：{start_time} - {end_time}")
-            print(f"当前所有结果：{lang_results}")
-            start_time += 30
-            os.remove(sub_media_file_path)
-
-        lang_results.pop("nn", None)
-        return lang_results
+    def detect_language_windows(self, windows):
+        mel = torch.stack(
+            [whisper.log_mel_spectrogram(whisper.pad_or_trim(window), n_mels=self.model.dims.n_mels) for window in windows]
+        ).to(self.model.device)
+        _, probs = self.model.detect_language(mel)
+        if isinstance(probs, dict):
+            probs = [probs]
+        results = []
+        for window_probs in probs:
+            lang = max(window_probs, key=window_probs.get)  # type: ignore
+            results.append((lang, window_probs[lang]))
+        return results
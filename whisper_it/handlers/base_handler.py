@@ -1,40 +1,123 @@
 import os
 import shutil
+import threading
+import time
 import traceback
 from abc import ABC, abstractclassmethod
-from multiprocessing import Process, Queue
+from multiprocessing import Process
 
 import dill
 
-from engines.openai_whisper import OpenAIWhisper
+from engines.base_engine import BaseEngine
+from engines.engine_factory import create_engine
 from models.whisper_task import WhisperTask
+from stores.task_store import TaskStore
 
 
 class BaseHandler(ABC):
-    def __init__(self) -> None:
-        self.queue = Queue()
-        self._launch_worker_process()
-
-    def _launch_worker_process(self):
-        self.whisper_process = Process(target=self._launch_worker_func)
-        self.whisper_process.start()
-
-    def _launch_worker_func(self):
-        print("开始加载模型...")
-        w = OpenAIWhisper()
-        print("模型加载完毕，等待接收任务...")
+    # 只属于主进程的属性（线程、进程句柄），启动子进程时不参与pickle
+    _parent_only_attrs = ("supervisor", "workers", "closing")
+
+    def __init__(
+        self,
+        worker_count=1,
+        max_queue_size=0,
+        max_task_crashes=1,
+        task_db_path=None,
+        lease_seconds=6 * 3600,
+        poll_interval=1.0,
+        engine="openai",
+        engine_kwargs=None,
+        keep_failed=1000,
+    ) -> None:
+        """
+        worker_count: 工作进程数，每个进程各自加载一份模型
+        max_queue_size: 待处理任务上限，0表示不限；满了以后add_task按block参数阻塞或拒绝
+        max_task_crashes: 任务导致工作进程崩溃（或租约超时）的次数超过该值后不再重试，按错误文件处理
+        task_db_path: 任务库路径，默认为whisper_it目录下的<handler类名>_tasks.sqlite3；重启后未完成的任务会继续处理
+        lease_seconds: 单个任务的租约时长，超时视为卡死，重启对应工作进程并重新分发任务；
+                       上次运行崩溃时没做完的任务也要等租约过期才会重新分发（任务库可能被其他实例共用，不能直接抢回）
+        engine: 推理后端，"openai"或"faster"，engine_kwargs原样传给引擎构造函数
+        keep_failed: 任务库里最多保留多少条失败记录（含错误信息），启动时清理更早的
+        """
+        if task_db_path is None:
+            task_db_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), f"{type(self).__name__.lower()}_tasks.sqlite3")
+        self.worker_count = worker_count
+        self.engine = engine
+        self.engine_kwargs = engine_kwargs or {}
+        self.max_queue_size = max_queue_size
+        self.poll_interval = poll_interval
+        self.store = TaskStore(task_db_path, lease_seconds=lease_seconds, max_attempts=max_task_crashes + 1)
+        released = self.store.release_expired()
+        purged = self.store.purge_failed(keep_latest=keep_failed)
+        if released or purged:
+            print(f"任务库：放回租约过期的任务{released}个，清理失败记录{purged}条")
+        print(f"任务库：{task_db_path}，待处理任务：{self.store.pending_count()}")
+        self.workers = {}
+        self.closing = threading.Event()
+        for worker_index in range(worker_count):
+            self._launch_worker_process(worker_index)
+        self.supervisor = threading.Thread(target=self._supervise, daemon=True)
+        self.supervisor.start()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for attr in self._parent_only_attrs:
+            state.pop(attr, None)
+        return state
+
+    def _launch_worker_process(self, worker_index):
+        whisper_process = Process(target=self._launch_worker_func, args=(worker_index,))
+        whisper_process.start()
+        self.workers[worker_index] = whisper_process
+
+    def _launch_worker_func(self, worker_index):
+        print(f"[进程{worker_index}] 开始加载模型（{self.engine}）...")
+        w = create_engine(self.engine, **self.engine_kwargs)
+        print(f"[进程{worker_index}] 模型加载完毕，等待接收任务...")
+        worker_id = os.getpid()
         while True:
-            task = self.queue.get()
-            print(f"开始处理任务：{task.media_path}")
+            claimed = self.store.claim(worker_id)
+            if claimed is None:
+                time.sleep(self.poll_interval)
+                continue
+            task_id, task = claimed
+            print(f"[进程{worker_index}] 开始处理任务：{task.media_path}")
             try:
                 self.process_task(task, w)
+                self.store.ack(task_id)
             except:
                 print("处理任务失败，跳过...")
                 traceback.print_exc()
+                self.store.fail(task_id, traceback.format_exc())
                 self._handle_error_file(task.media_path)
 
+    def _supervise(self):
+        while not self.closing.wait(self.poll_interval):
+            # 租约过期说明任务卡住了，结束对应进程，由下面的逻辑重启并放回任务
+            expired = set(self.store.expired_workers())
+            for worker_index, whisper_process in list(self.workers.items()):
+                if str(whisper_process.pid) in expired and whisper_process.is_alive():
+                    print(f"工作进程{worker_index}的任务租约已过期，结束该进程...")
+                    whisper_process.terminate()
+                    whisper_process.join()
+            # 其他实例（已经不在或进程卡死）留下的过期租约放回队列；自己的进程按上面的流程先结束再放回
+            self.store.release_expired(exclude_workers=[p.pid for p in self.workers.values() if p.is_alive()])
+            for worker_index, whisper_process in list(self.workers.items()):
+                if whisper_process.is_alive() or self.closing.is_set():
+                    continue
+                print(f"工作进程{worker_index}意外退出（exitcode={whisper_process.exitcode}），正在重启...")
+                self.store.release_worker(whisper_process.pid)
+                self._launch_worker_process(worker_index)
+            for media_path in self.store.fail_exhausted():
+                print(f"任务多次导致进程崩溃，放弃：{media_path}")
+                try:
+                    self._handle_error_file(media_path)
+                except OSError:
+                    traceback.print_exc()
+
     @abstractclassmethod
-    def process_task(self, task: WhisperTask, w: OpenAIWhisper):
+    def process_task(self, task: WhisperTask, w: BaseEngine):
         pass
 
     def _handle_error_file(self, file_path):
@@ -43,14 +126,27 @@ class BaseHandler(ABC):
             os.mkdir(error_folder)
         shutil.move(file_path, error_folder)
 
-    def add_task(self, task: WhisperTask):
+    def add_task(self, task: WhisperTask, block=True, timeout=None):
+        """待处理任务满时block=True阻塞等待（可设timeout），block=False或超时则拒绝并返回False。"""
         print(f"添加任务：{os.path.basename(task.media_path)}")
         if str(task.media_path).lower().split(".")[-1] in ["txt", "srt"]:
             print("  文件格式不合法，跳过!")
-            return
-        self.queue.put(task)
+            return False
+        if self.max_queue_size:
+            deadline = None if timeout is None else time.monotonic() + timeout
+            while self.store.pending_count() >= self.max_queue_size:
+                if not block or (deadline is not None and time.monotonic() >= deadline):
+                    print("  等待队列已满，拒绝任务!")
+                    return False
+                time.sleep(self.poll_interval)
+        self.store.add(task)
+        return True
 
     def close(self):
-        self.whisper_process.terminate()
-        self.whisper_process.close()
+        self.closing.set()
+        self.supervisor.join()
+        for whisper_process in self.workers.values():
+            whisper_process.terminate()
+            whisper_process.join()
+            whisper_process.close()
         print("模型已关闭！")
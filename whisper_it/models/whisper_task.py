@@ -10,6 +10,7 @@ class WhisperTask:
     verbose: Optional[bool] = False
     target_languages: Optional[List[str]] = None
     post_func: Optional[Callable] = None
+    priority: int = 0  # 越大越先处理
     post_func_bytes: Optional[bytes] = field(init=False)
 
     def __post_init__(self):
@@ -0,0 +1,165 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Optional, Tuple
+
+import dill
+
+from models.whisper_task import WhisperTask
+
+PENDING = "pending"
+CLAIMED = "claimed"
+FAILED = "failed"
+
+
+class TaskStore:
+    """
+    基于SQLite的持久化任务队列，至少一次（at-least-once）语义：
+    claim领取任务并加租约，ack确认完成后删除；进程崩溃的任务由release_worker放回队列，
+    租约过期的任务由调用方结束卡住的进程后同样放回（见expired_workers），其他实例留下的过期任务由release_expired放回。
+    多个实例可以共用一个任务库：重启时只回收租约已过期的任务，不会抢走别的实例正在处理的任务。
+    只保存数据库路径，每个进程各自建立连接，可以直接传给子进程。
+    """
+
+    def __init__(self, db_path, lease_seconds=6 * 3600, max_attempts=2) -> None:
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._conns = {}
+        with self.conn:
+            self.conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS tasks (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    media_path TEXT NOT NULL,
+                    priority INTEGER NOT NULL DEFAULT 0,
+                    payload BLOB NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    worker TEXT,
+                    lease_until REAL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    error TEXT,
+                    created_at REAL NOT NULL
+                )
+                """
+            )
+            self.conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_claim ON tasks (status, priority DESC, id)")
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        # 每个进程、每个线程各用一个连接：fork出来的子进程不能沿用父进程的连接，sqlite3连接也不能跨线程
+        key = (os.getpid(), threading.get_ident())
+        conn = self._conns.get(key)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._conns[key] = conn
+        return conn
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_conns"] = {}
+        return state
+
+    def _transaction(self):
+        # BEGIN IMMEDIATE：多个工作进程同时claim时只有一个能拿到写锁，避免重复领取
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def add(self, task: WhisperTask) -> int:
+        cursor = self.conn.execute(
+            "INSERT INTO tasks (media_path, priority, payload, created_at) VALUES (?, ?, ?, ?)",
+            (task.media_path, task.priority, dill.dumps(task), time.time()),
+        )
+        return cursor.lastrowid  # type: ignore
+
+    def pending_count(self) -> int:
+        """还能被领取的任务数，重试次数已用尽、等待fail_exhausted处理的不算。"""
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM tasks WHERE status = ? AND attempts < ?", (PENDING, self.max_attempts)
+        ).fetchone()[0]
+
+    def claim(self, worker) -> Optional[Tuple[int, WhisperTask]]:
+        conn = self._transaction()
+        try:
+            now = time.time()
+            row = conn.execute(
+                """
+                SELECT id, payload FROM tasks
+                WHERE status = ? AND attempts < ?
+                ORDER BY priority DESC, id LIMIT 1
+                """,
+                (PENDING, self.max_attempts),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE tasks SET status = ?, worker = ?, lease_until = ?, attempts = attempts + 1 WHERE id = ?",
+                (CLAIMED, str(worker), now + self.lease_seconds, row[0]),
+            )
+            conn.execute("COMMIT")
+        except:
+            conn.execute("ROLLBACK")
+            raise
+        return row[0], dill.loads(row[1])
+
+    def ack(self, task_id):
+        self.conn.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
+
+    def fail(self, task_id, error=""):
+        self.conn.execute("UPDATE tasks SET status = ?, worker = NULL, error = ? WHERE id = ?", (FAILED, error, task_id))
+
+    def release_worker(self, worker):
+        """工作进程退出后，把它手上的任务放回队列（attempts已在claim时计数）。"""
+        self.conn.execute(
+            "UPDATE tasks SET status = ?, worker = NULL, lease_until = NULL WHERE status = ? AND worker = ?",
+            (PENDING, CLAIMED, str(worker)),
+        )
+
+    def release_expired(self, exclude_workers=()) -> int:
+        """
+        租约已过期的任务恢复为待处理（上次运行崩溃、或其他实例的进程卡死留下的），返回放回的任务数。
+        exclude_workers: 调用方自己的工作进程，它们的过期任务要先结束进程再用release_worker放回
+        """
+        excluded = [str(worker) for worker in exclude_workers]
+        cursor = self.conn.execute(
+            f"""
+            UPDATE tasks SET status = ?, worker = NULL, lease_until = NULL
+            WHERE status = ? AND lease_until < ? AND worker NOT IN ({", ".join("?" * len(excluded))})
+            """,
+            (PENDING, CLAIMED, time.time(), *excluded),
+        )
+        return cursor.rowcount
+
+    def expired_workers(self) -> List[str]:
+        rows = self.conn.execute(
+            "SELECT DISTINCT worker FROM tasks WHERE status = ? AND lease_until < ?", (CLAIMED, time.time())
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def fail_exhausted(self) -> List[str]:
+        """重试次数用尽的任务标记为失败，返回它们的文件路径。"""
+        conn = self._transaction()
+        try:
+            rows = conn.execute(
+                "SELECT id, media_path FROM tasks WHERE status = ? AND attempts >= ?", (PENDING, self.max_attempts)
+            ).fetchall()
+            conn.executemany(
+                "UPDATE tasks SET status = ?, error = ? WHERE id = ?", [(FAILED, "too many attempts", row[0]) for row in rows]
+            )
+            conn.execute("COMMIT")
+        except:
+            conn.execute("ROLLBACK")
+            raise
+        return [row[1] for row in rows]
+
+    def purge_failed(self, keep_latest=0) -> int:
+        """删除失败的任务记录，只保留最近keep_latest条（用于查看错误信息），返回删除的条数。"""
+        cursor = self.conn.execute(
+            "DELETE FROM tasks WHERE status = ? AND id NOT IN (SELECT id FROM tasks WHERE status = ? ORDER BY id DESC LIMIT ?)",
+            (FAILED, FAILED, keep_latest),
+        )
+        return cursor.rowcount
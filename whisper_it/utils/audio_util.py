@@ -0,0 +1,22 @@
+import subprocess
+
+import numpy as np
+
+SAMPLING_RATE = 16000
+
+
+def probe_duration(media_path) -> float:
+    cmd = ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "default=noprint_wrappers=1:nokey=1", media_path]
+    output = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout.decode("utf-8").strip()
+    return float(output) if output and output != "N/A" else 0.0
+
+
+def load_audio_window(media_path, start: float, duration: float) -> np.ndarray:
+    """只解码[start, start+duration)这一段，返回16kHz单声道float32数组。"""
+    cmd = [
+        "ffmpeg", "-nostdin", "-loglevel", "error",
+        "-ss", str(start), "-t", str(duration), "-i", media_path,
+        "-map", "a:0", "-ac", "1", "-ar", str(SAMPLING_RATE), "-f", "s16le", "-",
+    ]  # fmt: skip
+    output = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout
+    return np.frombuffer(output, np.int16).astype(np.float32) / 32768.0
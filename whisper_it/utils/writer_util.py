@@ -1,6 +1,11 @@
-from whisper.utils import WriteSRT, WriteTXT
 import os
 
+try:
+    from whisper.utils import WriteSRT, WriteTXT
+except ImportError:
+    # 只装了faster-whisper时没有openai-whisper，SRT/TXT用下面的简单实现
+    WriteSRT = WriteTXT = None
+
 
 DEFAULT_WRITER_CONFIG = {
     "highlight_words": False,
@@ -15,13 +20,32 @@ def _get_paths(output_file_path):
     return output_dir, media_path_without_ext
 
 
+def _format_srt_timestamp(seconds):
+    milliseconds = round(seconds * 1000.0)
+    hours, milliseconds = divmod(milliseconds, 3_600_000)
+    minutes, milliseconds = divmod(milliseconds, 60_000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d},{milliseconds:03d}"
+
+
 def write_srt(result, output_file_path):
     output_dir, media_path_without_ext = _get_paths(output_file_path)
+    if WriteSRT is None:
+        with open(media_path_without_ext + ".srt", "w", encoding="utf-8") as f:
+            for i, segment in enumerate(result["segments"], start=1):
+                text = segment["text"].strip().replace("-->", "->")
+                f.write(f"{i}\n{_format_srt_timestamp(segment['start'])} --> {_format_srt_timestamp(segment['end'])}\n{text}\n\n")
+        return
     writer = WriteSRT(output_dir)
     writer(result, media_path_without_ext, DEFAULT_WRITER_CONFIG)
 
 
 def write_txt(result, output_file_path):
     output_dir, media_path_without_ext = _get_paths(output_file_path)
+    if WriteTXT is None:
+        with open(media_path_without_ext + ".txt", "w", encoding="utf-8") as f:
+            for segment in result["segments"]:
+                f.write(segment["text"].strip() + "\n")
+        return
     writer = WriteTXT(output_dir)
     writer(result, media_path_without_ext, DEFAULT_WRITER_CONFIG)